@@ -0,0 +1,262 @@
+import pandas as pd
+import threading
+from datetime import date, datetime
+
+from almacen import leer_fechas
+
+# --- CONFIGURACIÓN ---
+VENTANA_DIAS = 7             # Sumas "de la semana" (la ventana incluye el día de hoy)
+DIAS_HISTORIAL_RACHA = 366   # Días activos guardados para recalcular rachas si llega un evento atrasado
+
+# Los días se manejan como ordinales (date.toordinal()): restar 1 es "ayer" y agrupar es numérico
+_EPOCA = pd.Timestamp('1970-01-01')
+_ORDINAL_EPOCA = date(1970, 1, 1).toordinal()
+
+
+def normalizar_tipo(tipo):
+    """El bot envía 'estudio' y los CSV traen 'ESTUDIO': se agrupan igual."""
+    return str(tipo).strip().upper()
+
+
+def dias_ordinales(fechas):
+    """Serie de fechas (datetime64) -> día ordinal de cada una, sin pasar por objetos date."""
+    return (fechas.dt.normalize() - _EPOCA).dt.days + _ORDINAL_EPOCA
+
+
+class Agregado:
+    """
+    Totales de un usuario para un tipo de actividad (o para todas, en el agregado general).
+    Todo se actualiza sumando: nunca se recorre el historial de registros.
+    """
+
+    __slots__ = ('xp', 'registros', 'valor', 'con_valor', 'ultima_actividad',
+                 'racha', 'racha_maxima', 'ultimo_dia', 'dias', 'ventana')
+
+    def __init__(self):
+        self.xp = 0
+        self.registros = 0
+        self.valor = 0.0            # Suma de la medida (minutos, horas) de los registros que la traen
+        self.con_valor = 0          # Cuántos registros traen medida (para promedios)
+        self.ultima_actividad = None
+        self.racha = 0              # Días seguidos con actividad, terminando en ultimo_dia
+        self.racha_maxima = 0
+        self.ultimo_dia = None
+        self.dias = set()           # Días con actividad (acotado a DIAS_HISTORIAL_RACHA)
+        self.ventana = {}           # dia -> [xp, registros, valor, con_valor] (acotado a VENTANA_DIAS)
+
+    def sumar(self, dia, fecha, xp, registros, valor, con_valor, hoy):
+        """
+        Suma uno o varios registros del mismo día.
+        dia y hoy son ordinales; fecha es el texto 'YYYY-MM-DD HH:MM:SS' del registro más reciente.
+        """
+        self.xp += xp
+        self.registros += registros
+        self.valor += valor
+        self.con_valor += con_valor
+        if self.ultima_actividad is None or fecha > self.ultima_actividad:
+            self.ultima_actividad = fecha
+
+        # 1. Sumas por día dentro de la ventana
+        if dia > hoy - VENTANA_DIAS:
+            balde = self.ventana.setdefault(dia, [0, 0, 0.0, 0])
+            balde[0] += xp
+            balde[1] += registros
+            balde[2] += valor
+            balde[3] += con_valor
+            self._expirar_ventana(hoy)
+
+        # 2. Rachas: un día nuevo al final extiende o reinicia la racha; uno atrasado obliga a recalcular
+        nuevo = dia not in self.dias
+        self.dias.add(dia)
+        if self.ultimo_dia is None or dia > self.ultimo_dia:
+            self.racha = self.racha + 1 if self.ultimo_dia == dia - 1 else 1
+            self.ultimo_dia = dia
+            self.racha_maxima = max(self.racha_maxima, self.racha)
+            limite = dia - DIAS_HISTORIAL_RACHA
+            if min(self.dias) < limite:
+                self.dias = {d for d in self.dias if d >= limite}
+        elif nuevo:
+            self._recalcular_rachas()
+
+    def _expirar_ventana(self, hoy):
+        for dia in [d for d in self.ventana if d <= hoy - VENTANA_DIAS]:
+            del self.ventana[dia]
+
+    def _recalcular_rachas(self):
+        racha = 0
+        anterior = None
+        for dia in sorted(self.dias):
+            racha = racha + 1 if anterior == dia - 1 else 1
+            self.racha_maxima = max(self.racha_maxima, racha)
+            anterior = dia
+        self.racha = racha
+
+    def resumen(self, hoy):
+        self._expirar_ventana(hoy)
+        xp_semana = sum(b[0] for b in self.ventana.values())
+        registros_semana = sum(b[1] for b in self.ventana.values())
+        valor_semana = sum(b[2] for b in self.ventana.values())
+        con_valor_semana = sum(b[3] for b in self.ventana.values())
+        # La racha sigue vigente si hubo actividad hoy o ayer
+        vigente = self.ultimo_dia is not None and self.ultimo_dia >= hoy - 1
+        return {
+            "xp": int(self.xp),
+            "registros": int(self.registros),
+            "valor": round(self.valor, 2),
+            "ultima_actividad": self.ultima_actividad,
+            "racha_dias": self.racha if vigente else 0,
+            "racha_maxima": self.racha_maxima,
+            "xp_semana": int(xp_semana),
+            "registros_semana": int(registros_semana),
+            "valor_semana": round(valor_semana, 2),
+            "promedio_valor_semana": round(valor_semana / con_valor_semana, 2) if con_valor_semana else None,
+        }
+
+
+class AgregadosUsuarios:
+    """
+    Tabla de agregados por usuario mantenida en memoria: XP y registros por tipo de
+    actividad, última actividad, rachas de días y sumas de los últimos VENTANA_DIAS días.
+
+    Se actualiza en cada escritura (registrar / registrar_lote) y se reconstruye desde
+    el log con una pasada vectorizada (reconstruir). Consultar un usuario es O(tipos).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usuarios = {}  # telegram_id -> {'total': Agregado, 'por_tipo': {tipo: Agregado}}
+
+    def _de_usuario(self, telegram_id):
+        return self._usuarios.setdefault(telegram_id, {'total': Agregado(), 'por_tipo': {}})
+
+    def registrar(self, telegram_id, tipo_actividad, xp, fecha, valor=None):
+        """Suma una actividad recién registrada. fecha: texto 'YYYY-MM-DD HH:MM:SS'."""
+        dia = datetime.strptime(fecha, '%Y-%m-%d %H:%M:%S').toordinal()
+        con_valor = 0 if valor is None or pd.isna(valor) else 1
+        valor = float(valor) if con_valor else 0.0
+        hoy = date.today().toordinal()
+        with self._lock:
+            usuario = self._de_usuario(telegram_id)
+            tipo = usuario['por_tipo'].setdefault(normalizar_tipo(tipo_actividad), Agregado())
+            for agregado in (usuario['total'], tipo):
+                agregado.sumar(dia, fecha, xp, 1, valor, con_valor, hoy)
+
+    def registrar_lote(self, df_registros):
+        """Suma un lote: se agrupa primero por (usuario, tipo, día) y se suma una vez por grupo."""
+        if df_registros.empty:
+            return
+        grupos = self._agrupar(df_registros)
+        grupos['ultima'] = grupos['ultima'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        hoy = date.today().toordinal()
+        with self._lock:
+            for telegram_id, tipo, dia, xp, registros, valor, con_valor, ultima in grupos.itertuples(index=False, name=None):
+                usuario = self._de_usuario(int(telegram_id))
+                por_tipo = usuario['por_tipo'].setdefault(tipo, Agregado())
+                for agregado in (usuario['total'], por_tipo):
+                    agregado.sumar(dia, ultima, int(xp), int(registros), float(valor), int(con_valor), hoy)
+
+    def reconstruir(self, df_registros):
+        """
+        Recalcula la tabla completa desde el log. Sumas, máximos y rachas se calculan
+        con agrupaciones vectorizadas; después solo se crea un objeto por (usuario, tipo).
+        """
+        hoy = date.today().toordinal()
+        tabla = {}
+        if not df_registros.empty:
+            por_tipo = self._agrupar(df_registros)
+            general = por_tipo.groupby(['telegram_id', 'dia'], as_index=False).agg(
+                xp=('xp', 'sum'), registros=('registros', 'sum'), valor=('valor', 'sum'),
+                con_valor=('con_valor', 'sum'), ultima=('ultima', 'max'),
+            )
+
+            for filas, claves in ((general, ['telegram_id']), (por_tipo, ['telegram_id', 'tipo'])):
+                # 1. Totales y rachas por grupo
+                agregados = {}
+                totales = self._totales(filas, claves)
+                totales['ultima'] = totales['ultima'].dt.strftime('%Y-%m-%d %H:%M:%S')
+                for fila in totales.itertuples(index=False):
+                    agregado = Agregado()
+                    agregado.xp = int(fila.xp)
+                    agregado.registros = int(fila.registros)
+                    agregado.valor = float(fila.valor)
+                    agregado.con_valor = int(fila.con_valor)
+                    agregado.ultima_actividad = fila.ultima
+                    agregado.racha = int(fila.racha)
+                    agregado.racha_maxima = int(fila.racha_maxima)
+                    agregado.ultimo_dia = int(fila.ultimo_dia)
+                    agregados[tuple(getattr(fila, c) for c in claves)] = agregado
+
+                # 2. Días activos recientes (para rachas) y baldes de la ventana
+                recientes = filas[filas['dia'] > filas['dia'].max() - DIAS_HISTORIAL_RACHA]
+                for clave, dia in zip(zip(*(recientes[c].tolist() for c in claves)), recientes['dia'].tolist()):
+                    agregados[clave].dias.add(dia)
+                ventana = filas[filas['dia'] > hoy - VENTANA_DIAS]
+                baldes = zip(*(ventana[c].tolist() for c in ['dia', 'xp', 'registros', 'valor', 'con_valor']))
+                for clave, (dia, xp, registros, valor, con_valor) in zip(zip(*(ventana[c].tolist() for c in claves)), baldes):
+                    agregados[clave].ventana[dia] = [int(xp), int(registros), float(valor), int(con_valor)]
+
+                for clave, agregado in agregados.items():
+                    if len(clave) == 1:
+                        tabla[clave[0]] = {'total': agregado, 'por_tipo': {}}
+                    else:
+                        tabla[clave[0]]['por_tipo'][clave[1]] = agregado
+
+        with self._lock:
+            self._usuarios = tabla
+
+    @staticmethod
+    def _agrupar(df_registros):
+        """Una fila por (usuario, tipo, día) con sumas, conteos y la fecha más reciente."""
+        if 'valor' in df_registros.columns:
+            valores = pd.to_numeric(df_registros['valor'], errors='coerce')
+        else:
+            valores = pd.Series(float('nan'), index=df_registros.index)
+        # Normalizar solo los tipos distintos (son pocos) y no cada fila
+        codigos, tipos = pd.factorize(df_registros['tipo_actividad'].astype(str))
+        df = pd.DataFrame({
+            'telegram_id': pd.to_numeric(df_registros['telegram_id'], errors='coerce'),
+            'tipo': pd.Index([normalizar_tipo(t) for t in tipos], dtype=object)[codigos],
+            'fecha': leer_fechas(df_registros['fecha_registro']),
+            'xp': pd.to_numeric(df_registros['xp_ganado'], errors='coerce').fillna(0),
+            'valor': valores.fillna(0.0),
+            'con_valor': valores.notna().astype('int64'),
+        })
+        df = df.dropna(subset=['telegram_id', 'fecha'])
+        df['telegram_id'] = df['telegram_id'].astype('int64')
+        df['dia'] = dias_ordinales(df['fecha'])
+        return df.groupby(['telegram_id', 'tipo', 'dia'], as_index=False).agg(
+            xp=('xp', 'sum'), registros=('xp', 'size'), valor=('valor', 'sum'),
+            con_valor=('con_valor', 'sum'), ultima=('fecha', 'max'),
+        )
+
+    @staticmethod
+    def _totales(filas, claves):
+        """Totales y rachas por grupo (claves) a partir de las filas por día, sin bucles."""
+        filas = filas.sort_values(claves + ['dia'])
+        mismo_grupo = pd.Series(True, index=filas.index)
+        for clave in claves:
+            mismo_grupo &= filas[clave].eq(filas[clave].shift())
+        # Cada vez que se salta un día (o cambia el grupo) empieza una racha nueva
+        seguido = mismo_grupo & (filas['dia'] - filas['dia'].shift() == 1)
+        numero_racha = (~seguido).cumsum()
+        largo_racha = numero_racha.map(numero_racha.value_counts())
+
+        return filas.assign(largo_racha=largo_racha).groupby(claves, as_index=False).agg(
+            xp=('xp', 'sum'), registros=('registros', 'sum'), valor=('valor', 'sum'),
+            con_valor=('con_valor', 'sum'), ultima=('ultima', 'max'), ultimo_dia=('dia', 'max'),
+            racha=('largo_racha', 'last'), racha_maxima=('largo_racha', 'max'),
+        )
+
+    def de(self, telegram_id, hoy=None):
+        """Agregados del usuario listos para JSON, o None si no tiene actividad."""
+        hoy = (hoy or date.today()).toordinal()
+        with self._lock:
+            usuario = self._usuarios.get(telegram_id)
+            if usuario is None:
+                return None
+            resumen = usuario['total'].resumen(hoy)
+            # La medida (minutos, horas) solo tiene sentido dentro de un mismo tipo
+            for clave in ('valor', 'valor_semana', 'promedio_valor_semana'):
+                del resumen[clave]
+            resumen['por_tipo'] = {tipo: agregado.resumen(hoy) for tipo, agregado in sorted(usuario['por_tipo'].items())}
+            return resumen
@@ -0,0 +1,418 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from agregados import normalizar_tipo, dias_ordinales
+from almacen import leer_fechas
+
+# --- CONFIGURACIÓN ---
+DIAS_SIN_ASISTENCIA = 7         # Faltas reiteradas: días sin registrar asistencia (habiendo asistido antes)
+MAX_ALERTAS_GUARDADAS = 1000    # Alertas recientes que el bot puede leer en /api/alertas
+RUTA_ALERTAS = 'database/alertas.jsonl'   # Alertas emitidas por todos los procesos (ver RegistroAlertas)
+TAMANO_BLOQUE_CSV = 1_000_000   # Filas leídas por bloque al evaluar un CSV completo
+
+
+class Regla:
+    """
+    Alerta que se activa cuando, en los últimos ventana_dias días, hay al menos
+    minimo_dias días en que la medida diaria del tipo ('suma' o 'maximo' del campo
+    valor) cumple la condición. La condición usa solo comparaciones, así sirve igual
+    para un número (evaluación en línea) que para una Serie (evaluación masiva).
+    """
+
+    def __init__(self, codigo, tipo, ventana_dias, minimo_dias, medida, condicion, mensaje):
+        self.codigo = codigo
+        self.tipo = tipo
+        self.ventana_dias = ventana_dias
+        self.minimo_dias = minimo_dias
+        self.medida = medida
+        self.condicion = condicion
+        self.mensaje = mensaje
+
+
+REGLAS = [
+    Regla('SUENO_INSUFICIENTE', 'SUENO', 7, 3, 'suma', lambda horas: horas < 6,
+          "Dormiste menos de 6 horas {dias} noches esta semana."),
+    Regla('SUENO_EXCESIVO', 'SUENO', 7, 3, 'suma', lambda horas: horas > 10,
+          "Dormiste más de 10 horas {dias} noches esta semana."),
+    # valor de ASISTENCIA: minutos de atraso respecto al inicio de la clase
+    Regla('IMPUNTUALIDAD', 'ASISTENCIA', 14, 3, 'maximo', lambda minutos: minutos > 10,
+          "Llegaste más de 10 minutos tarde a clases {dias} días en las últimas dos semanas."),
+    Regla('SOBRECARGA_ESTUDIO', 'ESTUDIO', 7, 3, 'suma', lambda minutos: minutos > 480,
+          "Estudiaste más de 8 horas {dias} días esta semana. Descansar también es parte de rendir."),
+]
+FALTAS = 'FALTAS_REITERADAS'
+MENSAJE_FALTAS = "No registras asistencia a clases hace {dias} días."
+
+# Cualquier otra actividad se resume como 'OTRO': solo indica que el usuario sigue activo
+TIPOS_VIGILADOS = ('SUENO', 'ASISTENCIA', 'ESTUDIO', 'OTRO')
+VENTANA_MAXIMA = max(regla.ventana_dias for regla in REGLAS)
+
+
+def resumir_por_dia(df_registros):
+    """
+    Una fila por (usuario, tipo, día) con la suma y el máximo de 'valor' y cuántos
+    registros lo traen. Es todo lo que necesitan las reglas, así que los registros
+    crudos no se guardan.
+    """
+    # Normalizar solo los tipos distintos (son pocos) y no cada fila
+    codigos, tipos = pd.factorize(df_registros['tipo_actividad'].astype(str))
+    codigo_vigilado = np.array(
+        [TIPOS_VIGILADOS.index(t) if t in TIPOS_VIGILADOS else TIPOS_VIGILADOS.index('OTRO')
+         for t in (normalizar_tipo(t) for t in tipos)] + [-1],
+        dtype='int8',
+    )
+    if 'valor' in df_registros.columns:
+        valores = pd.to_numeric(df_registros['valor'], errors='coerce')
+    else:
+        valores = pd.Series(float('nan'), index=df_registros.index)
+
+    df = pd.DataFrame({
+        'telegram_id': pd.to_numeric(df_registros['telegram_id'], errors='coerce'),
+        # factorize marca los tipos vacíos con -1, que apunta al -1 final (se descartan abajo)
+        'tipo': codigo_vigilado[codigos],
+        'dia': dias_ordinales(leer_fechas(df_registros['fecha_registro'])),
+        'valor': valores.to_numpy(),
+    }, index=df_registros.index)
+    df = df[(df['tipo'] >= 0) & df['telegram_id'].notna() & df['dia'].notna()]
+    df = df.astype({'telegram_id': 'int64', 'dia': 'int64'})
+    diarios = df.groupby(['telegram_id', 'tipo', 'dia'], as_index=False, sort=False).agg(
+        suma=('valor', 'sum'), maximo=('valor', 'max'), con_valor=('valor', 'count'),
+    )
+    diarios['tipo'] = pd.Categorical.from_codes(diarios['tipo'], categories=TIPOS_VIGILADOS)
+    return diarios
+
+
+def combinar_resumenes(resumenes):
+    """Junta resúmenes diarios de distintos bloques del log (un mismo día puede quedar en dos)."""
+    diarios = pd.concat(resumenes, ignore_index=True)
+    return diarios.groupby(['telegram_id', 'tipo', 'dia'], as_index=False, observed=True, sort=False).agg(
+        suma=('suma', 'sum'), maximo=('maximo', 'max'), con_valor=('con_valor', 'sum'),
+    )
+
+
+def puntuar(diarios, hoy):
+    """
+    Evalúa todas las reglas para todos los usuarios a la vez, sin bucles por usuario.
+    hoy: día ordinal de referencia, o una Serie telegram_id -> día (uno por usuario).
+
+    Devuelve un DataFrame indexado por telegram_id con los días que cumple cada regla,
+    los días desde la última asistencia (NaN si nunca registró) y 'puntaje', la
+    cantidad de alertas activas; ordenado de mayor a menor puntaje.
+    """
+    usuarios = pd.Index(diarios['telegram_id'].unique(), name='telegram_id')
+    hoy_usuario = hoy.reindex(usuarios) if isinstance(hoy, pd.Series) else pd.Series(hoy, index=usuarios)
+    hoy_fila = diarios['telegram_id'].map(hoy_usuario)
+    hasta_hoy = diarios['dia'] <= hoy_fila
+
+    resultado = pd.DataFrame(index=usuarios)
+    puntaje = pd.Series(0, index=usuarios)
+    for regla in REGLAS:
+        en_ventana = diarios[hasta_hoy & (diarios['tipo'] == regla.tipo) & (diarios['con_valor'] > 0)
+                             & (diarios['dia'] > hoy_fila - regla.ventana_dias)]
+        cumple = regla.condicion(en_ventana[regla.medida]).astype('int64')
+        dias = cumple.groupby(en_ventana['telegram_id']).sum()
+        resultado[regla.codigo] = dias.reindex(usuarios, fill_value=0)
+        puntaje += resultado[regla.codigo] >= regla.minimo_dias
+
+    asistencias = diarios[hasta_hoy & (diarios['tipo'] == 'ASISTENCIA')]
+    ultima_asistencia = asistencias.groupby('telegram_id')['dia'].max().reindex(usuarios)
+    resultado[FALTAS] = (hoy_usuario - ultima_asistencia).astype('Int64')
+    puntaje += resultado[FALTAS] >= DIAS_SIN_ASISTENCIA
+
+    resultado['puntaje'] = puntaje
+    return resultado.sort_values('puntaje', ascending=False, kind='stable')
+
+
+class EstadoUsuario:
+    """Lo mínimo que se guarda de un usuario para evaluar las reglas al llegar un registro."""
+
+    __slots__ = ('baldes', 'ultima_asistencia', 'ultimo_dia', 'avisadas')
+
+    def __init__(self):
+        self.baldes = {}                # tipo -> {dia: [suma, maximo]} (acotado a VENTANA_MAXIMA días)
+        self.ultima_asistencia = None
+        self.ultimo_dia = None          # Día del registro más reciente: referencia de las ventanas
+        self.avisadas = {}              # codigo -> día en que se avisó
+
+    def sumar(self, tipo, dia, suma, maximo, con_valor):
+        if self.ultimo_dia is None or dia > self.ultimo_dia:
+            self.ultimo_dia = dia
+        if tipo == 'ASISTENCIA' and (self.ultima_asistencia is None or dia > self.ultima_asistencia):
+            self.ultima_asistencia = dia
+
+        limite = self.ultimo_dia - VENTANA_MAXIMA
+        if con_valor and tipo != 'OTRO' and dia > limite:
+            baldes = self.baldes.setdefault(tipo, {})
+            balde = baldes.get(dia)
+            if balde is None:
+                baldes[dia] = [suma, maximo]
+            else:
+                balde[0] += suma
+                balde[1] = max(balde[1], maximo)
+        for baldes in self.baldes.values():
+            for viejo in [d for d in baldes if d <= limite]:
+                del baldes[viejo]
+
+    def dias_que_cumplen(self, regla, hoy):
+        indice = 0 if regla.medida == 'suma' else 1
+        return sum(
+            1 for dia, balde in self.baldes.get(regla.tipo, {}).items()
+            if hoy - regla.ventana_dias < dia <= hoy and regla.condicion(balde[indice])
+        )
+
+    def avisada(self, codigo, hoy, ventana_dias):
+        """Una alerta no se repite dentro de su misma ventana."""
+        dia = self.avisadas.get(codigo)
+        return dia is not None and dia > hoy - ventana_dias
+
+
+class MotorAlertas:
+    """
+    Evalúa las reglas de alerta a medida que llegan los registros, sin recorrer el historial.
+
+    Por usuario guarda solo los baldes diarios de los últimos VENTANA_MAXIMA días,
+    el día de su última asistencia y cuándo se le avisó cada alerta. Devuelve las
+    alertas nuevas sin id: quien escribió el registro las anota en RegistroAlertas.
+
+    Con varios procesos, cada uno evalúa también los registros que escribieron los
+    demás (emitir=False), para que su estado y sus avisos queden iguales, pero solo
+    emite las alertas de los registros que escribió él.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usuarios = {}
+        self._por_codigo = Counter()
+
+    def procesar(self, telegram_id, tipo_actividad, fecha, valor=None, emitir=True):
+        """
+        Evalúa un registro (fecha 'YYYY-MM-DD HH:MM:SS'). Devuelve las alertas nuevas, o
+        [] con emitir=False (el registro lo escribió otro proceso, que ya las emitió).
+        """
+        dia = datetime.strptime(fecha, '%Y-%m-%d %H:%M:%S').toordinal()
+        tipo = normalizar_tipo(tipo_actividad)
+        if tipo not in TIPOS_VIGILADOS:
+            tipo = 'OTRO'
+        con_valor = 0 if valor is None or pd.isna(valor) else 1
+        valor = float(valor) if con_valor else 0.0
+        with self._lock:
+            estado = self._usuarios.setdefault(telegram_id, EstadoUsuario())
+            estado.sumar(tipo, dia, valor, valor, con_valor)
+            nuevas = self._evaluar(telegram_id, estado)
+        return nuevas if emitir else []
+
+    def procesar_lote(self, df_registros, emitir=True):
+        """Evalúa un lote: se resume por (usuario, tipo, día) y cada usuario se evalúa una sola vez."""
+        if df_registros.empty:
+            return []
+        diarios = resumir_por_dia(df_registros).sort_values('dia', kind='stable')
+        columnas = ['telegram_id', 'tipo', 'dia', 'suma', 'maximo', 'con_valor']
+        nuevas = []
+        with self._lock:
+            tocados = {}
+            for telegram_id, tipo, dia, suma, maximo, con_valor in zip(*(diarios[c].tolist() for c in columnas)):
+                estado = tocados.get(telegram_id) or self._usuarios.setdefault(telegram_id, EstadoUsuario())
+                estado.sumar(tipo, dia, suma, maximo, con_valor)
+                tocados[telegram_id] = estado
+            for telegram_id, estado in tocados.items():
+                nuevas.extend(self._evaluar(telegram_id, estado))
+        return nuevas if emitir else []
+
+    def reconstruir(self, df_registros):
+        """
+        Recalcula el estado desde el log, sin emitir alertas: las que ya estarían
+        activas se marcan como avisadas para no repetirlas al reiniciar el backend.
+        """
+        usuarios = {}
+        if not df_registros.empty:
+            diarios = resumir_por_dia(df_registros)
+            ultimo_dia = diarios.groupby('telegram_id')['dia'].max()
+
+            # 1. Última asistencia de cada usuario (de todo el historial)
+            asistencias = diarios[diarios['tipo'] == 'ASISTENCIA'].groupby('telegram_id')['dia'].max()
+            for telegram_id, dia in asistencias.items():
+                estado = usuarios[telegram_id] = EstadoUsuario()
+                estado.ultima_asistencia = dia
+
+            # 2. Baldes de los últimos días de cada usuario (relativos a su registro más reciente)
+            recientes = diarios[(diarios['dia'] > diarios['telegram_id'].map(ultimo_dia) - VENTANA_MAXIMA)
+                                & (diarios['con_valor'] > 0) & (diarios['tipo'] != 'OTRO')]
+            columnas = ['telegram_id', 'tipo', 'dia', 'suma', 'maximo']
+            for telegram_id, tipo, dia, suma, maximo in zip(*(recientes[c].tolist() for c in columnas)):
+                estado = usuarios.get(telegram_id) or usuarios.setdefault(telegram_id, EstadoUsuario())
+                estado.baldes.setdefault(tipo, {})[dia] = [suma, maximo]
+            ultimos = ultimo_dia.to_dict()
+            for telegram_id, estado in usuarios.items():
+                estado.ultimo_dia = ultimos[telegram_id]
+
+            # 3. Lo que ya cumple alguna regla se da por avisado
+            puntos = puntuar(diarios, ultimo_dia)
+            for regla in REGLAS:
+                for telegram_id in puntos.index[puntos[regla.codigo] >= regla.minimo_dias]:
+                    usuarios[telegram_id].avisadas[regla.codigo] = usuarios[telegram_id].ultimo_dia
+            for telegram_id in puntos.index[puntos[FALTAS] >= DIAS_SIN_ASISTENCIA]:
+                usuarios[telegram_id].avisadas[FALTAS] = usuarios[telegram_id].ultimo_dia
+
+        with self._lock:
+            self._usuarios = usuarios
+
+    def _evaluar(self, telegram_id, estado):
+        """Reglas del usuario evaluadas en su día más reciente. Llamar con el lock tomado."""
+        hoy = estado.ultimo_dia
+        nuevas = []
+        for regla in REGLAS:
+            dias = estado.dias_que_cumplen(regla, hoy)
+            if dias >= regla.minimo_dias and not estado.avisada(regla.codigo, hoy, regla.ventana_dias):
+                nuevas.append(self._emitir(telegram_id, estado, regla.codigo, regla.mensaje.format(dias=dias)))
+        if estado.ultima_asistencia is not None:
+            dias = hoy - estado.ultima_asistencia
+            if dias >= DIAS_SIN_ASISTENCIA and not estado.avisada(FALTAS, hoy, DIAS_SIN_ASISTENCIA):
+                nuevas.append(self._emitir(telegram_id, estado, FALTAS, MENSAJE_FALTAS.format(dias=dias)))
+        return nuevas
+
+    def _emitir(self, telegram_id, estado, codigo, mensaje):
+        estado.avisadas[codigo] = estado.ultimo_dia
+        self._por_codigo[codigo] += 1
+        return {
+            "telegram_id": int(telegram_id),
+            "codigo": codigo,
+            "mensaje": mensaje,
+            "fecha": date.fromordinal(estado.ultimo_dia).isoformat(),
+        }
+
+    def estadisticas(self):
+        with self._lock:
+            return {"usuarios": len(self._usuarios), "evaluadas": dict(self._por_codigo)}
+
+
+class RegistroAlertas:
+    """
+    Alertas emitidas por todos los procesos: un archivo de solo-anexar con una línea
+    JSON por alerta y ids correlativos. Se anota con el bloqueo de escritura del
+    almacén tomado, así dos workers no repiten un id. Cada proceso lee solo las
+    líneas nuevas desde el último byte que conoce (como registros.csv) y guarda
+    las MAX_ALERTAS_GUARDADAS más recientes.
+    """
+
+    def __init__(self, ruta=RUTA_ALERTAS, max_guardadas=MAX_ALERTAS_GUARDADAS):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._recientes = deque(maxlen=max_guardadas)
+        self._offset = 0
+        self._inodo = None
+        self.ultimo_id = 0
+
+    def _leer_nuevas(self):
+        """Se pone al día con el archivo. Llamar con el lock tomado."""
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self._inodo or st.st_size < self._offset:
+            # Archivo nuevo, borrado o reemplazado: se lee desde el principio
+            self._recientes.clear()
+            self._offset = 0
+            self._inodo = st.st_ino if st is not None else None
+            self.ultimo_id = 0
+        if st is None or st.st_size == self._offset:
+            return
+        with open(self.ruta, 'rb') as f:
+            f.seek(self._offset)
+            datos = f.read()
+        # Una línea a medio escribir queda para la próxima lectura
+        fin = datos.rfind(b'\n') + 1
+        for linea in datos[:fin].splitlines():
+            try:
+                alerta = json.loads(linea)
+            except ValueError:
+                continue   # Resto de una escritura cortada por una caída
+            self._recientes.append(alerta)
+            self.ultimo_id = alerta['id']
+        self._offset += fin
+
+    def anotar(self, nuevas):
+        """
+        Da id a las alertas y las anexa al archivo. Quien llama tiene tomado
+        almacen.bloqueo_escritura(). Devuelve las alertas con su id.
+        """
+        if not nuevas:
+            return []
+        with self._lock:
+            self._leer_nuevas()
+            anotadas = [{"id": self.ultimo_id + i, **alerta} for i, alerta in enumerate(nuevas, start=1)]
+            with open(self.ruta, 'ab') as f:
+                # Si una caída dejó una línea sin terminar, la primera alerta no se pega a ella
+                if f.tell() > 0:
+                    with open(self.ruta, 'rb') as lectura:
+                        lectura.seek(-1, os.SEEK_END)
+                        if lectura.read(1) != b'\n':
+                            f.write(b'\n')
+                f.write(''.join(json.dumps(a, ensure_ascii=False) + '\n' for a in anotadas).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            self._leer_nuevas()
+        return anotadas
+
+    def alertas(self, desde=0, telegram_id=None):
+        """Alertas con id mayor a desde (opcionalmente de un usuario), y el último id anotado."""
+        with self._lock:
+            self._leer_nuevas()
+            return [
+                alerta for alerta in self._recientes
+                if alerta["id"] > desde and (telegram_id is None or alerta["telegram_id"] == telegram_id)
+            ], self.ultimo_id
+
+    def estadisticas(self):
+        with self._lock:
+            return {"guardadas": len(self._recientes), "ultimo": self.ultimo_id}
+
+
+def evaluar_csv(ruta, hoy=None, tamano_bloque=TAMANO_BLOQUE_CSV):
+    """
+    Puntúa a todos los usuarios de un CSV de registros. Se lee por bloques y de cada
+    bloque solo se guarda el resumen diario, así la memoria no crece con el log.
+    """
+    columnas = ['telegram_id', 'tipo_actividad', 'fecha_registro', 'valor']
+    encabezado = pd.read_csv(ruta, nrows=0).columns
+    resumenes = [
+        resumir_por_dia(bloque)
+        for bloque in pd.read_csv(ruta, usecols=[c for c in columnas if c in encabezado],
+                                  dtype={'tipo_actividad': str, 'fecha_registro': str},
+                                  chunksize=tamano_bloque)
+    ]
+    diarios = combinar_resumenes(resumenes)
+    if hoy is None:
+        hoy = int(diarios['dia'].max())
+    return puntuar(diarios, hoy), hoy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evalúa las reglas de alerta sobre el log completo de registros.")
+    parser.add_argument('--registros', default='database/registros.csv', help="CSV de registros.")
+    parser.add_argument('--fecha', help="Día de referencia YYYY-MM-DD (por defecto, el último día del log).")
+    parser.add_argument('--salida', help="CSV donde guardar el puntaje de los usuarios con alertas.")
+    parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE_CSV, help="Filas leídas por bloque.")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    hoy = datetime.strptime(args.fecha, '%Y-%m-%d').toordinal() if args.fecha else None
+    puntos, hoy = evaluar_csv(args.registros, hoy, args.bloque)
+    con_alertas = puntos[puntos['puntaje'] > 0]
+
+    print(f"Usuarios evaluados: {len(puntos)} al {date.fromordinal(hoy).isoformat()} "
+          f"({time.perf_counter() - inicio:.1f}s)")
+    for regla in REGLAS:
+        print(f"  {regla.codigo}: {int((puntos[regla.codigo] >= regla.minimo_dias).sum())}")
+    print(f"  {FALTAS}: {int((puntos[FALTAS] >= DIAS_SIN_ASISTENCIA).sum())}")
+    print(f"Usuarios con al menos una alerta: {len(con_alertas)}")
+    if args.salida:
+        con_alertas.to_csv(args.salida)
+        print(f"Puntajes guardados en {args.salida}")
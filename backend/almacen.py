@@ -0,0 +1,712 @@
+import pandas as pd
+import atexit
+import csv
+import io
+import json
+import os
+import threading
+import time
+import zlib
+import sys
+from contextlib import contextmanager
+
+# metricas.py vive en la raíz del repo y lo comparten la API, el frontend y el bot
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metricas import metricas_proceso
+
+try:
+    import fcntl  # Bloqueo entre procesos (solo POSIX)
+except ImportError:
+    fcntl = None
+
+# --- CONFIGURACIÓN ---
+# Rutas relativas a la carpeta 'database'
+USUARIOS_CSV = 'database/usuarios.csv'
+REGISTROS_XP_CSV = 'database/registros.csv'
+
+COLUMNAS_USUARIOS = ['telegram_id', 'nombre', 'xp_total', 'liga_actual', 'fecha_creacion']
+# valor: medida opcional de la actividad (minutos de estudio, horas de sueño); vacío si no aplica
+COLUMNAS_REGISTROS = ['log_id', 'telegram_id', 'xp_ganado', 'tipo_actividad', 'fecha_registro', 'valor']
+
+# Agrupación de fsync del log de registros: se fuerza a disco cada N filas
+# o cada tantos segundos, lo que ocurra primero.
+FSYNC_CADA_N_REGISTROS = 32
+FSYNC_CADA_SEGUNDOS = 1.0
+
+# Punto de control de usuarios.csv: su xp_total incluye los registros hasta cierto byte de
+# registros.csv, y el XP de las filas posteriores se suma al cargar. Así una actividad solo
+# anexa su fila al log (el XP queda en disco con el mismo fsync) y usuarios.csv se compacta
+# cada tantos registros, al cambiar las ligas y al cerrar.
+SUFIJO_CONTROL = '.control'
+COMPACTAR_CADA_N_REGISTROS = 5000
+BYTES_HUELLA_REGISTROS = 4096   # Bytes de registros.csv (antes del offset) que identifican al log
+
+# Asegurar que la carpeta 'database' exista al inicio
+if not os.path.exists('database'):
+    os.makedirs('database')
+
+# --- FUNCIONES DE MANEJO DE DATOS ---
+
+@metricas_proceso.medir('uconnect_csv_segundos', operacion='cargar')
+def cargar_dataframes(ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV):
+    """
+    Carga los DataFrames desde los archivos CSV.
+    Implementa lógica robusta para manejar archivos vacíos o inexistentes.
+    """
+
+    # Definición de DataFrames vacíos con las columnas esperadas
+    df_u = pd.DataFrame(columns=COLUMNAS_USUARIOS)
+    df_r = pd.DataFrame(columns=COLUMNAS_REGISTROS)
+
+    # 1. Manejo del DataFrame de Usuarios (ruta_usuarios=None: solo registros)
+    if ruta_usuarios and os.path.exists(ruta_usuarios) and os.path.getsize(ruta_usuarios) > 0:
+        try:
+            df_u = pd.read_csv(ruta_usuarios)
+        except pd.errors.EmptyDataError:
+            # Si el archivo tiene encabezado pero no datos, o falló la lectura:
+            # se queda con el DataFrame vacío inicializado
+            print(f"Advertencia: El archivo {ruta_usuarios} existe pero está vacío o es ilegible. Inicializando un DataFrame vacío.")
+            pass # df_u ya está inicializado arriba
+
+    # 2. Manejo del DataFrame de Registros (ruta_registros=None: solo usuarios)
+    if ruta_registros and os.path.exists(ruta_registros) and os.path.getsize(ruta_registros) > 0:
+        try:
+            df_r = pd.read_csv(ruta_registros)
+        except pd.errors.EmptyDataError:
+            # Si el archivo tiene encabezado pero no datos, o falló la lectura:
+            # se queda con el DataFrame vacío inicializado
+            print(f"Advertencia: El archivo {ruta_registros} existe pero está vacío o es ilegible. Inicializando un DataFrame vacío.")
+            pass # df_r ya está inicializado arriba
+
+    # Los CSV anteriores a la columna 'valor' no la traen
+    for columna in COLUMNAS_REGISTROS:
+        if columna not in df_r.columns:
+            df_r[columna] = None
+
+    return df_u, df_r
+
+def leer_fechas(fechas):
+    """
+    fecha_registro como datetime64. Los almacenes CSV y SQLite la entregan como texto
+    'YYYY-MM-DD HH:MM:SS'; el almacén mapeado ya la entrega como fecha y no se vuelve a parsear.
+    """
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas
+    return pd.to_datetime(fechas.astype(str), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+
+@metricas_proceso.medir('uconnect_csv_segundos', operacion='leer_final')
+def leer_final_csv(ruta_csv, desde, hasta=None):
+    """
+    Registros de registros.csv entre los bytes 'desde' (0 = el principio, sin la cabecera)
+    y 'hasta' (por defecto el final), cortando en la última línea completa: una línea a
+    medio escribir queda para la próxima lectura. Devuelve (DataFrame, byte donde terminó).
+    """
+    if not os.path.exists(ruta_csv):
+        return pd.DataFrame(columns=COLUMNAS_REGISTROS), desde
+    with open(ruta_csv, 'rb') as f:
+        if desde == 0:
+            f.readline()  # cabecera
+            desde = f.tell()
+        f.seek(desde)
+        datos = f.read() if hasta is None else f.read(max(hasta - desde, 0))
+    fin = datos.rfind(b'\n') + 1
+    if fin == 0:
+        return pd.DataFrame(columns=COLUMNAS_REGISTROS), desde
+    df = pd.read_csv(io.BytesIO(datos[:fin]), header=None, names=COLUMNAS_REGISTROS,
+                     dtype={'log_id': str, 'tipo_actividad': str, 'fecha_registro': str})
+    return df, desde + fin
+
+def guardar_dataframes(df_u, df_r, ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV):
+    """Guarda los DataFrames en los archivos CSV (cada uno de forma atómica)."""
+    guardar_csv_atomico(df_u, ruta_usuarios)
+    guardar_csv_atomico(df_r, ruta_registros)
+
+@metricas_proceso.medir('uconnect_csv_segundos', operacion='guardar')
+def guardar_csv_atomico(df, ruta, antes_de_reemplazar=None):
+    """
+    Escribe el CSV en un archivo temporal, lo fuerza a disco y lo renombra sobre el original.
+    Un lector nunca ve un archivo a medio escribir y un corte de luz deja la versión vieja o la nueva.
+    antes_de_reemplazar(tmp) corre con el temporal ya en disco, justo antes del rename.
+    """
+    tmp = f"{ruta}.tmp"
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    if antes_de_reemplazar is not None:
+        antes_de_reemplazar(tmp)
+    _reemplazar(tmp, ruta)
+
+def _reemplazar(tmp, ruta):
+    os.replace(tmp, ruta)
+    # fsync del directorio para que el rename también sea durable
+    fd = os.open(os.path.dirname(ruta) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _crc_archivo(ruta, desde=0, hasta=None):
+    """crc32 de los bytes [desde, hasta) del archivo, o None si no existe o no llega a 'hasta'."""
+    if hasta is not None and hasta <= desde:
+        return 0
+    try:
+        with open(ruta, 'rb') as f:
+            f.seek(desde)
+            datos = f.read() if hasta is None else f.read(hasta - desde)
+    except FileNotFoundError:
+        return None
+    if hasta is not None and len(datos) < hasta - desde:
+        return None
+    return zlib.crc32(datos)
+
+def guardar_punto_control(df_u, offset_registros, ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV):
+    """
+    Reescribe usuarios.csv, cuyo xp_total incluye los registros hasta el byte offset_registros
+    de registros.csv. El control (usuarios.csv.control) guarda ese offset y el crc del contenido
+    nuevo, y se escribe antes del rename: si el proceso muere entre ambos pasos, el control
+    describe usuarios.csv.tmp y leer_punto_control() lo usa.
+    """
+    def escribir_control(tmp):
+        control = {
+            'offset_registros': offset_registros,
+            'bytes_usuarios': os.path.getsize(tmp),
+            'crc_usuarios': _crc_archivo(tmp),
+            'crc_registros': _crc_archivo(ruta_registros, max(offset_registros - BYTES_HUELLA_REGISTROS, 0), offset_registros),
+        }
+        ruta_control = ruta_usuarios + SUFIJO_CONTROL
+        with open(f"{ruta_control}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(control, f)
+            f.flush()
+            os.fsync(f.fileno())
+        _reemplazar(f"{ruta_control}.tmp", ruta_control)
+
+    guardar_csv_atomico(df_u, ruta_usuarios, antes_de_reemplazar=escribir_control)
+
+def leer_punto_control(ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV):
+    """
+    Lee usuarios.csv con su punto de control. Devuelve (df_u, offset, ruta):
+    offset es el byte de registros.csv hasta donde llega su xp_total, o None si no hay un
+    control que coincida (archivos de una versión anterior, o reemplazados a mano): entonces
+    usuarios.csv se toma como al día. ruta es el archivo leído, usuarios.csv.tmp si una
+    compactación quedó a medias. Los usuarios anexados después del control no lo invalidan:
+    solo se compara el tramo que el control describe.
+    """
+    try:
+        with open(ruta_usuarios + SUFIJO_CONTROL, encoding='utf-8') as f:
+            control = json.load(f)
+    except (FileNotFoundError, ValueError):
+        control = None
+
+    if control is not None:
+        offset = control['offset_registros']
+        huella = _crc_archivo(ruta_registros, max(offset - BYTES_HUELLA_REGISTROS, 0), offset)
+        if huella == control['crc_registros']:
+            # Un lector sin el bloqueo puede cruzarse con el rename de una compactación: se reintenta
+            for _ in range(3):
+                for ruta in (ruta_usuarios, f"{ruta_usuarios}.tmp"):
+                    if _crc_archivo(ruta, 0, control['bytes_usuarios']) != control['crc_usuarios']:
+                        continue
+                    try:
+                        return pd.read_csv(ruta), offset, ruta
+                    except FileNotFoundError:
+                        pass
+
+    df_u, _ = cargar_dataframes(ruta_usuarios, None)
+    return df_u, None, ruta_usuarios
+
+
+# --- INTERFAZ DE ALMACENAMIENTO ---
+
+class Almacen:
+    """
+    Interfaz que usan las rutas de Flask para leer y escribir datos.
+    Implementaciones: AlmacenCSV (archivos CSV en memoria), AlmacenSQLite (almacen_sqlite.py)
+    y AlmacenMapeado (almacen_mapeado.py, historial en segmentos mapeados en memoria).
+    """
+
+    def _actualizar_cabecera_registros(self):
+        """
+        Si registros.csv tiene la cabecera de una versión anterior, se reescribe con las columnas
+        actuales. Devuelve True si lo reescribió.
+        """
+        if not os.path.exists(self.ruta_registros) or os.path.getsize(self.ruta_registros) == 0:
+            return False
+        with open(self.ruta_registros, newline='', encoding='utf-8') as f:
+            cabecera = next(csv.reader(f), [])
+        if cabecera != COLUMNAS_REGISTROS:
+            print(f"Actualizando {self.ruta_registros} a las columnas {COLUMNAS_REGISTROS}.")
+            guardar_csv_atomico(self._df_registros[COLUMNAS_REGISTROS], self.ruta_registros)
+            return True
+        return False
+
+    def recargar_si_cambio(self):
+        """Vuelve a leer los datos si otro proceso los modificó. Devuelve True si recargó."""
+        return False
+
+    def sincronizar(self):
+        """
+        Se pone al día con lo que escribieron otros procesos. Devuelve (cambio, nuevos):
+        cambio es False si nada cambió; nuevos es un DataFrame con los registros que otros
+        procesos anexaron (para sumarlos a lo que se mantiene en memoria), o None si hubo
+        que recargar todo y lo derivado debe reconstruirse.
+        """
+        return self.recargar_si_cambio(), None
+
+    @contextmanager
+    def bloqueo_escritura(self):
+        """
+        Exclusión mutua de escrituras entre procesos y entre hilos (flock sobre
+        ruta_bloqueo). Quien escribe debe sincronizar() dentro del bloqueo antes de
+        escribir: así ningún proceso escribe sobre una copia desactualizada.
+        """
+        with open(self.ruta_bloqueo, 'a') as f:
+            if fcntl is None:
+                # Sin flock (Windows) solo se excluyen los hilos de este proceso
+                with self._lock_escritura:
+                    yield
+                return
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def guardar(self):
+        """Persiste todo lo pendiente (y crea los archivos si no existen)."""
+
+    def cerrar(self):
+        """Libera archivos y conexiones abiertas."""
+
+    def usuarios(self):
+        """DataFrame con todos los usuarios."""
+        raise NotImplementedError
+
+    def registros(self, desde=None, columnas=None):
+        """
+        DataFrame con los registros de actividad (opcionalmente solo los posteriores a 'desde').
+        columnas: lista de COLUMNAS_REGISTROS a devolver (por defecto todas); pedir solo
+        las necesarias evita leer log_id, que es la columna más pesada.
+        """
+        raise NotImplementedError
+
+    def buscar_usuario(self, telegram_id):
+        """Devuelve la fila del usuario como diccionario, o None si no existe."""
+        raise NotImplementedError
+
+    def registros_existentes(self, log_ids):
+        """Devuelve el conjunto de log_id (de los recibidos) que ya están registrados."""
+        raise NotImplementedError
+
+    def agregar_usuario(self, nuevo_usuario):
+        """Añade un usuario. Devuelve False si el telegram_id ya existe."""
+        raise NotImplementedError
+
+    def agregar_registro(self, nuevo_log):
+        """
+        Añade un registro de actividad y suma el XP al usuario.
+        Devuelve el nuevo xp_total, o None si el usuario no existe.
+        """
+        raise NotImplementedError
+
+    def agregar_registros(self, df_logs):
+        """
+        Añade un lote de registros (DataFrame con COLUMNAS_REGISTROS) en una sola escritura
+        y suma el XP agrupado por usuario. Las filas de usuarios inexistentes se descartan.
+        Devuelve {telegram_id: xp_total} de los usuarios actualizados.
+        """
+        raise NotImplementedError
+
+    def actualizar_ligas(self, ligas):
+        """Cambia liga_actual de varios usuarios ({telegram_id: liga}) en una sola escritura."""
+        raise NotImplementedError
+
+
+def crear_almacen():
+    """
+    Crea el almacén según la variable de entorno UCONNECT_ALMACEN ('csv' por defecto,
+    'sqlite' o 'mmap'). La ruta de la base SQLite se puede cambiar con UCONNECT_SQLITE.
+    """
+    tipo = os.environ.get('UCONNECT_ALMACEN', 'csv').lower()
+    if tipo == 'sqlite':
+        from almacen_sqlite import AlmacenSQLite, SQLITE_DB
+        return AlmacenSQLite(os.environ.get('UCONNECT_SQLITE', SQLITE_DB))
+    if tipo == 'mmap':
+        from almacen_mapeado import AlmacenMapeado
+        return AlmacenMapeado()
+    if tipo != 'csv':
+        raise ValueError(f"UCONNECT_ALMACEN desconocido: {tipo} (usa 'csv', 'sqlite' o 'mmap')")
+    return AlmacenCSV()
+
+
+# --- ALMACÉN EN MEMORIA (CSV) ---
+
+class AlmacenCSV(Almacen):
+    """
+    Mantiene usuarios y registros en memoria durante toda la vida del proceso.
+    Los CSV se leen una sola vez al inicio; las escrituras actualizan la memoria
+    y luego se vuelcan a disco. Si otro proceso modifica los archivos,
+    recargar_si_cambio() los vuelve a leer.
+
+    registros.csv es un log de solo-anexar: cada actividad agrega una línea
+    (con fsync agrupado) en vez de reescribir el historial completo. Esa línea
+    es también el diario del xp_total: usuarios.csv es un punto de control
+    (ver guardar_punto_control) que se reescribe de forma atómica cada
+    COMPACTAR_CADA_N_REGISTROS, al cambiar las ligas y al cerrar; al cargar se
+    le suma el XP de los registros posteriores. Los usuarios nuevos solo se anexan.
+
+    Los usuarios viven en un diccionario telegram_id -> fila, así que buscar,
+    sumar XP o detectar un duplicado no depende de cuántos usuarios haya.
+    """
+
+    def __init__(self, ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV):
+        self.ruta_usuarios = ruta_usuarios
+        self.ruta_registros = ruta_registros
+        self.ruta_bloqueo = os.path.join(os.path.dirname(ruta_usuarios) or '.', '.escritura.lock')
+        # RLock: las escrituras y recargas no deben intercalarse entre hilos
+        self._lock = threading.RLock()
+        self._lock_escritura = threading.Lock()
+        self._firma = None
+        # Hasta qué byte de registros.csv está reflejado en memoria
+        self._offset_registros = 0
+        # Log de registros abierto en modo 'a' y estado del fsync agrupado
+        self._archivo_registros = None
+        self._sin_fsync = 0
+        self._ultimo_fsync = time.monotonic()
+        # Registros anexados desde la última compactación de usuarios.csv, y si hay que
+        # compactar antes de la próxima escritura (no hay un punto de control válido)
+        self._sin_compactar = 0
+        self._control_pendiente = False
+        self.cargar()
+        atexit.register(self.cerrar)
+
+    def _firma_archivos(self):
+        """(mtime, tamaño, inodo) de ambos archivos; cambia cuando alguien los modifica."""
+        firma = []
+        for ruta in (self.ruta_usuarios, self.ruta_registros):
+            try:
+                st = os.stat(ruta)
+                firma.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                firma.append(None)
+        return tuple(firma)
+
+    def cargar(self):
+        """Lee ambos CSV desde disco y reemplaza el contenido en memoria."""
+        with self._lock:
+            self._cerrar_log()
+            # El control se lee antes que el log: su offset nunca pasa de lo que se lee después
+            punto = leer_punto_control(self.ruta_usuarios, self.ruta_registros)
+            _, df_r = cargar_dataframes(None, self.ruta_registros)
+            self._cargar_registros(df_r)
+            self._offset_registros = os.path.getsize(self.ruta_registros) if os.path.exists(self.ruta_registros) else 0
+            self._cargar_punto_control(punto)
+            if self._actualizar_cabecera_registros():
+                # Los offsets del log cambiaron: el punto de control ya no sirve
+                self._offset_registros = os.path.getsize(self.ruta_registros)
+                self._control_pendiente = True
+            self._firma = self._firma_archivos()
+
+    def _cargar_registros(self, df_r):
+        self._df_registros = df_r
+        # Filas anexadas desde la última materialización de _df_registros.
+        # Se acumulan en una lista para no hacer un pd.concat O(historial) por actividad.
+        self._registros_pendientes = []
+        # Todos los log_id del historial, para detectar reintentos en O(1)
+        self._log_ids = set(df_r['log_id'].astype(str))
+
+    def _cargar_usuarios(self, df_u):
+        # xp_total siempre entero, aunque el CSV venga vacío o con decimales
+        df_u['xp_total'] = pd.to_numeric(df_u['xp_total'], errors='coerce').fillna(0).astype('int64')
+        # Índice telegram_id -> fila. Si el CSV trae IDs repetidos se conserva la primera aparición
+        duplicados = df_u['telegram_id'].duplicated()
+        if duplicados.any():
+            print(f"Advertencia: {self.ruta_usuarios} tiene {int(duplicados.sum())} telegram_id repetidos; se usa la primera aparición.")
+            df_u = df_u[~duplicados]
+        self._usuarios = {
+            int(fila['telegram_id']): fila
+            for fila in df_u[COLUMNAS_USUARIOS].to_dict('records')
+        }
+        # DataFrame de usuarios construido bajo demanda (se invalida en cada escritura)
+        self._df_usuarios = df_u.reset_index(drop=True)
+
+    def _cargar_punto_control(self, punto):
+        """Carga los usuarios de leer_punto_control() y les suma el XP del log posterior al control."""
+        df_u, offset, ruta = punto
+        self._cargar_usuarios(df_u)
+        if offset is None:
+            # Sin control usuarios.csv se toma como al día; la próxima escritura lo crea
+            self._control_pendiente = True
+            return
+        # Leído de usuarios.csv.tmp: se compacta antes de anexar usuarios al archivo viejo
+        self._control_pendiente = ruta != self.ruta_usuarios
+        if offset < self._offset_registros:
+            posteriores, _ = leer_final_csv(self.ruta_registros, offset, self._offset_registros)
+            self._sumar_xp(posteriores)
+
+    def _sumar_xp(self, df_logs):
+        """Suma al xp_total en memoria el XP de registros que ya están en el log."""
+        if df_logs.empty:
+            return
+        for telegram_id, xp in df_logs.groupby('telegram_id')['xp_ganado'].sum().items():
+            usuario = self._usuarios.get(int(telegram_id))
+            if usuario is not None:
+                usuario['xp_total'] = int(usuario['xp_total']) + int(xp)
+        self._df_usuarios = None
+
+    def recargar_si_cambio(self):
+        """Recarga los CSV si fueron modificados fuera de este proceso. Devuelve True si recargó."""
+        with self._lock:
+            if self._firma_archivos() == self._firma:
+                return False
+            self.cargar()
+            return True
+
+    def sincronizar(self):
+        """
+        Como registros.csv solo se anexa, lo que escribieron otros procesos se lee desde
+        el último byte conocido, sin recargar el historial, y su XP se suma a los usuarios.
+        usuarios.csv se vuelve a leer completo (con su punto de control) si cambió.
+        Si registros.csv fue reescrito se recarga todo.
+        """
+        with self._lock:
+            firma = self._firma_archivos()
+            if firma == self._firma:
+                return False, None
+            # Como en cargar(): el control antes que el log
+            punto = leer_punto_control(self.ruta_usuarios, self.ruta_registros) if firma[0] != self._firma[0] else None
+            nuevos = self._leer_registros_ajenos(firma[1])
+            if nuevos is None:
+                self.cargar()
+                return True, None
+            if punto is not None:
+                self._cargar_punto_control(punto)
+            else:
+                self._sumar_xp(nuevos)
+            # La firma es la de antes de leer: si algo cambió mientras, se verá en la próxima llamada
+            self._firma = firma
+            return True, nuevos
+
+    def _log_reescrito(self, firma_registros):
+        """True si registros.csv ya no es el mismo archivo que se fue leyendo (otro inodo, o más corto)."""
+        anterior = self._firma[1]
+        return (firma_registros is None or anterior is None or firma_registros[2] != anterior[2]
+                or firma_registros[1] < self._offset_registros)
+
+    def _leer_registros_ajenos(self, firma_registros):
+        """Registros anexados por otros procesos desde _offset_registros, o None si el archivo fue reescrito."""
+        if self._log_reescrito(firma_registros):
+            return None
+        nuevos, self._offset_registros = leer_final_csv(self.ruta_registros, self._offset_registros)
+        if not nuevos.empty:
+            self._df_registros = pd.concat([self._registros_en_memoria(), nuevos], ignore_index=True)
+            self._log_ids.update(nuevos['log_id'])
+        return nuevos
+
+    def guardar(self):
+        """Vuelca el contenido completo en memoria a los CSV (reescritura atómica)."""
+        with self._lock:
+            self._cerrar_log()
+            # Primero el log: el punto de control de usuarios.csv apunta a sus offsets nuevos
+            guardar_csv_atomico(self.registros(), self.ruta_registros)
+            self._offset_registros = os.path.getsize(self.ruta_registros)
+            self._guardar_usuarios()
+            self._firma = self._firma_archivos()
+
+    def cerrar(self):
+        """
+        Fuerza a disco las filas pendientes de fsync, cierra el log y compacta usuarios.csv
+        si quedaron registros sin compactar (con el bloqueo y al día, como cualquier escritura).
+        """
+        with self._lock:
+            self._cerrar_log()
+            if self._sin_compactar:
+                with self.bloqueo_escritura():
+                    self.sincronizar()
+                    self._guardar_usuarios()
+                    self._firma = self._firma_archivos()
+
+    # --- ESCRITURA EN DISCO ---
+
+    def _cerrar_log(self):
+        if self._archivo_registros is not None:
+            self._fsync_log()
+            self._archivo_registros.close()
+            self._archivo_registros = None
+
+    def _fsync_log(self):
+        self._archivo_registros.flush()
+        os.fsync(self._archivo_registros.fileno())
+        self._sin_fsync = 0
+        self._ultimo_fsync = time.monotonic()
+
+    @metricas_proceso.medir('uconnect_csv_segundos', operacion='anexar')
+    def _anexar_registros(self, filas):
+        """Agrega filas al final de registros.csv. El fsync se agrupa por cantidad o tiempo."""
+        if self._archivo_registros is None:
+            nuevo = not os.path.exists(self.ruta_registros) or os.path.getsize(self.ruta_registros) == 0
+            # Si el archivo no termina en salto de línea, la primera fila anexada se pegaría a la última
+            sin_salto = False
+            if not nuevo:
+                with open(self.ruta_registros, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    sin_salto = f.read(1) != b'\n'
+            self._archivo_registros = open(self.ruta_registros, 'a', newline='', encoding='utf-8')
+            if nuevo:
+                csv.writer(self._archivo_registros, lineterminator='\n').writerow(COLUMNAS_REGISTROS)
+            elif sin_salto:
+                self._archivo_registros.write('\n')
+
+        escritor = csv.writer(self._archivo_registros, lineterminator='\n')
+        for fila in filas:
+            escritor.writerow([fila.get(col) for col in COLUMNAS_REGISTROS])
+        # flush: otros procesos ven la fila de inmediato; fsync: durabilidad agrupada
+        self._archivo_registros.flush()
+        self._offset_registros = self._archivo_registros.tell()
+        self._sin_fsync += len(filas)
+
+        if (self._sin_fsync >= FSYNC_CADA_N_REGISTROS
+                or time.monotonic() - self._ultimo_fsync >= FSYNC_CADA_SEGUNDOS):
+            self._fsync_log()
+
+    def _anexar_lote(self, df_logs):
+        """Agrega un DataFrame completo a registros.csv con una sola escritura y un fsync."""
+        if df_logs.empty:
+            return
+        self._anexar_registros([])  # abre el log (y escribe la cabecera si hace falta)
+        df_logs[COLUMNAS_REGISTROS].to_csv(self._archivo_registros, header=False, index=False, lineterminator='\n')
+        self._fsync_log()
+        self._offset_registros = self._archivo_registros.tell()
+
+    def _guardar_usuarios(self):
+        """Compacta: reescribe usuarios.csv con el xp_total en memoria y su punto de control."""
+        # El control no puede apuntar a filas del log que todavía no están en disco
+        if self._archivo_registros is not None:
+            self._fsync_log()
+        guardar_punto_control(self.usuarios(), self._offset_registros, self.ruta_usuarios, self.ruta_registros)
+        self._sin_compactar = 0
+        self._control_pendiente = False
+
+    def _asegurar_punto_control(self):
+        """Antes de anexar registros: sin un punto de control válido, su XP no se recuperaría al cargar."""
+        if self._control_pendiente:
+            self._guardar_usuarios()
+
+    def _compactar_si_toca(self, registros):
+        self._sin_compactar += registros
+        if self._sin_compactar >= COMPACTAR_CADA_N_REGISTROS:
+            self._guardar_usuarios()
+
+    def _anexar_usuario(self, fila):
+        """Agrega un usuario nuevo al final de usuarios.csv (sin reescribir el resto)."""
+        if (self._control_pendiente or not os.path.exists(self.ruta_usuarios)
+                or os.path.getsize(self.ruta_usuarios) == 0):
+            self._guardar_usuarios()
+            return
+        with open(self.ruta_usuarios, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f, lineterminator='\n').writerow([fila[col] for col in COLUMNAS_USUARIOS])
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- LECTURAS (no copian: tratar como solo lectura) ---
+
+    def usuarios(self):
+        with self._lock:
+            if self._df_usuarios is None:
+                self._df_usuarios = pd.DataFrame(list(self._usuarios.values()), columns=COLUMNAS_USUARIOS)
+            return self._df_usuarios
+
+    def _registros_en_memoria(self):
+        with self._lock:
+            if self._registros_pendientes:
+                nuevos = pd.DataFrame(self._registros_pendientes, columns=COLUMNAS_REGISTROS)
+                self._df_registros = pd.concat([self._df_registros, nuevos], ignore_index=True)
+                self._registros_pendientes = []
+            return self._df_registros
+
+    def registros(self, desde=None, columnas=None):
+        df_r = self._registros_en_memoria()
+        if desde is not None:
+            # El formato '%Y-%m-%d %H:%M:%S' se ordena igual como texto que como fecha
+            df_r = df_r[df_r['fecha_registro'].astype(str) > desde.strftime('%Y-%m-%d %H:%M:%S')]
+        return df_r if columnas is None else df_r[columnas]
+
+    def buscar_usuario(self, telegram_id):
+        usuario = self._usuarios.get(telegram_id)
+        return dict(usuario) if usuario is not None else None
+
+    def registros_existentes(self, log_ids):
+        with self._lock:
+            return {log_id for log_id in log_ids if log_id in self._log_ids}
+
+    # --- ESCRITURAS ---
+
+    def agregar_usuario(self, nuevo_usuario):
+        with self._lock:
+            # Verificar e insertar bajo el mismo lock: dos registros simultáneos no pueden duplicarse
+            telegram_id = int(nuevo_usuario['telegram_id'])
+            if telegram_id in self._usuarios:
+                return False
+            fila = {col: nuevo_usuario.get(col) for col in COLUMNAS_USUARIOS}
+            self._usuarios[telegram_id] = fila
+            self._df_usuarios = None
+            self._anexar_usuario(fila)
+            self._firma = self._firma_archivos()
+            return True
+
+    def agregar_registro(self, nuevo_log):
+        with self._lock:
+            usuario = self._usuarios.get(nuevo_log['telegram_id'])
+            if usuario is None:
+                return None
+
+            # 1. Anexar al log (una línea, sin reescribir el historial). La línea lleva el XP:
+            # queda en disco con el fsync del log y usuarios.csv no se reescribe
+            self._asegurar_punto_control()
+            self._anexar_registros([nuevo_log])
+            self._registros_pendientes.append(nuevo_log)
+            self._log_ids.add(nuevo_log['log_id'])
+
+            # 2. Actualizar el XP total en memoria (se compacta a usuarios.csv cada tanto)
+            usuario['xp_total'] = int(usuario['xp_total']) + int(nuevo_log['xp_ganado'])
+            self._df_usuarios = None
+            self._compactar_si_toca(1)
+
+            self._firma = self._firma_archivos()
+            return usuario['xp_total']
+
+    def agregar_registros(self, df_logs):
+        with self._lock:
+            # 1. Descartar filas de usuarios inexistentes (vectorizado)
+            df_logs = df_logs[df_logs['telegram_id'].isin(self._usuarios.keys())]
+            if df_logs.empty:
+                return {}
+
+            # 2. Anexar el lote completo al log y a la copia en memoria
+            self._asegurar_punto_control()
+            self._anexar_lote(df_logs)
+            self._df_registros = pd.concat([self._registros_en_memoria(), df_logs[COLUMNAS_REGISTROS]], ignore_index=True)
+            self._log_ids.update(df_logs['log_id'])
+
+            # 3. Una sola agregación por usuario (usuarios.csv se compacta cada tanto)
+            xp_por_usuario = df_logs.groupby('telegram_id')['xp_ganado'].sum()
+            totales = {}
+            for telegram_id, xp in xp_por_usuario.items():
+                usuario = self._usuarios[int(telegram_id)]
+                usuario['xp_total'] = int(usuario['xp_total']) + int(xp)
+                totales[int(telegram_id)] = usuario['xp_total']
+            self._df_usuarios = None
+            self._compactar_si_toca(len(df_logs))
+
+            self._firma = self._firma_archivos()
+            return totales
+
+    def actualizar_ligas(self, ligas):
+        with self._lock:
+            for telegram_id, liga in ligas.items():
+                usuario = self._usuarios.get(telegram_id)
+                if usuario is not None:
+                    usuario['liga_actual'] = liga
+            self._df_usuarios = None
+            self._guardar_usuarios()
+            self._firma = self._firma_archivos()
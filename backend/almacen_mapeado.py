@@ -0,0 +1,115 @@
+import os
+
+import pandas as pd
+
+from almacen import (AlmacenCSV, COLUMNAS_REGISTROS, USUARIOS_CSV, REGISTROS_XP_CSV, leer_fechas,
+                     leer_final_csv, leer_punto_control)
+from columnar import CARPETA_COLUMNAR, ARCHIVO_MANIFIESTO, HistorialMapeado, bytes_sin_indexar, indexar_csv
+
+# --- CONFIGURACIÓN ---
+# Cuando la parte de registros.csv sin indexar supera esto, se convierte en segmentos
+BYTES_COLA_MAXIMA = 4 * 1024 * 1024
+
+
+class AlmacenMapeado(AlmacenCSV):
+    """
+    Como AlmacenCSV, pero el historial de registros no se copia en la memoria de cada
+    proceso: se lee de los segmentos columnares mapeados (columnar.HistorialMapeado),
+    que todos los workers comparten a través del page cache.
+
+    registros.csv sigue siendo el log de solo-anexar y la fuente de verdad. En memoria
+    solo queda la cola: las filas que los segmentos todavía no cubren. Cuando la cola
+    supera BYTES_COLA_MAXIMA se indexa y los demás procesos la ven al recargar (el
+    manifiesto forma parte de la firma de archivos).
+    """
+
+    def __init__(self, ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV, carpeta=CARPETA_COLUMNAR):
+        self.historial = HistorialMapeado(carpeta)
+        super().__init__(ruta_usuarios, ruta_registros)
+
+    def _firma_archivos(self):
+        ruta = os.path.join(self.historial.carpeta, ARCHIVO_MANIFIESTO)
+        try:
+            st = os.stat(ruta)
+            manifiesto = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            manifiesto = None
+        return super()._firma_archivos() + (manifiesto,)
+
+    def cargar(self):
+        """Lee usuarios.csv, indexa si la cola creció demasiado, mapea los segmentos y lee la cola."""
+        with self._lock:
+            self._cerrar_log()
+            punto = leer_punto_control(self.ruta_usuarios, self.ruta_registros)
+            if bytes_sin_indexar(self.ruta_registros, carpeta=self.historial.carpeta) > BYTES_COLA_MAXIMA:
+                indexar_csv(self.ruta_registros, self.historial.carpeta, minimo_bytes=BYTES_COLA_MAXIMA)
+            self.historial.actualizar()
+            # La cola se lee desde el byte que cubre la versión mapeada: si otro proceso
+            # indexa después, el CSV sigue igual hasta ahí y no se pierde ni repite nada
+            df_cola, self._offset_registros = leer_final_csv(self.ruta_registros, self.historial.offset_csv)
+            self._cargar_registros(df_cola)
+            self._cargar_punto_control(punto)
+            self._firma = self._firma_archivos()
+
+    def guardar(self):
+        """Reescribe usuarios.csv; registros.csv ya está al día (solo se anexa) y no se toca."""
+        with self._lock:
+            self._anexar_registros([])  # crea registros.csv con su cabecera si no existe
+            self._cerrar_log()
+            self._guardar_usuarios()
+            self._firma = self._firma_archivos()
+
+    def _leer_registros_ajenos(self, firma_registros):
+        if self._log_reescrito(firma_registros) or not self.historial.actualizar():
+            return super()._leer_registros_ajenos(firma_registros)
+        # Otro proceso indexó: la cola ahora empieza donde termina el historial nuevo.
+        # El manifiesto se lee antes que el CSV, así que lo indexado ya está en el archivo.
+        nuevos, fin = leer_final_csv(self.ruta_registros, self._offset_registros)
+        df_cola, _ = leer_final_csv(self.ruta_registros, self.historial.offset_csv, fin)
+        self._cargar_registros(df_cola)
+        self._offset_registros = fin
+        return nuevos
+
+    def _indexar_si_crece(self):
+        """Tras una escritura: si la cola en memoria creció demasiado, se indexa y se acorta."""
+        if self._offset_registros - self.historial.offset_csv <= 2 * BYTES_COLA_MAXIMA:
+            return
+        indexar_csv(self.ruta_registros, self.historial.carpeta, minimo_bytes=BYTES_COLA_MAXIMA)
+        if self.historial.actualizar():
+            df_cola, _ = leer_final_csv(self.ruta_registros, self.historial.offset_csv, self._offset_registros)
+            self._cargar_registros(df_cola)
+
+    def registros(self, desde=None, columnas=None):
+        """
+        Historial mapeado más la cola, con fecha_registro como datetime64. El historial
+        solo lee las columnas pedidas; pedir log_id obliga a decodificarlo.
+        """
+        columnas = list(columnas or COLUMNAS_REGISTROS)
+        cola = super().registros(desde, columnas)
+        if 'fecha_registro' in columnas:
+            cola = cola.assign(fecha_registro=leer_fechas(cola['fecha_registro']))
+        historial = self.historial.leer(desde=desde, columnas=columnas)
+        if cola.empty:
+            return historial
+        return pd.concat([historial, cola], ignore_index=True)
+
+    def registros_existentes(self, log_ids):
+        with self._lock:
+            en_cola = {log_id for log_id in log_ids if log_id in self._log_ids}
+        resto = [log_id for log_id in log_ids if log_id not in en_cola]
+        historial = self.historial.contiene(resto)
+        return en_cola | {log_id for log_id in resto if str(log_id) in historial}
+
+    def agregar_registro(self, nuevo_log):
+        with self._lock:
+            xp_total = super().agregar_registro(nuevo_log)
+            if xp_total is not None:
+                self._indexar_si_crece()
+            return xp_total
+
+    def agregar_registros(self, df_logs):
+        with self._lock:
+            totales = super().agregar_registros(df_logs)
+            if totales:
+                self._indexar_si_crece()
+            return totales
@@ -0,0 +1,297 @@
+import pandas as pd
+import argparse
+import sqlite3
+import threading
+
+from almacen import (Almacen, COLUMNAS_REGISTROS, USUARIOS_CSV, REGISTROS_XP_CSV, cargar_dataframes, leer_final_csv,
+                     leer_punto_control)
+
+# --- CONFIGURACIÓN ---
+SQLITE_DB = 'database/uconnect.db'
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    telegram_id    INTEGER PRIMARY KEY,
+    nombre         TEXT,
+    xp_total       INTEGER NOT NULL DEFAULT 0,
+    liga_actual    TEXT,
+    fecha_creacion TEXT
+);
+
+CREATE TABLE IF NOT EXISTS registros (
+    log_id         TEXT PRIMARY KEY,
+    telegram_id    INTEGER NOT NULL,
+    xp_ganado      INTEGER NOT NULL,
+    tipo_actividad TEXT,
+    fecha_registro TEXT NOT NULL,
+    valor          REAL
+);
+
+-- Historial de un usuario ordenado por fecha (perfil, rachas)
+CREATE INDEX IF NOT EXISTS idx_registros_usuario_fecha ON registros (telegram_id, fecha_registro);
+-- Filtros por rango de fechas (rankings)
+CREATE INDEX IF NOT EXISTS idx_registros_fecha ON registros (fecha_registro);
+"""
+
+
+class AlmacenSQLite(Almacen):
+    """
+    Almacén sobre una base SQLite embebida en modo WAL.
+    WAL permite lectores concurrentes mientras un escritor confirma, y cada
+    escritura (registro + suma de XP) es una sola transacción.
+
+    Los usuarios se leen siempre de la base; para lo que el proceso mantiene en
+    memoria (rankings, agregados) sincronizar() entrega los registros que otros
+    procesos insertaron, según el rowid.
+    """
+
+    def __init__(self, ruta_db=SQLITE_DB):
+        self.ruta_db = ruta_db
+        self.ruta_bloqueo = f"{ruta_db}.escritura.lock"
+        self._lock_escritura = threading.Lock()
+        # sqlite3 no permite compartir una conexión entre hilos: una por hilo
+        self._local = threading.local()
+        with self._conexion() as con:
+            con.executescript(ESQUEMA)
+            # Bases creadas antes de la columna 'valor'
+            columnas = [fila['name'] for fila in con.execute("PRAGMA table_info(registros)")]
+            if 'valor' not in columnas:
+                con.execute("ALTER TABLE registros ADD COLUMN valor REAL")
+        # Último rowid de registros ya reflejado en este proceso (propio o sincronizado)
+        self._lock_sincronizar = threading.Lock()
+        self._ultimo_rowid = self._maximo_rowid(self._conexion())
+
+    @staticmethod
+    def _maximo_rowid(con):
+        return con.execute("SELECT MAX(rowid) FROM registros").fetchone()[0] or 0
+
+    def _conexion(self):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(self.ruta_db, timeout=30)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            # NORMAL es durable ante caídas del proceso y mucho más rápido que FULL en WAL
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def cerrar(self):
+        con = getattr(self._local, 'con', None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+    def sincronizar(self):
+        with self._lock_sincronizar:
+            con = self._conexion()
+            if self._maximo_rowid(con) == self._ultimo_rowid:
+                return False, None
+            nuevos = pd.read_sql_query(
+                "SELECT rowid AS fila, * FROM registros WHERE rowid > ? ORDER BY rowid",
+                con, params=(self._ultimo_rowid,),
+            )
+            self._ultimo_rowid = int(nuevos['fila'].iloc[-1])
+            return True, nuevos.drop(columns='fila')
+
+    # --- LECTURAS ---
+
+    def usuarios(self):
+        return pd.read_sql_query("SELECT * FROM usuarios", self._conexion())
+
+    def registros(self, desde=None, columnas=None):
+        # Los nombres de columna vienen de COLUMNAS_REGISTROS, nunca del usuario
+        seleccion = ', '.join(c for c in COLUMNAS_REGISTROS if c in columnas) if columnas else '*'
+        if desde is None:
+            df = pd.read_sql_query(f"SELECT {seleccion} FROM registros", self._conexion())
+        else:
+            df = pd.read_sql_query(
+                f"SELECT {seleccion} FROM registros WHERE fecha_registro > ?",
+                self._conexion(),
+                params=(desde.strftime('%Y-%m-%d %H:%M:%S'),),
+            )
+        return df if columnas is None else df[columnas]
+
+    def buscar_usuario(self, telegram_id):
+        fila = self._conexion().execute(
+            "SELECT * FROM usuarios WHERE telegram_id = ?", (telegram_id,)
+        ).fetchone()
+        return dict(fila) if fila is not None else None
+
+    def registros_existentes(self, log_ids):
+        # Búsqueda por clave primaria, por tramos (límite de parámetros de SQLite)
+        log_ids = list(log_ids)
+        existentes = set()
+        for i in range(0, len(log_ids), 900):
+            tramo = log_ids[i:i + 900]
+            filas = self._conexion().execute(
+                f"SELECT log_id FROM registros WHERE log_id IN ({','.join('?' * len(tramo))})", tramo
+            ).fetchall()
+            existentes.update(fila[0] for fila in filas)
+        return existentes
+
+    # --- ESCRITURAS ---
+
+    def agregar_usuario(self, nuevo_usuario):
+        try:
+            with self._conexion() as con:
+                con.execute(
+                    "INSERT INTO usuarios (telegram_id, nombre, xp_total, liga_actual, fecha_creacion) "
+                    "VALUES (:telegram_id, :nombre, :xp_total, :liga_actual, :fecha_creacion)",
+                    nuevo_usuario,
+                )
+        except sqlite3.IntegrityError:
+            # La clave primaria rechaza el duplicado
+            return False
+        return True
+
+    def agregar_registro(self, nuevo_log):
+        with self._lock_sincronizar:
+            return self._agregar_registro(nuevo_log)
+
+    def _agregar_registro(self, nuevo_log):
+        con = self._conexion()
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer el XP
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = con.execute(
+                "UPDATE usuarios SET xp_total = xp_total + ? WHERE telegram_id = ?",
+                (nuevo_log['xp_ganado'], nuevo_log['telegram_id']),
+            )
+            if cursor.rowcount == 0:
+                con.rollback()
+                return None
+
+            con.execute(
+                "INSERT INTO registros (log_id, telegram_id, xp_ganado, tipo_actividad, fecha_registro, valor) "
+                "VALUES (:log_id, :telegram_id, :xp_ganado, :tipo_actividad, :fecha_registro, :valor)",
+                {'valor': None, **nuevo_log},
+            )
+            xp_total = con.execute(
+                "SELECT xp_total FROM usuarios WHERE telegram_id = ?", (nuevo_log['telegram_id'],)
+            ).fetchone()[0]
+            ultimo_rowid = self._maximo_rowid(con)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        # Lo propio no vuelve como ajeno en sincronizar()
+        self._ultimo_rowid = ultimo_rowid
+        return int(xp_total)
+
+    def agregar_registros(self, df_logs):
+        with self._lock_sincronizar:
+            return self._agregar_registros(df_logs)
+
+    def _agregar_registros(self, df_logs):
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # 1. Descartar filas de usuarios inexistentes
+            ids = [int(i) for i in df_logs['telegram_id'].unique()]
+            existentes = set()
+            # SQLite limita la cantidad de parámetros por consulta: se consulta por tramos
+            for i in range(0, len(ids), 900):
+                tramo = ids[i:i + 900]
+                filas = con.execute(
+                    f"SELECT telegram_id FROM usuarios WHERE telegram_id IN ({','.join('?' * len(tramo))})", tramo
+                ).fetchall()
+                existentes.update(fila[0] for fila in filas)
+            df_logs = df_logs[df_logs['telegram_id'].isin(existentes)]
+            if df_logs.empty:
+                con.rollback()
+                return {}
+
+            # 2. Insertar el lote y sumar el XP agrupado por usuario, en la misma transacción
+            con.executemany(
+                "INSERT INTO registros (log_id, telegram_id, xp_ganado, tipo_actividad, fecha_registro, valor) VALUES (?, ?, ?, ?, ?, ?)",
+                df_logs[COLUMNAS_REGISTROS].astype(object).itertuples(index=False, name=None),
+            )
+            xp_por_usuario = df_logs.groupby('telegram_id')['xp_ganado'].sum()
+            con.executemany(
+                "UPDATE usuarios SET xp_total = xp_total + ? WHERE telegram_id = ?",
+                [(int(xp), int(telegram_id)) for telegram_id, xp in xp_por_usuario.items()],
+            )
+            totales = {}
+            for telegram_id in xp_por_usuario.index:
+                totales[int(telegram_id)] = con.execute(
+                    "SELECT xp_total FROM usuarios WHERE telegram_id = ?", (int(telegram_id),)
+                ).fetchone()[0]
+            ultimo_rowid = self._maximo_rowid(con)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        self._ultimo_rowid = ultimo_rowid
+        return totales
+
+    def actualizar_ligas(self, ligas):
+        with self._conexion() as con:
+            con.executemany(
+                "UPDATE usuarios SET liga_actual = ? WHERE telegram_id = ?",
+                [(liga, int(telegram_id)) for telegram_id, liga in ligas.items()],
+            )
+
+
+# --- MIGRACIÓN DESDE CSV ---
+
+def migrar_desde_csv(ruta_db=SQLITE_DB, ruta_usuarios=USUARIOS_CSV, ruta_registros=REGISTROS_XP_CSV, forzar=False):
+    """
+    Copia usuarios.csv y registros.csv a la base SQLite (una sola vez).
+    Si la base ya tiene usuarios no hace nada, salvo que forzar=True.
+    Devuelve (usuarios_migrados, registros_migrados), o None si no se migró.
+    """
+    almacen = AlmacenSQLite(ruta_db)
+    con = almacen._conexion()
+
+    if not forzar and con.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0] > 0:
+        print(f"La base {ruta_db} ya tiene usuarios; no se migra (usa --forzar para hacerlo igual).")
+        return None
+
+    df_u, offset, _ = leer_punto_control(ruta_usuarios, ruta_registros)
+    _, df_r = cargar_dataframes(None, ruta_registros)
+
+    # Los CSV pueden traer IDs repetidos: se conserva la primera aparición
+    duplicados = df_u['telegram_id'].duplicated()
+    if duplicados.any():
+        print(f"Advertencia: se omiten {int(duplicados.sum())} usuarios con telegram_id repetido.")
+    df_u = df_u[~duplicados]
+    df_u = df_u.assign(xp_total=pd.to_numeric(df_u['xp_total'], errors='coerce').fillna(0).astype('int64'))
+    # usuarios.csv es un punto de control: falta el XP de los registros posteriores
+    if offset is not None:
+        posteriores, _ = leer_final_csv(ruta_registros, offset)
+        xp = posteriores.groupby('telegram_id')['xp_ganado'].sum()
+        df_u = df_u.assign(xp_total=df_u['xp_total'] + df_u['telegram_id'].map(xp).fillna(0).astype('int64'))
+    df_r = df_r.assign(log_id=df_r['log_id'].astype(str))
+
+    with con:
+        antes_u = con.total_changes
+        con.executemany(
+            "INSERT OR IGNORE INTO usuarios (telegram_id, nombre, xp_total, liga_actual, fecha_creacion) VALUES (?, ?, ?, ?, ?)",
+            df_u[['telegram_id', 'nombre', 'xp_total', 'liga_actual', 'fecha_creacion']].itertuples(index=False, name=None),
+        )
+        n_usuarios = con.total_changes - antes_u
+        antes_r = con.total_changes
+        con.executemany(
+            "INSERT OR IGNORE INTO registros (log_id, telegram_id, xp_ganado, tipo_actividad, fecha_registro, valor) VALUES (?, ?, ?, ?, ?, ?)",
+            df_r[COLUMNAS_REGISTROS].astype(object).itertuples(index=False, name=None),
+        )
+        n_registros = con.total_changes - antes_r
+
+    almacen.cerrar()
+    return n_usuarios, n_registros
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migra los CSV de UConnect a una base SQLite.")
+    parser.add_argument('--db', default=SQLITE_DB, help="Ruta de la base SQLite de destino")
+    parser.add_argument('--usuarios', default=USUARIOS_CSV)
+    parser.add_argument('--registros', default=REGISTROS_XP_CSV)
+    parser.add_argument('--forzar', action='store_true', help="Migrar aunque la base ya tenga datos")
+    args = parser.parse_args()
+
+    resultado = migrar_desde_csv(args.db, args.usuarios, args.registros, args.forzar)
+    if resultado is not None:
+        n_u, n_r = resultado
+        print(f"Migración completa: {n_u} usuarios y {n_r} registros copiados a {args.db}.")
+        print("Inicia la API con UCONNECT_ALMACEN=sqlite para usarla.")
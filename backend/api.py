@@ -1,60 +1,131 @@
 import pandas as pd
+import numpy as np
 from flask import Flask, request, jsonify
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+import io
 import os
+import sys
 import uuid # Para generar IDs de log únicos de forma sencilla
 
+from almacen import crear_almacen
+from cache import CacheRespuestas
+from rankings import MotorRankings, PERIODOS
+from idempotencia import IndiceIdempotencia
+from agregados import AgregadosUsuarios
+from alertas import MotorAlertas, RegistroAlertas
+from snapshots import generar_snapshots, leer_snapshot
+# metricas.py vive en la raíz del repo y lo comparten la API, el frontend y el bot
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metricas import metricas_proceso, registrar_flask
+from perfilador import registrar_perfilador
+
 # --- CONFIGURACIÓN ---
 app = Flask(__name__)
-# Rutas relativas a la carpeta 'database'
-USUARIOS_CSV = 'database/usuarios.csv'
-REGISTROS_XP_CSV = 'database/registros.csv'
 
-# Asegurar que la carpeta 'database' exista al inicio
-if not os.path.exists('database'):
-    os.makedirs('database')
+# Tiempo, tamaños y errores de cada ruta, publicados en /metrics (antes que los demás before_request)
+registrar_flask(app, metricas_proceso)
+# Pilas de las peticiones lentas o pedidas con X-Perfilar; solo con UCONNECT_PERFILAR (ver perfilador.py)
+perfilador = registrar_perfilador(app)
+# La carga inicial (leer el almacén, reconstruir rankings y agregados) también se perfila si es lenta
+perfil_inicio = perfilador.iniciar() if perfilador is not None else None
+
+# Almacén compartido por todo el proceso (CSV en memoria o SQLite, ver UCONNECT_ALMACEN).
+# Las rutas solo usan la interfaz de almacen.Almacen.
+almacen = crear_almacen()
+
+# Rankings por periodo mantenidos en memoria; se reconstruyen solo al iniciar o al recargar
+rankings = MotorRankings()
+
+
+def reconstruir_rankings():
+    desde = datetime.now() - timedelta(days=max(PERIODOS.values()))
+    rankings.reconstruir(almacen.registros(desde=desde, columnas=['telegram_id', 'xp_ganado', 'fecha_registro']))
+
+reconstruir_rankings()
+
+# Agregados por usuario (XP por tipo, rachas, sumas de la semana), actualizados en cada escritura
+agregados = AgregadosUsuarios()
+# Alertas de bienestar (sueño, asistencia, estudio) evaluadas al registrar cada actividad.
+# Las emitidas se anotan en un archivo compartido por todos los workers, que es lo que lee /api/alertas
+alertas = MotorAlertas()
+registro_alertas = RegistroAlertas()
+
+
+def reconstruir_agregados():
+    # Todo menos log_id, que ninguno de los dos usa
+    registros = almacen.registros(columnas=['telegram_id', 'xp_ganado', 'tipo_actividad', 'fecha_registro', 'valor'])
+    agregados.reconstruir(registros)
+    alertas.reconstruir(registros)
+
+reconstruir_agregados()
+
+if perfil_inicio is not None:
+    perfilador.terminar(perfil_inicio, 'inicio')
+
+# log_id ya registrados: un reintento del cliente devuelve el resultado original sin volver a sumar XP
+indice_eventos = IndiceIdempotencia(almacen)
+
+# Máximo de eventos aceptados en una sola llamada a /api/registrar_actividades
+MAX_EVENTOS_LOTE = 200_000
+# 'codigo' de cada evento rechazado en ese resultado, para que los clientes no dependan del texto del error:
+# un usuario desconocido puede registrarse después (se reintenta); un evento inválido no cambia al reenviarlo
+CODIGO_VALIDACION = 'VALIDACION'
+CODIGO_USUARIO_NO_ENCONTRADO = 'USUARIO_NO_ENCONTRADO'
+# Registros de otros procesos que se suman uno a uno al sincronizar; sobre esto se usan
+# las rutas por lote (con pocos registros, armar los DataFrames cuesta más que sumar)
+MAX_AJENOS_UNO_A_UNO = 64
+
+# Cache de respuestas de lectura (perfil y rankings); las escrituras invalidan lo afectado
+cache = CacheRespuestas()
 
-# --- FUNCIONES DE MANEJO DE DATOS ---
+# Serie de XP por día del dashboard: por defecto una semana, como mucho la ventana más larga
+DIAS_SERIE_DASHBOARD = 7
+MAX_DIAS_SERIE = max(PERIODOS.values())
 
-def cargar_dataframes():
+
+def invalidar_cache_actividad(*telegram_ids):
+    """Una actividad cambia el perfil de su usuario y todas las ventanas de ranking."""
+    cache.invalidar(*[('perfil', telegram_id) for telegram_id in telegram_ids])
+    cache.invalidar(*[('ranking', periodo) for periodo in PERIODOS])
+
+
+@app.before_request
+def sincronizar_almacen():
     """
-    Carga los DataFrames desde los archivos CSV. 
-    Implementa lógica robusta para manejar archivos vacíos o inexistentes.
+    Si otro proceso (otro worker de servidor.py, un script) escribió, se suman sus
+    registros a rankings, agregados y alertas; solo si hubo que recargar todo se reconstruyen.
+    Las alertas de esos registros ya las emitió el proceso que los escribió: aquí solo
+    se actualiza el estado (emitir=False).
     """
-    
-    # Definición de DataFrames vacíos con las columnas esperadas
-    columnas_usuarios = ['telegram_id', 'nombre', 'xp_total', 'liga_actual', 'fecha_creacion']
-    df_u = pd.DataFrame(columns=columnas_usuarios)
-    
-    columnas_registros = ['log_id', 'telegram_id', 'xp_ganado', 'tipo_actividad', 'fecha_registro']
-    df_r = pd.DataFrame(columns=columnas_registros)
-    
-    # 1. Manejo del DataFrame de Usuarios
-    if os.path.exists(USUARIOS_CSV) and os.path.getsize(USUARIOS_CSV) > 0:
-        try:
-            df_u = pd.read_csv(USUARIOS_CSV)
-        except pd.errors.EmptyDataError:
-            # Si el archivo tiene encabezado pero no datos, o falló la lectura: 
-            # se queda con el DataFrame vacío inicializado
-            print(f"Advertencia: El archivo {USUARIOS_CSV} existe pero está vacío o es ilegible. Inicializando un DataFrame vacío.")
-            pass # df_u ya está inicializado arriba
-
-    # 2. Manejo del DataFrame de Registros
-    if os.path.exists(REGISTROS_XP_CSV) and os.path.getsize(REGISTROS_XP_CSV) > 0:
-        try:
-            df_r = pd.read_csv(REGISTROS_XP_CSV)
-        except pd.errors.EmptyDataError:
-            # Si el archivo tiene encabezado pero no datos, o falló la lectura:
-            # se queda con el DataFrame vacío inicializado
-            print(f"Advertencia: El archivo {REGISTROS_XP_CSV} existe pero está vacío o es ilegible. Inicializando un DataFrame vacío.")
-            pass # df_r ya está inicializado arriba
-        
-    return df_u, df_r
-
-def guardar_dataframes(df_u, df_r):
-    """Guarda los DataFrames en los archivos CSV."""
-    df_u.to_csv(USUARIOS_CSV, index=False)
-    df_r.to_csv(REGISTROS_XP_CSV, index=False)
+    cambio, nuevos = almacen.sincronizar()
+    if not cambio:
+        return
+    if nuevos is None:
+        reconstruir_rankings()
+        reconstruir_agregados()
+    elif len(nuevos) <= MAX_AJENOS_UNO_A_UNO:
+        for telegram_id, xp, tipo_actividad, fecha, valor in nuevos[
+                ['telegram_id', 'xp_ganado', 'tipo_actividad', 'fecha_registro', 'valor']].itertuples(index=False):
+            rankings.registrar(int(telegram_id), int(xp), datetime.strptime(fecha, '%Y-%m-%d %H:%M:%S'))
+            agregados.registrar(int(telegram_id), tipo_actividad, int(xp), fecha, valor)
+            alertas.procesar(int(telegram_id), tipo_actividad, fecha, valor, emitir=False)
+    else:
+        rankings.registrar_lote(nuevos)
+        agregados.registrar_lote(nuevos)
+        alertas.procesar_lote(nuevos, emitir=False)
+    cache.limpiar()
+
+
+@contextmanager
+def escritura_exclusiva():
+    """
+    Una escritura a la vez entre todos los procesos, y sobre datos al día: sin esto dos
+    workers con AlmacenCSV reescribirían usuarios.csv cada uno con su copia en memoria.
+    """
+    with almacen.bloqueo_escritura():
+        sincronizar_almacen()
+        yield
 
 # --- ENDPOINTS DE LA API ---
 
@@ -69,6 +140,9 @@ def registrar_actividad():
     """
     Ruta para que el bot de Telegram envíe un registro de actividad.
     Datos esperados en el cuerpo JSON: telegram_id, tipo_actividad, xp_a_sumar
+    y opcionalmente log_id (UUID generado por el cliente) y valor (minutos de estudio,
+    horas de sueño). Con log_id la ruta es idempotente: repetir la petición devuelve
+    el resultado original sin sumar XP.
     """
     data = request.json
     
@@ -83,83 +157,268 @@ def registrar_actividad():
         tipo_actividad = data['tipo_actividad']
     except ValueError:
         return jsonify({"error": "telegram_id y xp_a_sumar deben ser números enteros."}), 400
+    try:
+        valor = float(data['valor']) if data.get('valor') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "valor debe ser un número."}), 400
 
-    # 1. Cargar DataFrames
-    df_usuarios, df_registros = cargar_dataframes()
-    
-    # Buscar el usuario
-    idx = df_usuarios[df_usuarios['telegram_id'] == telegram_id].index
-    
-    if idx.empty:
-        return jsonify({"error": f"Usuario con ID {telegram_id} no encontrado. Debe registrarse primero."}), 404
-
-    # 2. Registrar la actividad (Append a Registros_XP)
+    # 1. Registrar la actividad (Append a Registros_XP)
+    ahora = datetime.now()
     nuevo_log = {
-        'log_id': str(uuid.uuid4()), # Usar UUID como log_id único
+        'log_id': str(data.get('log_id') or uuid.uuid4()), # UUID del cliente, o uno nuevo
         'telegram_id': telegram_id,
         'xp_ganado': xp_a_sumar,
         'tipo_actividad': tipo_actividad,
-        'fecha_registro': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'fecha_registro': ahora.strftime('%Y-%m-%d %H:%M:%S'),
+        'valor': valor,
     }
-    # Concatenar el nuevo registro
-    df_registros = pd.concat([df_registros, pd.DataFrame([nuevo_log])], ignore_index=True)
 
-    # 3. Actualizar el XP total del usuario (Update en Usuarios)
-    # Convertimos a float para asegurar operaciones, aunque luego se devuelva como int
-    df_usuarios.loc[idx, 'xp_total'] = df_usuarios.loc[idx, 'xp_total'].astype(float) + xp_a_sumar
+    with escritura_exclusiva(), indice_eventos.bloqueo:
+        # 2. Si el log_id ya se registró es un reintento: devolver el resultado original
+        previo = indice_eventos.buscar([nuevo_log['log_id']])
+        if previo:
+            return jsonify(resultado_duplicado(nuevo_log['log_id'], previo[nuevo_log['log_id']], telegram_id, xp_a_sumar)), 200
+
+        # 3. El almacén añade el registro, suma el XP al usuario y lo persiste
+        xp_total_actual = almacen.agregar_registro(nuevo_log)
 
-    # 4. Guardar los archivos
-    guardar_dataframes(df_usuarios, df_registros)
+        if xp_total_actual is None:
+            return jsonify({"error": f"Usuario con ID {telegram_id} no encontrado. Debe registrarse primero."}), 404
+        indice_eventos.recordar(nuevo_log['log_id'], telegram_id, xp_a_sumar, xp_total_actual)
+        # Alertas dentro del bloqueo: los ids del registro compartido no se repiten entre workers
+        registro_alertas.anotar(alertas.procesar(telegram_id, tipo_actividad, nuevo_log['fecha_registro'], valor))
+
+    # 4. Sumar la actividad a los rankings y agregados en memoria y descartar respuestas viejas
+    rankings.registrar(telegram_id, xp_a_sumar, ahora)
+    agregados.registrar(telegram_id, tipo_actividad, xp_a_sumar, nuevo_log['fecha_registro'], valor)
+    invalidar_cache_actividad(telegram_id)
 
     return jsonify({
         "status": "success",
+        "log_id": nuevo_log['log_id'],
         "xp_ganado": xp_a_sumar,
-        "xp_total_actual": int(df_usuarios.loc[idx, 'xp_total'].iloc[0]) # Devolver el nuevo total
+        "xp_total_actual": xp_total_actual # Devolver el nuevo total
     }), 200
 
-## 2. GET: Obtener Ranking Semanal
-@app.route('/api/ranking_semanal', methods=['GET'])
-def obtener_ranking_semanal():
+
+def resultado_duplicado(log_id, previo, telegram_id, xp_ganado):
     """
-    Ruta para obtener el ranking de XP de los últimos 7 días.
+    Respuesta para un log_id ya registrado. Si el índice aún tiene el resultado
+    original se devuelve tal cual; si no, se informa el XP total actual del usuario.
     """
-    df_usuarios, df_registros = cargar_dataframes()
+    if previo is not None:
+        telegram_id, xp_ganado, xp_total_actual = previo
+    else:
+        usuario = almacen.buscar_usuario(telegram_id)
+        xp_total_actual = int(usuario['xp_total']) if usuario else None
+    return {
+        "status": "success",
+        "duplicado": True,
+        "log_id": log_id,
+        "xp_ganado": xp_ganado,
+        "xp_total_actual": xp_total_actual,
+    }
 
-    if df_registros.empty:
-        return jsonify({"ranking": [], "mensaje": "No hay registros de actividad para calcular el ranking."}), 200
+## 2. GET: Obtener Ranking por periodo (semanal, mensual, semestral)
+@app.route('/api/ranking/<periodo>', methods=['GET'])
+@cache.respuesta_cacheada(lambda periodo: ('ranking', periodo))
+def obtener_ranking(periodo):
+    """
+    Ruta para obtener el Top 10 de XP del periodo.
+    El top ya está calculado en memoria: no se recorren los registros.
+    """
+    if periodo not in PERIODOS:
+        return jsonify({"error": f"Periodo inválido. Usa uno de: {', '.join(PERIODOS)}"}), 400
 
-    # Convertir a datetime y definir el rango (últimos 7 días)
-    # Aseguramos que la columna exista y sea tratable
-    if 'fecha_registro' not in df_registros.columns or df_registros['fecha_registro'].dtype == object:
-        df_registros['fecha_registro'] = pd.to_datetime(df_registros['fecha_registro'], errors='coerce')
-        # Limpiar filas donde la fecha no se pudo parsear
-        df_registros.dropna(subset=['fecha_registro'], inplace=True)
-    
-    hace_siete_dias = datetime.now() - timedelta(days=7)
+    top = rankings.top(periodo)
 
-    # 1. Filtrar solo los registros de la última semana
-    df_semanal = df_registros[df_registros['fecha_registro'] > hace_siete_dias]
+    if not top:
+        return jsonify({"ranking": [], "mensaje": "No hay registros de actividad para calcular el ranking."}), 200
 
-    # 2. Agrupar por telegram_id y sumar el XP
-    ranking_xp = df_semanal.groupby('telegram_id')['xp_ganado'].sum().reset_index()
-    ranking_xp.rename(columns={'xp_ganado': 'xp_semanal'}, inplace=True)
+    # Completar con el nombre (búsqueda por ID en el almacén)
+    respuesta = []
+    for telegram_id, xp in top:
+        usuario = almacen.buscar_usuario(telegram_id)
+        respuesta.append({
+            'telegram_id': telegram_id,
+            # Reemplazar por 'Desconocido' si algún ID no tiene nombre
+            'nombre': usuario['nombre'] if usuario else 'Usuario Desconocido',
+            f'xp_{periodo}': xp,
+        })
 
-    # 3. Ordenar y obtener los Top
-    ranking_xp = ranking_xp.sort_values(by='xp_semanal', ascending=False)
-    
-    # 4. Fusionar con la tabla Usuarios para obtener el nombre
-    ranking_final = pd.merge(ranking_xp, df_usuarios[['telegram_id', 'nombre']], on='telegram_id', how='left')
-    
-    # 5. Convertir a formato JSON para la respuesta
-    # Reemplazar NaN por 'Desconocido' si algún ID no tiene nombre
-    ranking_final['nombre'].fillna('Usuario Desconocido', inplace=True)
-    
-    # Seleccionar las columnas relevantes y convertir a lista de diccionarios
-    respuesta = ranking_final[['nombre', 'xp_semanal']].head(10).to_dict('records')
-    
     return jsonify({"ranking": respuesta}), 200
 
 
+@app.route('/api/ranking/<periodo>/historial', methods=['GET'])
+def obtener_ranking_historico(periodo):
+    """
+    Ranking guardado por el trabajo de snapshots (?fecha=YYYY-MM-DD, por defecto el más reciente).
+    Es una lectura del archivo del día: no se recalcula nada. ?limite= cuántas posiciones devolver.
+    """
+    if periodo not in PERIODOS:
+        return jsonify({"error": f"Periodo inválido. Usa uno de: {', '.join(PERIODOS)}"}), 400
+    try:
+        fecha = datetime.strptime(request.args['fecha'], '%Y-%m-%d').date() if 'fecha' in request.args else None
+        limite = int(request.args.get('limite', 10))
+    except ValueError:
+        return jsonify({"error": "fecha debe tener formato YYYY-MM-DD y limite debe ser un número entero."}), 400
+
+    snapshot = leer_snapshot(periodo, fecha)
+    if snapshot is None:
+        return jsonify({"error": "No hay snapshot guardado para esa fecha."}), 404
+    fecha, ranking = snapshot
+
+    respuesta = []
+    for telegram_id, xp, posicion in ranking.head(limite).itertuples(index=False, name=None):
+        usuario = almacen.buscar_usuario(int(telegram_id))
+        respuesta.append({
+            'posicion': int(posicion),
+            'telegram_id': int(telegram_id),
+            'nombre': usuario['nombre'] if usuario else 'Usuario Desconocido',
+            f'xp_{periodo}': int(xp),
+        })
+    return jsonify({"fecha": fecha.isoformat(), "ranking": respuesta}), 200
+
+
+@app.route('/api/ranking_semanal', methods=['GET'])
+def obtener_ranking_semanal():
+    """Ruta original del ranking de los últimos 7 días (se mantiene por compatibilidad)."""
+    return obtener_ranking('semanal')
+
+
+## 1b. POST: Registrar un lote de actividades
+@app.route('/api/registrar_actividades', methods=['POST'])
+def registrar_actividades():
+    """
+    Ingesta masiva (asistencia de un curso completo, reenvío de eventos del bot).
+    Cuerpo: arreglo JSON, o NDJSON (un evento por línea) con Content-Type application/x-ndjson.
+    Cada evento: telegram_id, tipo_actividad, xp_a_sumar y opcionalmente log_id, fecha_registro y valor.
+    Los log_id ya registrados (o repetidos en el lote) no se vuelven a sumar: se marcan como duplicado.
+    Los rechazados traen el motivo en 'error' y en 'codigo' (VALIDACION o USUARIO_NO_ENCONTRADO).
+    Se valida todo de forma vectorizada, se anexa en una sola escritura y el XP se suma
+    con una sola agregación por usuario. Devuelve el resultado de cada evento en orden.
+    """
+    # 1. Leer el lote
+    try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            df = pd.read_json(io.BytesIO(request.get_data()), lines=True, dtype=False)
+        else:
+            eventos = request.get_json()
+            if not isinstance(eventos, list):
+                return jsonify({"error": "Se esperaba un arreglo JSON de eventos."}), 400
+            df = pd.DataFrame(eventos)
+    except ValueError:
+        return jsonify({"error": "El cuerpo no es JSON/NDJSON válido."}), 400
+
+    if len(df) > MAX_EVENTOS_LOTE:
+        return jsonify({"error": f"Máximo {MAX_EVENTOS_LOTE} eventos por lote."}), 413
+    if df.empty:
+        return jsonify({"status": "success", "aceptados": 0, "rechazados": 0, "duplicados": 0, "resultados": []}), 200
+
+    for columna in ['telegram_id', 'tipo_actividad', 'xp_a_sumar', 'log_id', 'fecha_registro', 'valor']:
+        if columna not in df.columns:
+            df[columna] = None
+
+    # 2. Validación vectorizada: cada fila termina con un mensaje de error o vacía
+    errores = pd.Series("", index=df.index, dtype=object)
+    telegram_ids = pd.to_numeric(df['telegram_id'], errors='coerce')
+    xps = pd.to_numeric(df['xp_a_sumar'], errors='coerce')
+    ahora = datetime.now()
+    fechas = pd.to_datetime(df['fecha_registro'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    valores = pd.to_numeric(df['valor'], errors='coerce')
+
+    errores[df['tipo_actividad'].isna()] = "Falta tipo_actividad."
+    errores[df['valor'].notna() & valores.isna()] = "valor debe ser un número."
+    errores[df['fecha_registro'].notna() & fechas.isna()] = "fecha_registro debe tener formato YYYY-MM-DD HH:MM:SS."
+    errores[(xps.isna() | (xps != np.floor(xps))) & df['xp_a_sumar'].notna()] = "xp_a_sumar debe ser un número entero."
+    errores[(telegram_ids.isna() | (telegram_ids != np.floor(telegram_ids))) & df['telegram_id'].notna()] = "telegram_id debe ser un número entero."
+    errores[df['telegram_id'].isna() | df['xp_a_sumar'].isna()] = "Faltan campos requeridos (telegram_id, tipo_actividad, xp_a_sumar)"
+    validos = errores == ""
+    codigos = pd.Series("", index=df.index, dtype=object)
+    codigos[~validos] = CODIGO_VALIDACION
+
+    # 3. Construir las filas del log solo para los eventos válidos
+    df_validos = df[validos]
+    df_logs = pd.DataFrame({
+        'log_id': [
+            str(log_id) if pd.notna(log_id) else str(uuid.uuid4())  # UUID si el cliente no envió uno
+            for log_id in df_validos['log_id']
+        ],
+        'telegram_id': telegram_ids[validos].astype('int64'),
+        'xp_ganado': xps[validos].astype('int64'),
+        'tipo_actividad': df_validos['tipo_actividad'].astype(str),
+        'fecha_registro': fechas[validos].fillna(pd.Timestamp(ahora)).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'valor': valores[validos].astype('float64'),
+    }, index=df_validos.index)
+
+    # 4. Duplicados: log_id repetidos dentro del lote o ya registrados (reintentos del cliente)
+    repetidos = df_logs['log_id'].duplicated()
+    enviados_por_cliente = df_validos['log_id'].notna() & ~repetidos
+    with escritura_exclusiva(), indice_eventos.bloqueo:
+        previos = indice_eventos.buscar(df_logs.loc[enviados_por_cliente, 'log_id'])
+        ya_registrados = df_logs['log_id'].isin(previos.keys()) & ~repetidos
+        df_nuevos = df_logs[~repetidos & ~ya_registrados]
+
+        # 5. Una sola escritura en el almacén; los usuarios inexistentes no se escriben
+        totales = almacen.agregar_registros(df_nuevos)
+        aceptados = df_nuevos['telegram_id'].isin(totales.keys())
+        df_aceptados = df_nuevos[aceptados]
+        xp_totales = df_aceptados['telegram_id'].map(totales)
+        indice_eventos.recordar_lote(df_aceptados['log_id'], df_aceptados['telegram_id'],
+                                     df_aceptados['xp_ganado'], xp_totales)
+        registro_alertas.anotar(alertas.procesar_lote(df_aceptados))
+    errores[df_nuevos.index[~aceptados]] = "Usuario no encontrado. Debe registrarse primero."
+    codigos[df_nuevos.index[~aceptados]] = CODIGO_USUARIO_NO_ENCONTRADO
+
+    # 6. Rankings, agregados y cache solo para lo que efectivamente se escribió
+    rankings.registrar_lote(df_aceptados)
+    agregados.registrar_lote(df_aceptados)
+    if totales:
+        invalidar_cache_actividad(*totales)
+
+    # 7. Resultado por evento, en el mismo orden del lote
+    resultados = pd.DataFrame({'indice': range(len(df)), 'status': 'error', 'error': errores.to_numpy(copy=True),
+                               'codigo': codigos.to_numpy(copy=True)}, index=df.index)
+    resultados['log_id'] = None
+    resultados['xp_total_actual'] = None
+    resultados['duplicado'] = None
+    resultados.loc[df_aceptados.index, 'status'] = 'success'
+    resultados.loc[df_aceptados.index, 'log_id'] = df_aceptados['log_id']
+    resultados.loc[df_aceptados.index, 'xp_total_actual'] = xp_totales
+
+    # Ya registrados antes: resultado original (o el XP total actual si salió del índice)
+    df_previos = df_logs[ya_registrados]
+    if not df_previos.empty:
+        xp_originales = df_previos['log_id'].map(lambda log_id: previos[log_id][2] if previos[log_id] else None)
+        xp_actuales = df_previos['telegram_id'].map(
+            lambda telegram_id: (almacen.buscar_usuario(telegram_id) or {}).get('xp_total'))
+        resultados.loc[df_previos.index, 'status'] = 'success'
+        resultados.loc[df_previos.index, 'log_id'] = df_previos['log_id']
+        resultados.loc[df_previos.index, 'xp_total_actual'] = xp_originales.where(xp_originales.notna(), xp_actuales)
+        resultados.loc[df_previos.index, 'duplicado'] = True
+
+    # Repetidos dentro del lote: mismo resultado que su primera aparición
+    if repetidos.any():
+        primera_aparicion = pd.Series(df_logs.index[~repetidos], index=df_logs.loc[~repetidos, 'log_id'])
+        origen = df_logs.loc[repetidos, 'log_id'].map(primera_aparicion)
+        for columna in ['status', 'error', 'codigo', 'log_id', 'xp_total_actual']:
+            resultados.loc[origen.index, columna] = resultados.loc[origen.values, columna].to_numpy(copy=True)
+        resultados.loc[origen.index, 'duplicado'] = True
+
+    registros_resultado = [
+        {k: v for k, v in fila.items() if v is not None and v != ""}
+        for fila in resultados.astype(object).to_dict('records')
+    ]
+    exitosos = int((resultados['status'] == 'success').sum())
+    return jsonify({
+        "status": "success",
+        "aceptados": exitosos,
+        "rechazados": len(df) - exitosos,
+        "duplicados": int(resultados['duplicado'].notna().sum()),
+        "resultados": registros_resultado,
+    }), 200
+
+
 # 3. POST: Ruta para nuevo registro (si el bot ve un ID nuevo)
 @app.route('/api/registrar_usuario', methods=['POST'])
 def registrar_usuario():
@@ -173,12 +432,6 @@ def registrar_usuario():
     except ValueError:
         return jsonify({"error": "telegram_id debe ser un número entero."}), 400
 
-    df_usuarios, df_registros = cargar_dataframes()
-
-    # Verificar si ya existe
-    if not df_usuarios[df_usuarios['telegram_id'] == telegram_id].empty:
-        return jsonify({"error": "El usuario ya está registrado."}), 409
-
     nuevo_usuario = {
         'telegram_id': telegram_id,
         'nombre': data['nombre'],
@@ -187,42 +440,115 @@ def registrar_usuario():
         'fecha_creacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    df_usuarios = pd.concat([df_usuarios, pd.DataFrame([nuevo_usuario])], ignore_index=True)
-    
-    # CORRECCIÓN: Guardar ambos dataframes 
-    guardar_dataframes(df_usuarios, df_registros) 
+    # El almacén verifica que no exista y lo persiste
+    with escritura_exclusiva():
+        agregado = almacen.agregar_usuario(nuevo_usuario)
+    if not agregado:
+        return jsonify({"error": "El usuario ya está registrado."}), 409
+
+    cache.invalidar(('perfil', telegram_id))
 
     return jsonify({"status": "success", "mensaje": "Usuario registrado correctamente."}), 201
 
 
-# 4. GET: Obtener perfil de un usuario específico
-@app.route('/api/usuario/<int:telegram_id>', methods=['GET'])
-def obtener_perfil(telegram_id):
-    """Devuelve los datos de un usuario para el comando /miperfil"""
-    df_usuarios, _ = cargar_dataframes()
-    
-    # Filtramos por ID
-    usuario = df_usuarios[df_usuarios['telegram_id'] == telegram_id]
-    
-    if usuario.empty:
-        return jsonify({"error": "Usuario no encontrado"}), 404
+def datos_perfil(telegram_id):
+    """Datos del usuario con sus estadísticas agregadas, listos para JSON (None si no existe)."""
+    usuario = almacen.buscar_usuario(telegram_id)
+    if usuario is None:
+        return None
         
-    # Convertimos el primer resultado a diccionario
-    # fillna maneja casos donde no haya datos (NaN)
-    datos = usuario.iloc[0].fillna("").to_dict()
+    # Reemplazamos los NaN por "" (casos donde no haya datos)
+    datos = {k: ("" if pd.isna(v) else v) for k, v in usuario.items()}
     
     # Aseguramos que los tipos de datos sean JSON serializables (int/float nativos)
     if 'xp_total' in datos:
         datos['xp_total'] = int(datos['xp_total'])
-        
+
+    # Estadísticas ya agregadas en memoria (sin recorrer los registros)
+    datos['estadisticas'] = agregados.de(telegram_id) or {}
+    return datos
+
+
+# 4. GET: Obtener perfil de un usuario específico
+@app.route('/api/usuario/<int:telegram_id>', methods=['GET'])
+@cache.respuesta_cacheada(lambda telegram_id: ('perfil', telegram_id))
+def obtener_perfil(telegram_id):
+    """Devuelve los datos de un usuario para el comando /miperfil"""
+    datos = datos_perfil(telegram_id)
+    if datos is None:
+        return jsonify({"error": "Usuario no encontrado"}), 404
     return jsonify(datos), 200
 
 
+# 4b. GET: Perfil, posición en cada ranking y XP por día, en una sola respuesta (página de perfil)
+@app.route('/api/usuario/<int:telegram_id>/dashboard', methods=['GET'])
+def obtener_dashboard(telegram_id):
+    """
+    Lo mismo que /api/usuario/<id> más 'rankings' (xp, posición y participantes por periodo)
+    y 'xp_por_dia' de los últimos ?dias= días. Todo sale de lo que ya está en memoria:
+    la posición es una búsqueda binaria en las sumas ordenadas y la serie lee los baldes diarios.
+    No pasa por el cache de respuestas porque la posición cambia con la actividad de cualquiera.
+    """
+    try:
+        dias = int(request.args.get('dias', DIAS_SERIE_DASHBOARD))
+    except ValueError:
+        return jsonify({"error": "dias debe ser un número entero."}), 400
+    if not 1 <= dias <= MAX_DIAS_SERIE:
+        return jsonify({"error": f"dias debe estar entre 1 y {MAX_DIAS_SERIE}."}), 400
+
+    datos = datos_perfil(telegram_id)
+    if datos is None:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+    datos['rankings'] = rankings.posiciones(telegram_id)
+    datos['xp_por_dia'] = [{'fecha': dia.isoformat(), 'xp': xp} for dia, xp in rankings.serie(telegram_id, dias)]
+
+    resp = jsonify(datos)
+    # Sin cache en el servidor, pero el cliente puede revalidar con If-None-Match
+    resp.add_etag()
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
+
+
+# 5. GET: Estadísticas del cache de respuestas
+@app.route('/api/cache', methods=['GET'])
+def estadisticas_cache():
+    """Aciertos, fallos e invalidaciones del cache de respuestas, y duplicados detectados."""
+    return jsonify({**cache.estadisticas(), "idempotencia": indice_eventos.estadisticas()}), 200
+
+
+# 6. GET: Alertas de bienestar pendientes de enviar
+@app.route('/api/alertas', methods=['GET'])
+def obtener_alertas():
+    """
+    Alertas emitidas con id mayor a ?desde= (opcionalmente solo de ?telegram_id=).
+    El bot guarda el 'ultimo' id que recibió y lo usa como desde en la siguiente consulta.
+    Sale del registro compartido: cualquier worker responde lo mismo.
+    """
+    try:
+        desde = int(request.args.get('desde', 0))
+        telegram_id = request.args.get('telegram_id', type=int)
+    except ValueError:
+        return jsonify({"error": "desde debe ser un número entero."}), 400
+    emitidas, ultimo = registro_alertas.alertas(desde, telegram_id)
+    return jsonify({"alertas": emitidas, "ultimo": ultimo,
+                    "estadisticas": {**alertas.estadisticas(), **registro_alertas.estadisticas()}}), 200
+
+
+# 7. POST: Snapshots de rankings y recálculo de ligas (lo llama el bot una vez al día)
+@app.route('/api/snapshots', methods=['POST'])
+def crear_snapshots():
+    """Guarda el ranking de cada periodo al día de hoy y actualiza la liga de todos los usuarios."""
+    with escritura_exclusiva():
+        resumen = generar_snapshots(almacen)
+    cache.invalidar(*[('perfil', telegram_id) for telegram_id in resumen['cambios_liga']])
+    return jsonify({**resumen, "cambios_liga": len(resumen['cambios_liga'])}), 200
+
+
 # --- INICIAR LA APLICACIÓN ---
 if __name__ == '__main__':
-    # Esto asegura que los DataFrames se carguen/inicialicen antes de correr la app
-    # Cargar y guardar solo para crear los archivos (con sus cabeceras) si no existen
-    guardar_dataframes(*cargar_dataframes())
+    # El almacén ya cargó los datos al importar el módulo.
+    # Guardar solo para crear los archivos (con sus cabeceras) si no existen
+    almacen.guardar()
     
     print("\n--- INICIANDO API DE FLASK ---")
     print("API lista en http://localhost:5000/")
@@ -0,0 +1,105 @@
+from flask import request, make_response
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+import hashlib
+import threading
+import time
+
+# --- CONFIGURACIÓN ---
+CACHE_CAPACIDAD = 2048   # Máximo de respuestas guardadas (LRU)
+CACHE_TTL_SEGUNDOS = 60  # Tiempo de vida de cada respuesta
+
+
+class CacheRespuestas:
+    """
+    Cache LRU + TTL de respuestas JSON ya serializadas, con clave (endpoint, argumentos).
+    Las escrituras invalidan las claves afectadas; el TTL acota lo que puede quedar
+    desactualizado si otro proceso escribe.
+    """
+
+    def __init__(self, capacidad=CACHE_CAPACIDAD, ttl=CACHE_TTL_SEGUNDOS):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> (expira, cuerpo, etag, ultima_modificacion)
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    del self._entradas[clave]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1:]
+
+    def guardar(self, clave, cuerpo):
+        """Guarda el cuerpo y devuelve (cuerpo, etag, ultima_modificacion)."""
+        etag = hashlib.sha1(cuerpo).hexdigest()
+        ultima_modificacion = datetime.now(timezone.utc).replace(microsecond=0)
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self.ttl, cuerpo, etag, ultima_modificacion)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+        return cuerpo, etag, ultima_modificacion
+
+    def invalidar(self, *claves):
+        with self._lock:
+            for clave in claves:
+                if self._entradas.pop(clave, None) is not None:
+                    self.invalidaciones += 1
+
+    def limpiar(self):
+        with self._lock:
+            self.invalidaciones += len(self._entradas)
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "capacidad": self.capacidad,
+                "ttl_segundos": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "invalidaciones": self.invalidaciones,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            }
+
+    def respuesta_cacheada(self, clave_de):
+        """
+        Decorador para rutas GET que devuelven (json, status).
+        clave_de recibe los mismos argumentos que la ruta y devuelve la clave.
+        Solo se guardan respuestas 200; se agregan ETag y Last-Modified y se
+        responde 304 si el cliente ya tiene esa versión.
+        """
+        def decorador(vista):
+            @wraps(vista)
+            def envoltura(*args, **kwargs):
+                clave = clave_de(*args, **kwargs)
+                entrada = self.obtener(clave)
+
+                if entrada is None:
+                    respuesta, status = vista(*args, **kwargs)
+                    if status != 200:
+                        return respuesta, status
+                    entrada = self.guardar(clave, respuesta.get_data())
+
+                cuerpo, etag, ultima_modificacion = entrada
+                resp = make_response(cuerpo, 200)
+                resp.mimetype = 'application/json'
+                resp.set_etag(etag)
+                resp.last_modified = ultima_modificacion
+                # El cliente puede reutilizar la respuesta, pero debe revalidarla
+                resp.headers['Cache-Control'] = 'no-cache'
+                return resp.make_conditional(request)
+            return envoltura
+        return decorador
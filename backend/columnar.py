@@ -0,0 +1,444 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl  # Bloqueo entre procesos (solo POSIX)
+except ImportError:
+    fcntl = None
+
+from almacen import REGISTROS_XP_CSV, COLUMNAS_REGISTROS, leer_fechas, leer_final_csv
+
+# --- CONFIGURACIÓN ---
+CARPETA_COLUMNAR = 'database/columnar'
+BYTES_POR_BLOQUE = 64 * 1024 * 1024   # Trozo de registros.csv que se lee por vez al indexar
+MAX_SEGMENTOS_POR_MES = 8             # Sobre esto, los segmentos de un mes se compactan en uno
+
+# Cada segmento es una carpeta con un .npy por columna, filas ordenadas por fecha
+TIPOS_COLUMNAS = {
+    'log_id': 'S',                  # Bytes de ancho fijo (el ancho depende del segmento)
+    'telegram_id': 'int64',
+    'xp_ganado': 'int32',
+    'tipo_actividad': 'int16',      # Posición en la lista 'tipos' del manifiesto
+    'fecha_registro': 'int64',      # Segundos desde 1970-01-01 (hora local, como en el CSV)
+    'valor': 'float32',             # NaN si el registro no trae medida
+}
+# Índice de log_id de cada segmento: hashes ordenados y la fila de cada uno
+INDICE_LOG_ID = ('log_hash', 'log_pos')
+ARCHIVO_MANIFIESTO = 'manifiesto.json'
+_EPOCA = pd.Timestamp('1970-01-01')
+
+# registros.csv sigue siendo el log durable; los segmentos son un índice columnar de
+# su contenido hasta el byte offset_csv del manifiesto. Los segmentos no se modifican
+# nunca: indexar o compactar escribe segmentos nuevos y publica un manifiesto nuevo con
+# os.replace, así que un lector ve el conjunto anterior o el nuevo, nunca una mezcla.
+
+
+# --- MANIFIESTO ---
+
+def leer_manifiesto(carpeta=CARPETA_COLUMNAR):
+    """Manifiesto vigente (o uno vacío si la carpeta todavía no se indexó)."""
+    ruta = os.path.join(carpeta, ARCHIVO_MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {"version": 0, "inodo": None, "offset_csv": 0, "siguiente": 0, "tipos": [], "segmentos": []}
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _publicar(carpeta, manifiesto):
+    """Reemplaza el manifiesto de forma atómica (temporal + fsync + rename)."""
+    manifiesto['version'] += 1
+    ruta = os.path.join(carpeta, ARCHIVO_MANIFIESTO)
+    tmp = f"{ruta}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+@contextmanager
+def _bloqueo(carpeta):
+    """Un solo proceso indexa o compacta a la vez; los lectores nunca esperan."""
+    os.makedirs(carpeta, exist_ok=True)
+    with open(os.path.join(carpeta, '.bloqueo'), 'w') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+# --- CODIFICACIÓN ---
+
+def a_epoca(fechas):
+    """Serie de textos 'YYYY-MM-DD HH:MM:SS' o datetime64 -> segundos desde 1970 (NaT queda como NaN)."""
+    return (leer_fechas(fechas) - _EPOCA).dt.total_seconds()
+
+
+def hash_log_ids(log_ids):
+    """Hash de 64 bits de cada log_id (como texto); es el mismo en todos los procesos."""
+    return pd.util.hash_array(np.asarray(log_ids, dtype=object))
+
+
+def codificar(df_registros, tipos):
+    """
+    DataFrame con COLUMNAS_REGISTROS -> {columna: arreglo numpy} con los tipos compactos,
+    más 'log_hash' (hash de cada log_id). Los tipos de actividad nuevos se agregan al
+    final de 'tipos' (los códigos existentes no cambian).
+    Las filas sin telegram_id o con fecha inválida se descartan.
+    """
+    segundos = a_epoca(df_registros['fecha_registro'])
+    telegram_ids = pd.to_numeric(df_registros['telegram_id'], errors='coerce')
+    validas = (segundos.notna() & telegram_ids.notna()).to_numpy()
+
+    # Solo se buscan en el diccionario los tipos distintos del bloque (son pocos)
+    codigos, distintos = pd.factorize(df_registros['tipo_actividad'].astype(str))
+    indice = {tipo: i for i, tipo in enumerate(tipos)}
+    for tipo in distintos:
+        if tipo not in indice:
+            indice[tipo] = len(tipos)
+            tipos.append(tipo)
+    codigos_tipos = np.array([indice[tipo] for tipo in distintos], dtype='int16')
+
+    valores = (pd.to_numeric(df_registros['valor'], errors='coerce') if 'valor' in df_registros.columns
+               else pd.Series(np.nan, index=df_registros.index))
+    textos = df_registros['log_id'].astype(str).to_numpy(dtype='U')
+    try:
+        log_ids = textos.astype('S')  # UUID o números: ASCII, conversión directa
+    except UnicodeEncodeError:
+        log_ids = np.char.encode(textos, 'utf-8')
+    columnas = {
+        'log_id': log_ids,
+        'telegram_id': telegram_ids.to_numpy(),
+        'xp_ganado': pd.to_numeric(df_registros['xp_ganado'], errors='coerce').fillna(0).to_numpy(),
+        'tipo_actividad': codigos_tipos[codigos],
+        'fecha_registro': segundos.to_numpy(),
+        'valor': valores.to_numpy(dtype='float64'),
+    }
+    codificadas = {
+        columna: (arreglo[validas] if columna == 'log_id' else arreglo[validas].astype(TIPOS_COLUMNAS[columna]))
+        for columna, arreglo in columnas.items()
+    }
+    codificadas['log_hash'] = hash_log_ids(textos[validas])
+    return codificadas
+
+
+def _mes_de(segundos):
+    """Segundos desde 1970 -> mes de cada fila (datetime64[M]; str() da 'AAAA-MM')."""
+    return segundos.astype('datetime64[s]').astype('datetime64[M]')
+
+
+def _concatenar(partes):
+    """Une varias partes {columna: arreglo}; log_id toma el ancho mayor."""
+    return {columna: np.concatenate([parte[columna] for parte in partes]) for columna in partes[0]}
+
+
+# --- SEGMENTOS ---
+
+def _escribir_segmento(carpeta, manifiesto, mes, columnas):
+    """
+    Escribe un segmento nuevo con las filas ordenadas por fecha y su índice de log_id.
+    No es visible hasta publicar el manifiesto. Devuelve su entrada para el manifiesto.
+    """
+    nombre = f"{mes}.{manifiesto['siguiente']:06d}"
+    manifiesto['siguiente'] += 1
+    orden = np.argsort(columnas['fecha_registro'], kind='stable')
+    ruta = os.path.join(carpeta, 'segmentos', nombre)
+    tmp = f"{ruta}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for columna in TIPOS_COLUMNAS:
+        np.save(os.path.join(tmp, f"{columna}.npy"), columnas[columna][orden])
+    hashes = columnas['log_hash'][orden]
+    orden_hash = np.argsort(hashes, kind='stable')
+    np.save(os.path.join(tmp, 'log_hash.npy'), hashes[orden_hash])
+    np.save(os.path.join(tmp, 'log_pos.npy'), orden_hash.astype('int64'))
+    os.replace(tmp, ruta)
+
+    fechas = columnas['fecha_registro']
+    return {"nombre": nombre, "mes": str(mes), "filas": int(len(fechas)),
+            "desde": int(fechas.min()), "hasta": int(fechas.max())}
+
+
+def _leer_segmento(carpeta, nombre):
+    """Todas las columnas de un segmento, con el hash de log_id en el orden de las filas."""
+    ruta = os.path.join(carpeta, 'segmentos', nombre)
+    columnas = {columna: np.load(os.path.join(ruta, f"{columna}.npy")) for columna in TIPOS_COLUMNAS}
+    hashes = np.load(os.path.join(ruta, 'log_hash.npy'))
+    columnas['log_hash'] = np.empty_like(hashes)
+    columnas['log_hash'][np.load(os.path.join(ruta, 'log_pos.npy'))] = hashes
+    return columnas
+
+
+def _compactar(carpeta, manifiesto, max_segmentos):
+    """Une los segmentos de cada mes que tenga más de max_segmentos. Devuelve los nombres reemplazados."""
+    por_mes = {}
+    for segmento in manifiesto['segmentos']:
+        por_mes.setdefault(segmento['mes'], []).append(segmento)
+    reemplazados = []
+    for mes, segmentos in por_mes.items():
+        if len(segmentos) <= max_segmentos:
+            continue
+        unido = _escribir_segmento(carpeta, manifiesto, mes,
+                                   _concatenar([_leer_segmento(carpeta, s['nombre']) for s in segmentos]))
+        nombres = {s['nombre'] for s in segmentos}
+        manifiesto['segmentos'] = [s for s in manifiesto['segmentos'] if s['nombre'] not in nombres] + [unido]
+        reemplazados.extend(nombres)
+    manifiesto['segmentos'].sort(key=lambda s: (s['mes'], s['nombre']))
+    return reemplazados
+
+
+def _borrar_segmentos(carpeta, nombres):
+    # Un proceso que todavía los tenga mapeados sigue leyéndolos: en POSIX el archivo
+    # borrado existe hasta que se cierra. Lo suelta en su próximo actualizar().
+    for nombre in nombres:
+        shutil.rmtree(os.path.join(carpeta, 'segmentos', nombre), ignore_errors=True)
+
+
+def compactar(carpeta=CARPETA_COLUMNAR, max_segmentos=1):
+    """Deja cada mes en a lo más max_segmentos segmentos. Devuelve cuántos segmentos se reemplazaron."""
+    with _bloqueo(carpeta):
+        manifiesto = leer_manifiesto(carpeta)
+        reemplazados = _compactar(carpeta, manifiesto, max_segmentos)
+        if reemplazados:
+            _publicar(carpeta, manifiesto)
+            _borrar_segmentos(carpeta, reemplazados)
+    return len(reemplazados)
+
+
+# --- INDEXACIÓN DEL CSV ---
+
+def bytes_sin_indexar(ruta_csv=REGISTROS_XP_CSV, manifiesto=None, carpeta=CARPETA_COLUMNAR):
+    """
+    Bytes de registros.csv que los segmentos todavía no cubren. Si el CSV fue
+    reescrito (otro inodo o más corto que lo indexado) devuelve su tamaño completo.
+    """
+    manifiesto = manifiesto or leer_manifiesto(carpeta)
+    try:
+        st = os.stat(ruta_csv)
+    except FileNotFoundError:
+        return 0
+    if st.st_ino != manifiesto.get('inodo') or st.st_size < manifiesto['offset_csv']:
+        return st.st_size
+    return st.st_size - manifiesto['offset_csv']
+
+
+def indexar_csv(ruta_csv=REGISTROS_XP_CSV, carpeta=CARPETA_COLUMNAR, minimo_bytes=0,
+                bytes_por_bloque=BYTES_POR_BLOQUE, max_segmentos=MAX_SEGMENTOS_POR_MES):
+    """
+    Convierte en segmentos la parte de registros.csv que el manifiesto todavía no cubre
+    (la primera vez, el archivo completo) y la publica. No hace nada si faltan menos de
+    minimo_bytes. El CSV se lee por trozos de bytes_por_bloque, así que la memoria no
+    depende de su tamaño. Devuelve la cantidad de registros indexados.
+    """
+    if not os.path.exists(ruta_csv):
+        return 0
+    with _bloqueo(carpeta):
+        # Se vuelve a leer bajo el bloqueo: otro proceso pudo indexar mientras se esperaba
+        manifiesto = leer_manifiesto(carpeta)
+        pendientes = bytes_sin_indexar(ruta_csv, manifiesto)
+        if pendientes == 0 or pendientes < minimo_bytes:
+            return 0
+
+        # 1. Si el CSV fue reescrito (guardar() o migración de columnas), se indexa de cero
+        inodo = os.stat(ruta_csv).st_ino
+        reemplazados = []
+        if inodo != manifiesto.get('inodo') and manifiesto['segmentos']:
+            print(f"Advertencia: {ruta_csv} fue reescrito; se vuelve a indexar completo.")
+            reemplazados = [s['nombre'] for s in manifiesto['segmentos']]
+            manifiesto['segmentos'] = []
+        if inodo != manifiesto.get('inodo'):
+            manifiesto.update(inodo=inodo, offset_csv=0)
+
+        # 2. Un segmento por mes presente en cada trozo
+        filas = 0
+        while True:
+            df, fin = leer_final_csv(ruta_csv, manifiesto['offset_csv'], manifiesto['offset_csv'] + bytes_por_bloque)
+            manifiesto['offset_csv'] = fin
+            if df.empty:
+                break
+            columnas = codificar(df, manifiesto['tipos'])
+            meses = _mes_de(columnas['fecha_registro'])
+            for mes in np.unique(meses):
+                del_mes = meses == mes
+                manifiesto['segmentos'].append(_escribir_segmento(
+                    carpeta, manifiesto, mes, {columna: arreglo[del_mes] for columna, arreglo in columnas.items()}))
+            filas += len(columnas['telegram_id'])
+
+        # 3. Compactar los meses con demasiados segmentos y publicar todo junto
+        reemplazados += _compactar(carpeta, manifiesto, max_segmentos)
+        _publicar(carpeta, manifiesto)
+        _borrar_segmentos(carpeta, reemplazados)
+    return filas
+
+
+# --- LECTURA MAPEADA ---
+
+class HistorialMapeado:
+    """
+    Historial de registros leído de los segmentos mapeados en memoria (mmap de solo
+    lectura). Las páginas viven en el page cache del sistema y las comparten todos los
+    procesos que abren la misma carpeta: ningún worker guarda su propia copia.
+
+    actualizar() relee el manifiesto y mapea solo los segmentos nuevos. Entre dos
+    llamadas el historial no cambia, aunque otro proceso publique segmentos.
+    """
+
+    def __init__(self, carpeta=CARPETA_COLUMNAR):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self.version = None
+        self.offset_csv = 0
+        self.tipos = []
+        self._segmentos = []  # [(entrada del manifiesto, {columna: memmap})]
+
+    def _mapear(self, nombre):
+        ruta = os.path.join(self.carpeta, 'segmentos', nombre)
+        return {columna: np.load(os.path.join(ruta, f"{columna}.npy"), mmap_mode='r')
+                for columna in (*TIPOS_COLUMNAS, *INDICE_LOG_ID)}
+
+    def actualizar(self):
+        """Pasa al conjunto de segmentos publicado más reciente. Devuelve True si cambió."""
+        for _ in range(5):
+            manifiesto = leer_manifiesto(self.carpeta)
+            if manifiesto['version'] == self.version:
+                return False
+            mapeados = {entrada['nombre']: mapas for entrada, mapas in self._segmentos}
+            try:
+                segmentos = [(entrada, mapeados.get(entrada['nombre']) or self._mapear(entrada['nombre']))
+                             for entrada in manifiesto['segmentos']]
+            except FileNotFoundError:
+                # Otro proceso compactó entre la lectura del manifiesto y la apertura de los segmentos
+                continue
+            with self._lock:
+                self._segmentos = segmentos
+                self.version = manifiesto['version']
+                self.offset_csv = manifiesto['offset_csv']
+                self.tipos = list(manifiesto['tipos'])
+            return True
+        raise RuntimeError(f"No se pudo leer un manifiesto estable en {self.carpeta}")
+
+    @property
+    def filas(self):
+        return sum(entrada['filas'] for entrada, _ in self._segmentos)
+
+    def tramos(self, desde=None, hasta=None, columnas=None):
+        """
+        Vistas sin copia de las columnas pedidas con desde < fecha_registro < hasta, una
+        por segmento: [{columna: arreglo de solo lectura}]. El rango se ubica con una
+        búsqueda binaria sobre las fechas de cada segmento.
+        """
+        columnas = list(columnas or TIPOS_COLUMNAS)
+        inicio = None if desde is None else int((pd.Timestamp(desde) - _EPOCA).total_seconds())
+        fin = None if hasta is None else int((pd.Timestamp(hasta) - _EPOCA).total_seconds())
+        with self._lock:
+            segmentos = self._segmentos
+        resultado = []
+        for entrada, mapas in segmentos:
+            if (inicio is not None and entrada['hasta'] <= inicio) or (fin is not None and entrada['desde'] >= fin):
+                continue
+            fechas = mapas['fecha_registro']
+            i = 0 if inicio is None else int(np.searchsorted(fechas, inicio, side='right'))
+            j = len(fechas) if fin is None else int(np.searchsorted(fechas, fin, side='left'))
+            if i < j:
+                resultado.append({columna: mapas[columna][i:j] for columna in columnas})
+        return resultado
+
+    def leer(self, desde=None, hasta=None, columnas=None, decodificar=True):
+        """
+        DataFrame con las columnas pedidas del rango; solo se copia el rango.
+        Con decodificar=True tipo_actividad vuelve como categoría, fecha_registro como
+        datetime64 y log_id como texto; con False quedan los códigos compactos.
+        """
+        columnas = list(columnas or TIPOS_COLUMNAS)
+        tramos = self.tramos(desde, hasta, columnas)
+        datos = {}
+        for columna in columnas:
+            if tramos:
+                arreglo = np.concatenate([tramo[columna] for tramo in tramos])
+            else:
+                arreglo = np.empty(0, dtype='S1' if columna == 'log_id' else TIPOS_COLUMNAS[columna])
+            if decodificar:
+                if columna == 'tipo_actividad':
+                    arreglo = pd.Categorical.from_codes(arreglo, categories=self.tipos)
+                elif columna == 'fecha_registro':
+                    arreglo = arreglo.astype('datetime64[s]')
+                elif columna == 'log_id':
+                    arreglo = np.char.decode(arreglo, 'utf-8').astype(object)
+            datos[columna] = arreglo
+        return pd.DataFrame(datos, columns=columnas)
+
+    def contiene(self, log_ids):
+        """Subconjunto de log_ids que ya están en algún segmento (búsqueda binaria por hash)."""
+        log_ids = [str(log_id) for log_id in log_ids]
+        if not log_ids:
+            return set()
+        hashes = hash_log_ids(log_ids)
+        with self._lock:
+            segmentos = self._segmentos
+        encontrados = set()
+        for _, mapas in segmentos:
+            indice = mapas['log_hash']
+            if len(indice) == 0:
+                continue
+            posiciones = np.minimum(np.searchsorted(indice, hashes), len(indice) - 1)
+            for k in np.flatnonzero(indice[posiciones] == hashes):
+                # Se confirma con el texto: dos log_id distintos podrían compartir hash
+                fila = mapas['log_pos'][posiciones[k]]
+                if mapas['log_id'][fila].decode('utf-8') == log_ids[k]:
+                    encontrados.add(log_ids[k])
+        return encontrados
+
+
+def leer_registros(carpeta=CARPETA_COLUMNAR, columnas=None, desde=None, hasta=None, decodificar=True):
+    """Lectura puntual de las columnas y el rango pedidos (ver HistorialMapeado.leer)."""
+    historial = HistorialMapeado(carpeta)
+    historial.actualizar()
+    return historial.leer(desde, hasta, columnas, decodificar)
+
+
+def a_registros(df):
+    """DataFrame decodificado -> mismas columnas y formatos que registros.csv."""
+    df = df.copy()
+    df['fecha_registro'] = df['fecha_registro'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['tipo_actividad'] = df['tipo_actividad'].astype(str)
+    return df[[columna for columna in COLUMNAS_REGISTROS if columna in df.columns]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Indexa registros.csv en segmentos columnares (un .npy por columna).")
+    parser.add_argument('--registros', default=REGISTROS_XP_CSV, help="CSV de registros.")
+    parser.add_argument('--carpeta', default=CARPETA_COLUMNAR, help="Carpeta de los segmentos.")
+    parser.add_argument('--compactar', action='store_true', help="Dejar un solo segmento por mes.")
+    parser.add_argument('--comparar', action='store_true', help="Medir tiempo y memoria de carga contra el CSV.")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    filas = indexar_csv(args.registros, args.carpeta)
+    if args.compactar:
+        compactar(args.carpeta)
+    manifiesto = leer_manifiesto(args.carpeta)
+    print(f"{filas} registros nuevos indexados en {time.perf_counter() - inicio:.1f}s "
+          f"({len(manifiesto['segmentos'])} segmentos, CSV cubierto hasta el byte {manifiesto['offset_csv']})")
+
+    if args.comparar:
+        # Las columnas que usan rankings, agregados y alertas (log_id solo se usa al escribir)
+        columnas = ['telegram_id', 'xp_ganado', 'tipo_actividad', 'fecha_registro', 'valor']
+        inicio = time.perf_counter()
+        df_csv = pd.read_csv(args.registros, usecols=columnas)
+        segundos_csv = time.perf_counter() - inicio
+        memoria_csv = df_csv.memory_usage(deep=True).sum()
+        del df_csv
+
+        inicio = time.perf_counter()
+        df_col = leer_registros(args.carpeta, columnas)
+        segundos_col = time.perf_counter() - inicio
+        memoria_col = df_col.memory_usage(deep=True).sum()
+
+        print(f"CSV:      {segundos_csv:.2f}s, {memoria_csv / 1e6:.0f} MB")
+        print(f"Columnar: {segundos_col:.2f}s, {memoria_col / 1e6:.0f} MB")
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+import threading
+
+# --- CONFIGURACIÓN ---
+CAPACIDAD_INDICE = 100_000  # log_id recientes con su resultado guardados en memoria (LRU)
+
+
+class IndiceIdempotencia:
+    """
+    Índice de log_id ya registrados, para que un reintento del cliente no sume el XP dos veces.
+
+    En memoria guarda solo los log_id recientes (LRU acotado) junto al resultado
+    original: (telegram_id, xp_ganado, xp_total_actual). Si un log_id no está en
+    memoria se consulta al almacén, que es la fuente de verdad; en ese caso se
+    sabe que es un duplicado pero ya no se tiene el resultado original.
+
+    El bloqueo `bloqueo` debe envolver la verificación y la escritura, para que
+    dos reintentos simultáneos del mismo evento no pasen ambos la verificación.
+    """
+
+    def __init__(self, almacen, capacidad=CAPACIDAD_INDICE):
+        self.almacen = almacen
+        self.capacidad = capacidad
+        self.bloqueo = threading.RLock()
+        self._recientes = OrderedDict()  # log_id -> (telegram_id, xp_ganado, xp_total_actual)
+        self.duplicados = 0
+
+    def buscar(self, log_ids):
+        """
+        Devuelve {log_id: resultado original o None} para los log_id ya registrados.
+        None significa que está en el almacén pero salió del índice en memoria.
+        """
+        with self.bloqueo:
+            encontrados = {}
+            faltantes = []
+            for log_id in log_ids:
+                resultado = self._recientes.get(log_id)
+                if resultado is None:
+                    faltantes.append(log_id)
+                else:
+                    self._recientes.move_to_end(log_id)
+                    encontrados[log_id] = resultado
+            if faltantes:
+                encontrados.update(dict.fromkeys(self.almacen.registros_existentes(faltantes)))
+            self.duplicados += len(encontrados)
+            return encontrados
+
+    def recordar(self, log_id, telegram_id, xp_ganado, xp_total_actual):
+        self.recordar_lote([log_id], [telegram_id], [xp_ganado], [xp_total_actual])
+
+    def recordar_lote(self, log_ids, telegram_ids, xps, xp_totales):
+        with self.bloqueo:
+            for log_id, telegram_id, xp, xp_total in zip(log_ids, telegram_ids, xps, xp_totales):
+                self._recientes[log_id] = (int(telegram_id), int(xp), int(xp_total))
+            while len(self._recientes) > self.capacidad:
+                self._recientes.popitem(last=False)
+
+    def estadisticas(self):
+        with self.bloqueo:
+            return {
+                "en_memoria": len(self._recientes),
+                "capacidad": self.capacidad,
+                "duplicados": self.duplicados,
+            }
@@ -0,0 +1,260 @@
+# perfilador.py
+
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- CONFIGURACIÓN ---
+# UCONNECT_PERFILAR elige el modo; sin la variable no se instala ningún hook (costo cero):
+#   header  solo las peticiones que traen el encabezado X-Perfilar
+#   lentas  además, toda petición que tarde más que el umbral
+#   todas   todas las peticiones (solo para pruebas: llena la carpeta rápido)
+MODOS = ('header', 'lentas', 'todas')
+CARPETA_PERFILES = 'database/perfiles'   # Se cambia con UCONNECT_PERFILES_DIR
+UMBRAL_LENTA_MS = 500                     # Se cambia con UCONNECT_PERFILAR_UMBRAL_MS
+INTERVALO_MUESTREO = 0.005                # Segundos entre dos muestras de la pila
+MAX_PERFILES_POR_RUTA = 50                # Al pasar de esto se borran los más antiguos de la ruta
+ENCABEZADO = 'X-Perfilar'                 # 'cprofile' para cProfile; cualquier otro valor, muestreo
+# X-Perfilar solo se atiende desde la propia máquina o, con UCONNECT_PERFILAR_SECRETO, si la
+# petición trae ese secreto en X-Perfilar-Secreto (necesario detrás de un proxy local)
+ENCABEZADO_SECRETO = 'X-Perfilar-Secreto'
+DIRECCIONES_LOCALES = ('127.0.0.1', '::1')
+MAX_PERFILES_POR_MINUTO = 30              # Por proceso, salvo el modo 'todas'; UCONNECT_PERFILAR_MAX_POR_MINUTO
+
+
+# code object -> 'funcion (archivo.py:linea)', para no armar el texto en cada muestra
+_ETIQUETAS = {}
+
+
+def _etiqueta(codigo):
+    etiqueta = _ETIQUETAS.get(codigo)
+    if etiqueta is None:
+        etiqueta = _ETIQUETAS[codigo] = f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+    return etiqueta
+
+
+def _pila(marco):
+    """Pila del marco en formato 'plegado' (de la raíz a la hoja, separada por ';')."""
+    etiquetas = []
+    while marco is not None:
+        etiquetas.append(_etiqueta(marco.f_code))
+        marco = marco.f_back
+    return ';'.join(reversed(etiquetas))
+
+
+class Muestreador:
+    """
+    Un hilo que cada 'intervalo' segundos toma la pila de los hilos registrados y
+    cuenta cuántas veces aparece cada una. No agrega costo al código medido: solo
+    compite por el GIL mientras lee las pilas.
+    """
+
+    def __init__(self, intervalo=INTERVALO_MUESTREO):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pilas = {}      # ident del hilo -> Counter(pila -> muestras)
+        self._hilo = None
+
+    def iniciar(self, ident):
+        with self._lock:
+            self._pilas[ident] = Counter()
+            # Se arranca con la primera captura (después del fork, en cada worker de servidor.py)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='perfilador', daemon=True)
+                self._hilo.start()
+
+    def detener(self, ident):
+        with self._lock:
+            return self._pilas.pop(ident, Counter())
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                if not self._pilas:
+                    continue
+                marcos = sys._current_frames()
+                for ident, pilas in self._pilas.items():
+                    marco = marcos.get(ident)
+                    if marco is not None:
+                        pilas[_pila(marco)] += 1
+
+
+class Perfilador:
+    """
+    Captura dónde se va el tiempo de una petición (o de cualquier bloque con capturar()).
+
+    Por defecto usa el muestreador: guarda un archivo .folded por petición, con una
+    línea 'pila muestras' por pila distinta. Es la entrada de flamegraph.pl y de
+    speedscope, y los archivos de una misma ruta se pueden concatenar.
+    Con cProfile (X-Perfilar: cprofile) guarda un .prof de pstats. Se usa para ver
+    cuántas veces se llama cada función. Solo corre una captura así a la vez.
+    """
+
+    def __init__(self, modo, carpeta=CARPETA_PERFILES, umbral_ms=UMBRAL_LENTA_MS, intervalo=INTERVALO_MUESTREO,
+                 max_por_minuto=MAX_PERFILES_POR_MINUTO, secreto=None):
+        if modo not in MODOS:
+            raise ValueError(f"UCONNECT_PERFILAR desconocido: {modo} (usa {', '.join(MODOS)})")
+        self.modo = modo
+        self.carpeta = carpeta
+        self.umbral_ms = umbral_ms
+        self.max_por_minuto = max_por_minuto
+        self.secreto = secreto
+        self._muestreador = Muestreador(intervalo)
+        self._lock_cprofile = threading.Lock()
+        self._lock_cupo = threading.Lock()
+        self._recientes = deque()   # Momento de cada archivo guardado en el último minuto
+        self.guardados = 0
+
+    def iniciar(self, pedido=None):
+        """
+        Empieza a medir el hilo actual. pedido: None (decide el modo), 'muestreo' o 'cprofile'.
+        Devuelve el estado que recibe terminar(), o None si no hay nada que medir.
+        """
+        if pedido and not self._hay_cupo():
+            pedido = None
+        if pedido == 'cprofile' and self._lock_cprofile.acquire(blocking=False):
+            perfil = cProfile.Profile()
+            perfil.enable()
+            return ('cprofile', perfil, time.perf_counter(), True)
+        if pedido or self.modo != 'header':
+            ident = threading.get_ident()
+            self._muestreador.iniciar(ident)
+            return ('muestreo', ident, time.perf_counter(), pedido is not None)
+        return None
+
+    def terminar(self, estado, nombre):
+        """
+        Termina la captura y la guarda si fue pedida, si el modo es 'todas' o si pasó del
+        umbral, y queda cupo en el minuto. Devuelve la ruta del archivo guardado, o None.
+        """
+        tipo, dato, inicio, pedido = estado
+        ms = (time.perf_counter() - inicio) * 1000
+        if tipo == 'cprofile':
+            dato.disable()
+            self._lock_cprofile.release()
+            if not self._hay_cupo(consumir=True):
+                return None
+            ruta = self._archivo(nombre, ms, 'prof')
+            dato.dump_stats(ruta)
+        else:
+            pilas = self._muestreador.detener(dato)
+            if not pilas or not (pedido or self.modo == 'todas' or ms >= self.umbral_ms):
+                return None
+            if not self._hay_cupo(consumir=True):
+                return None
+            ruta = self._archivo(nombre, ms, 'folded')
+            with open(ruta, 'w', encoding='utf-8') as f:
+                for pila, muestras in pilas.most_common():
+                    f.write(f"{pila} {muestras}\n")
+        self.guardados += 1
+        self._podar(os.path.dirname(ruta))
+        return ruta
+
+    @contextmanager
+    def capturar(self, nombre, pedido=None):
+        """Mide un bloque fuera de una petición (un script, la carga inicial)."""
+        estado = self.iniciar(pedido)
+        try:
+            yield
+        finally:
+            if estado is not None:
+                self.terminar(estado, nombre)
+
+    def _hay_cupo(self, consumir=False):
+        """Si se puede guardar otro archivo sin pasar de max_por_minuto (consumir: lo cuenta)."""
+        if self.modo == 'todas' or not self.max_por_minuto:
+            return True
+        ahora = time.monotonic()
+        with self._lock_cupo:
+            while self._recientes and ahora - self._recientes[0] >= 60:
+                self._recientes.popleft()
+            if len(self._recientes) >= self.max_por_minuto:
+                return False
+            if consumir:
+                self._recientes.append(ahora)
+            return True
+
+    def _archivo(self, nombre, ms, extension):
+        """carpeta/<ruta>/<fecha>_<ms>ms_<pid>.<extension>: una carpeta por ruta, ordenada por fecha."""
+        carpeta = os.path.join(self.carpeta, re.sub(r'[^A-Za-z0-9_.-]+', '_', nombre).strip('_') or 'raiz')
+        os.makedirs(carpeta, exist_ok=True)
+        return os.path.join(carpeta, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{ms:.0f}ms_{os.getpid()}.{extension}")
+
+    @staticmethod
+    def _podar(carpeta):
+        archivos = sorted(os.listdir(carpeta))
+        for archivo in archivos[:max(len(archivos) - MAX_PERFILES_POR_RUTA, 0)]:
+            try:
+                os.remove(os.path.join(carpeta, archivo))
+            except FileNotFoundError:
+                pass   # Otro worker lo borró primero
+
+
+def crear_perfilador():
+    """Perfilador según UCONNECT_PERFILAR (ver MODOS), o None si la variable no está."""
+    modo = os.environ.get('UCONNECT_PERFILAR', '').lower()
+    if not modo:
+        return None
+    return Perfilador(modo,
+                      carpeta=os.environ.get('UCONNECT_PERFILES_DIR', CARPETA_PERFILES),
+                      umbral_ms=float(os.environ.get('UCONNECT_PERFILAR_UMBRAL_MS', UMBRAL_LENTA_MS)),
+                      max_por_minuto=int(os.environ.get('UCONNECT_PERFILAR_MAX_POR_MINUTO', MAX_PERFILES_POR_MINUTO)),
+                      secreto=os.environ.get('UCONNECT_PERFILAR_SECRETO') or None)
+
+
+def registrar_perfilador(app, perfilador=None):
+    """
+    Perfila las peticiones de la app según el modo, y las que traen X-Perfilar (desde la
+    propia máquina o con el secreto). La respuesta de una petición guardada trae X-Perfil
+    con el archivo, relativo a la carpeta de perfiles.
+    Sin perfilador (UCONNECT_PERFILAR vacía) no registra nada. Devuelve el perfilador.
+    """
+    perfilador = perfilador or crear_perfilador()
+    if perfilador is None:
+        return None
+    from flask import g, request
+
+    def autorizado():
+        if perfilador.secreto:
+            recibido = request.headers.get(ENCABEZADO_SECRETO, '')
+            return hmac.compare_digest(recibido.encode(), perfilador.secreto.encode())
+        return request.remote_addr in DIRECCIONES_LOCALES
+
+    @app.before_request
+    def _iniciar_perfil():
+        pedido = request.headers.get(ENCABEZADO)
+        if pedido and not autorizado():
+            pedido = None
+        if pedido:
+            pedido = 'cprofile' if pedido.lower() == 'cprofile' else 'muestreo'
+        g.perfil = perfilador.iniciar(pedido)
+
+    def terminar():
+        estado = g.pop('perfil', None)
+        if estado is None:
+            return None
+        regla = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        return perfilador.terminar(estado, f"{request.method} {regla}")
+
+    @app.after_request
+    def _guardar_perfil(resp):
+        ruta = terminar()
+        if ruta:
+            # Sin la ruta absoluta: no se expone dónde está instalado el servidor
+            resp.headers['X-Perfil'] = os.path.relpath(ruta, perfilador.carpeta)
+        return resp
+
+    @app.teardown_request
+    def _cerrar_perfil(exc):
+        # Si la vista lanzó una excepción after_request no corre: se cierra aquí
+        terminar()
+
+    return perfilador
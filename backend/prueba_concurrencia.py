@@ -0,0 +1,222 @@
+import argparse
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pandas as pd
+import requests
+
+from almacen import COLUMNAS_USUARIOS, COLUMNAS_REGISTROS
+
+# --- CONFIGURACIÓN ---
+USUARIOS = 50
+PETICIONES = 2000
+HILOS = 16
+PROBABILIDAD_REINTENTO = 0.1   # Fracción de peticiones que se reenvían con el mismo log_id
+USUARIOS_CON_ALERTA = 10       # Usuarios que reciben tres noches cortas (una alerta SUENO_INSUFICIENTE cada uno)
+SERVIDOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'servidor.py')
+
+# Prueba de consistencia de servidor.py: levanta el servidor con varios workers sobre
+# una carpeta temporal, manda registrar_actividad en paralelo (con reintentos del mismo
+# log_id y, opcionalmente, una recarga SIGHUP en medio) y verifica que:
+#   - todas las peticiones respondieron bien,
+#   - cada reintento se reconoció como duplicado (sin sumar XP),
+#   - el xp_total de cada usuario (leído de varios workers y del disco) es exactamente
+#     la suma de lo enviado, y el log tiene una fila por evento, sin duplicados,
+#   - cada alerta de bienestar se emite una sola vez y todos los workers la devuelven
+#     con el mismo id en /api/alertas.
+# Al final mide cuántas lecturas del ranking por segundo atiende el servidor.
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _preparar_datos(carpeta, usuarios):
+    os.makedirs(os.path.join(carpeta, 'database'))
+    pd.DataFrame({
+        'telegram_id': range(1, usuarios + 1),
+        'nombre': [f"Usuario {i}" for i in range(1, usuarios + 1)],
+        'xp_total': 0,
+        'liga_actual': 'Novato',
+        'fecha_creacion': '2025-01-01 00:00:00',
+    })[COLUMNAS_USUARIOS].to_csv(os.path.join(carpeta, 'database', 'usuarios.csv'), index=False)
+    pd.DataFrame(columns=COLUMNAS_REGISTROS).to_csv(os.path.join(carpeta, 'database', 'registros.csv'), index=False)
+
+
+def _esperar_servidor(url, proceso, segundos=120):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó al iniciar.")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("El servidor no respondió a tiempo.")
+
+
+def _leer_disco(carpeta, tipo):
+    """(xp_total por usuario, DataFrame de registros) tal como quedaron persistidos."""
+    if tipo == 'sqlite':
+        con = sqlite3.connect(os.path.join(carpeta, 'database', 'uconnect.db'))
+        usuarios = pd.read_sql_query("SELECT telegram_id, xp_total FROM usuarios", con)
+        registros = pd.read_sql_query("SELECT * FROM registros", con)
+        con.close()
+    else:
+        usuarios = pd.read_csv(os.path.join(carpeta, 'database', 'usuarios.csv'))
+        registros = pd.read_csv(os.path.join(carpeta, 'database', 'registros.csv'), dtype={'log_id': str})
+    return usuarios.set_index('telegram_id')['xp_total'], registros
+
+
+def ejecutar(workers, tipo, usuarios=USUARIOS, peticiones=PETICIONES, hilos=HILOS, recargar=False):
+    """Corre la prueba completa. Devuelve la lista de problemas encontrados (vacía si todo cuadró)."""
+    carpeta = tempfile.mkdtemp(prefix='uconnect-prueba-')
+    _preparar_datos(carpeta, usuarios)
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    entorno = {**os.environ, 'UCONNECT_ALMACEN': tipo}
+    if tipo == 'sqlite':
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(SERVIDOR), 'almacen_sqlite.py')],
+                       cwd=carpeta, env=entorno, check=True, stdout=subprocess.DEVNULL)
+    proceso = subprocess.Popen(
+        [sys.executable, SERVIDOR, '--host', '127.0.0.1', '--puerto', str(puerto), '--workers', str(workers)],
+        cwd=carpeta, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    problemas = []
+    try:
+        _esperar_servidor(url, proceso)
+
+        # 1. Eventos: (log_id, telegram_id, xp); una parte se reenvía con el mismo log_id
+        rng = random.Random(1)
+        eventos = [(str(uuid.uuid4()), rng.randint(1, usuarios), rng.randint(1, 50)) for _ in range(peticiones)]
+        envios = eventos + [e for e in eventos if rng.random() < PROBABILIDAD_REINTENTO]
+        rng.shuffle(envios)
+
+        sesiones = threading.local()
+        respuestas = {}
+        lock = threading.Lock()
+
+        def enviar(evento):
+            log_id, telegram_id, xp = evento
+            sesion = getattr(sesiones, 'sesion', None) or requests.Session()
+            sesiones.sesion = sesion
+            r = sesion.post(f"{url}/api/registrar_actividad", timeout=60, json={
+                'log_id': log_id, 'telegram_id': telegram_id, 'tipo_actividad': 'ESTUDIO', 'xp_a_sumar': xp,
+            })
+            cuerpo = r.json() if r.headers.get('Content-Type', '').startswith('application/json') else {'cuerpo': r.text[:200]}
+            with lock:
+                respuestas.setdefault(log_id, []).append((r.status_code, cuerpo))
+
+        # 2. Carga en paralelo (con una recarga en medio si se pidió)
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(hilos) as ejecutor:
+            futuros = [ejecutor.submit(enviar, evento) for evento in envios]
+            if recargar:
+                time.sleep(0.5)
+                proceso.send_signal(signal.SIGHUP)
+            for futuro in futuros:
+                futuro.result()
+        segundos = time.perf_counter() - inicio
+        print(f"{len(envios)} escrituras en {segundos:.1f}s ({len(envios) / segundos:.0f}/s) con {workers} workers ({tipo})")
+
+        # 3. Respuestas: todas 200, y de cada log_id una sola como nueva y el resto como duplicado.
+        # (Si el reintento cae en otro worker, su xp_total_actual es el actual y no el original:
+        # el índice de idempotencia en memoria es de cada proceso.)
+        esperado = pd.Series(0, index=range(1, usuarios + 1))
+        for log_id, telegram_id, xp in eventos:
+            esperado[telegram_id] += xp
+            resultado = respuestas[log_id]
+            if any(status != 200 for status, _ in resultado):
+                problemas.append(f"{log_id}: respuestas {resultado}")
+            elif sum(not r.get('duplicado') for _, r in resultado) != 1:
+                problemas.append(f"{log_id}: se registró {sum(not r.get('duplicado') for _, r in resultado)} veces {resultado}")
+
+        # 4. xp_total visto desde los workers (varias lecturas: cada una puede caer en otro worker)
+        with requests.Session() as sesion:
+            for _ in range(3):
+                for telegram_id in esperado.index:
+                    xp = sesion.get(f"{url}/api/usuario/{telegram_id}", timeout=10).json().get('xp_total')
+                    if xp != esperado[telegram_id]:
+                        problemas.append(f"Usuario {telegram_id}: la API dice {xp}, se esperaba {esperado[telegram_id]}")
+
+            # 5. Alertas: tres noches cortas por usuario, cada una en su propia petición (en
+            # paralelo, así caen en workers distintos). Una alerta por usuario, la misma en todos
+            con_alerta = list(range(1, min(usuarios, USUARIOS_CON_ALERTA) + 1))
+            eventos_alerta = [
+                {'log_id': str(uuid.uuid4()), 'telegram_id': telegram_id, 'tipo_actividad': 'SUENO', 'xp_a_sumar': 1,
+                 'valor': 4, 'fecha_registro': (date.today() - timedelta(days=dias)).strftime('%Y-%m-%d 08:00:00')}
+                for dias in (2, 1, 0) for telegram_id in con_alerta
+            ]
+            with ThreadPoolExecutor(hilos) as ejecutor:
+                for r in ejecutor.map(lambda e: requests.post(f"{url}/api/registrar_actividades", json=[e], timeout=60),
+                                      eventos_alerta):
+                    if r.status_code != 200 or r.json().get('aceptados') != 1:
+                        problemas.append(f"Evento de sueño rechazado: {r.status_code} {r.text[:200]}")
+            for evento in eventos_alerta:
+                esperado[evento['telegram_id']] += evento['xp_a_sumar']
+            vistas = [sesion.get(f"{url}/api/alertas", params={'desde': 0}, timeout=10).json()['alertas']
+                      for _ in range(3 * workers)]
+            if any(vista != vistas[0] for vista in vistas):
+                problemas.append(f"Los workers devuelven alertas distintas: {vistas}")
+            ids = [alerta['id'] for alerta in vistas[0]]
+            avisados = sorted(alerta['telegram_id'] for alerta in vistas[0] if alerta['codigo'] == 'SUENO_INSUFICIENTE')
+            if ids != sorted(set(ids)) or avisados != con_alerta:
+                problemas.append(f"Alertas: se esperaba una SUENO_INSUFICIENTE para {con_alerta}; llegaron {vistas[0]}")
+
+            # 6. Lecturas por segundo (ranking semanal)
+            inicio = time.perf_counter()
+            lecturas = 0
+            with ThreadPoolExecutor(hilos) as ejecutor:
+                for _ in ejecutor.map(lambda i: requests.get(f"{url}/api/ranking/semanal", timeout=10),
+                                      range(peticiones)):
+                    lecturas += 1
+            segundos = time.perf_counter() - inicio
+            print(f"{lecturas} lecturas en {segundos:.1f}s ({lecturas / segundos:.0f}/s)")
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=60)
+
+    # 7. Lo persistido: un registro por evento, sin duplicados, y XP cuadrado por usuario
+    xp_disco, registros = _leer_disco(carpeta, tipo)
+    if registros['log_id'].duplicated().any():
+        problemas.append(f"Hay {int(registros['log_id'].duplicated().sum())} log_id duplicados en el disco.")
+    enviados = len(eventos) + len(eventos_alerta)
+    if len(registros) != enviados:
+        problemas.append(f"El disco tiene {len(registros)} registros; se enviaron {enviados} eventos distintos.")
+    xp_registros = registros.groupby('telegram_id')['xp_ganado'].sum().reindex(esperado.index, fill_value=0)
+    for telegram_id in esperado.index:
+        if xp_disco.get(telegram_id) != esperado[telegram_id] or xp_registros[telegram_id] != esperado[telegram_id]:
+            problemas.append(f"Usuario {telegram_id}: disco xp_total={xp_disco.get(telegram_id)}, "
+                             f"suma de registros={xp_registros[telegram_id]}, esperado={esperado[telegram_id]}")
+    return problemas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de consistencia de servidor.py bajo escrituras en paralelo.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--almacen', choices=['csv', 'sqlite', 'mmap'], default='csv')
+    parser.add_argument('--peticiones', type=int, default=PETICIONES)
+    parser.add_argument('--hilos', type=int, default=HILOS)
+    parser.add_argument('--recargar', action='store_true', help="Enviar SIGHUP al servidor en medio de la carga.")
+    args = parser.parse_args()
+
+    problemas = ejecutar(args.workers, args.almacen, peticiones=args.peticiones, hilos=args.hilos, recargar=args.recargar)
+    for problema in problemas[:20]:
+        print(f"  - {problema}")
+    print("OK: los datos quedaron consistentes." if not problemas else f"FALLÓ: {len(problemas)} problemas.")
+    sys.exit(1 if problemas else 0)
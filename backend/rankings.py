@@ -0,0 +1,223 @@
+import pandas as pd
+import heapq
+from bisect import bisect_left, bisect_right, insort
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+# --- CONFIGURACIÓN ---
+# Largo de cada ventana en días (la ventana incluye el día de hoy)
+PERIODOS = {
+    'semanal': 7,
+    'mensual': 30,
+    'semestral': 182,
+}
+TOP_K = 10
+# Un lote con más cambios que esto descarta el orden de las sumas (se vuelve a ordenar al consultar una posición)
+MAX_CAMBIOS_INCREMENTALES = 256
+
+
+class VentanaRanking:
+    """
+    Suma de XP por usuario en los últimos 'dias' días, mantenida de forma incremental.
+
+    Los eventos se agrupan en baldes diarios. Al cambiar el día, los baldes que
+    quedan fuera de la ventana se restan de las sumas (sin recorrer el historial).
+    El top-K se actualiza en cada suma y solo se recalcula cuando expira un balde.
+    Para las posiciones se guardan las sumas ordenadas: ubicar a un usuario es una
+    búsqueda binaria, no un recorrido de todos los usuarios.
+    """
+
+    def __init__(self, dias, top_k=TOP_K):
+        self.dias = dias
+        self.top_k = top_k
+        self._baldes = {}                 # dia -> {telegram_id: xp}
+        self._sumas = defaultdict(int)    # telegram_id -> xp dentro de la ventana
+        self._top = []                    # [(xp, telegram_id)] ordenado de mayor a menor
+        self._top_valido = True
+        self._ordenadas = None            # Sumas ordenadas de menor a mayor (None: se ordenan al consultar)
+
+    def _primer_dia(self, hoy):
+        return hoy - timedelta(days=self.dias - 1)
+
+    def agregar(self, telegram_id, xp, dia, hoy):
+        """Suma xp del usuario en el balde del día indicado (si cae dentro de la ventana)."""
+        if dia < self._primer_dia(hoy):
+            return
+        balde = self._baldes.setdefault(dia, defaultdict(int))
+        balde[telegram_id] += xp
+        anterior = self._sumas.get(telegram_id)
+        self._sumas[telegram_id] += xp
+        self._actualizar_top(telegram_id, xp)
+        self._actualizar_orden(anterior, self._sumas[telegram_id])
+
+    def _actualizar_orden(self, anterior, nuevo):
+        if self._ordenadas is None:
+            return
+        if anterior is not None:
+            del self._ordenadas[bisect_left(self._ordenadas, anterior)]
+        insort(self._ordenadas, nuevo)
+
+    def _actualizar_top(self, telegram_id, xp):
+        if not self._top_valido:
+            return
+        if xp < 0:
+            # Una resta puede sacar a alguien del top sin que sepamos quién entra: recalcular
+            self._top_valido = False
+            return
+
+        nuevo_total = self._sumas[telegram_id]
+        top = [(x, i) for x, i in self._top if i != telegram_id]
+        if len(top) < self.top_k or nuevo_total > top[-1][0]:
+            top.append((nuevo_total, telegram_id))
+            top.sort(key=lambda par: par[0], reverse=True)
+            del top[self.top_k:]
+        self._top = top
+
+    def expirar(self, hoy):
+        """Descarta los baldes que quedaron fuera de la ventana."""
+        primer_dia = self._primer_dia(hoy)
+        # A lo más un balde por día de la ventana: recorrerlos es O(dias), no O(registros)
+        for dia in [d for d in self._baldes if d < primer_dia]:
+            balde = self._baldes.pop(dia)
+            for telegram_id, xp in balde.items():
+                self._sumas[telegram_id] -= xp
+                if self._sumas[telegram_id] == 0:
+                    del self._sumas[telegram_id]
+            self._top_valido = False
+            self._ordenadas = None
+
+    def top(self):
+        """Top-K de la ventana como lista de (telegram_id, xp)."""
+        if not self._top_valido:
+            mejores = heapq.nlargest(self.top_k, self._sumas.items(), key=lambda par: par[1])
+            self._top = [(xp, telegram_id) for telegram_id, xp in mejores if xp > 0]
+            self._top_valido = True
+        return [(telegram_id, xp) for xp, telegram_id in self._top]
+
+    def xp_de(self, telegram_id):
+        return self._sumas.get(telegram_id, 0)
+
+    def posicion(self, telegram_id):
+        """
+        (xp, posición, participantes) del usuario en la ventana. La posición es 1 + cuántos
+        tienen más XP (los empates comparten posición) y es None si no sumó XP en la ventana.
+        """
+        if self._ordenadas is None:
+            self._ordenadas = sorted(self._sumas.values())
+        participantes = len(self._ordenadas) - bisect_right(self._ordenadas, 0)
+        xp = self._sumas.get(telegram_id, 0)
+        if xp <= 0:
+            return xp, None, participantes
+        return xp, len(self._ordenadas) - bisect_right(self._ordenadas, xp) + 1, participantes
+
+    def serie(self, telegram_id, dias, hoy):
+        """XP del usuario en cada uno de los últimos 'dias' días (hasta hoy), como [(dia, xp)]."""
+        dias = min(dias, self.dias)
+        serie = []
+        for atras in range(dias - 1, -1, -1):
+            dia = hoy - timedelta(days=atras)
+            balde = self._baldes.get(dia)
+            serie.append((dia, balde.get(telegram_id, 0) if balde else 0))
+        return serie
+
+
+class MotorRankings:
+    """
+    Rankings semanal, mensual y semestral actualizados a medida que llegan actividades.
+    Consultar un ranking no recorre los registros: solo lee el top-K ya calculado.
+    """
+
+    def __init__(self, periodos=PERIODOS, top_k=TOP_K):
+        self.periodos = periodos
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._ventanas = {nombre: VentanaRanking(dias, self.top_k) for nombre, dias in self.periodos.items()}
+        self._hoy = date.today()
+
+    def _avanzar_dia(self):
+        hoy = date.today()
+        if hoy != self._hoy:
+            self._hoy = hoy
+            for ventana in self._ventanas.values():
+                ventana.expirar(hoy)
+
+    def reconstruir(self, df_registros):
+        """Recalcula todas las ventanas desde un DataFrame de registros (al iniciar o al recargar)."""
+        with self._lock:
+            self._reiniciar()
+            # El top-K se calcula una sola vez al final, no en cada suma
+            for ventana in self._ventanas.values():
+                ventana._top_valido = False
+            self._sumar_lote(df_registros)
+
+    def registrar_lote(self, df_registros):
+        """Suma un lote de registros recién ingresados a todas las ventanas."""
+        with self._lock:
+            self._avanzar_dia()
+            self._sumar_lote(df_registros)
+
+    def _sumar_lote(self, df_registros):
+        if df_registros.empty:
+            return
+
+        fechas = pd.to_datetime(df_registros['fecha_registro'], errors='coerce')
+        desde = pd.Timestamp(self._hoy - timedelta(days=max(self.periodos.values()) - 1))
+        df = pd.DataFrame({
+            'dia': fechas.dt.normalize(),
+            'telegram_id': df_registros['telegram_id'],
+            'xp_ganado': pd.to_numeric(df_registros['xp_ganado'], errors='coerce').fillna(0),
+        })
+        df = df[df['dia'] >= desde]
+
+        # Una sola agrupación vectorizada por (día, usuario) y luego una suma por grupo
+        por_dia = df.groupby(['dia', 'telegram_id'])['xp_ganado'].sum().reset_index()
+        if len(por_dia) > MAX_CAMBIOS_INCREMENTALES:
+            # Más barato ordenar todo una vez que insertar cada cambio en la lista ordenada
+            for ventana in self._ventanas.values():
+                ventana._ordenadas = None
+        for dia, telegram_id, xp in por_dia.itertuples(index=False, name=None):
+            for ventana in self._ventanas.values():
+                ventana.agregar(int(telegram_id), int(xp), dia.date(), self._hoy)
+
+    def registrar(self, telegram_id, xp, fecha=None):
+        """Suma una actividad recién registrada a todas las ventanas."""
+        dia = (fecha or datetime.now()).date()
+        with self._lock:
+            self._avanzar_dia()
+            for ventana in self._ventanas.values():
+                ventana.agregar(telegram_id, xp, dia, self._hoy)
+
+    def top(self, periodo):
+        """Top-K del periodo como lista de (telegram_id, xp). KeyError si el periodo no existe."""
+        with self._lock:
+            self._avanzar_dia()
+            return self._ventanas[periodo].top()
+
+    def xp_de(self, periodo, telegram_id):
+        with self._lock:
+            self._avanzar_dia()
+            return self._ventanas[periodo].xp_de(telegram_id)
+
+    def posiciones(self, telegram_id):
+        """Por cada periodo: {'xp', 'posicion', 'participantes'} del usuario."""
+        with self._lock:
+            self._avanzar_dia()
+            posiciones = {}
+            for periodo, ventana in self._ventanas.items():
+                xp, posicion, participantes = ventana.posicion(telegram_id)
+                posiciones[periodo] = {'xp': xp, 'posicion': posicion, 'participantes': participantes}
+            return posiciones
+
+    def serie(self, telegram_id, dias):
+        """
+        XP del usuario por día en los últimos 'dias' días, como [(date, xp)]. Sale de los
+        baldes diarios de la ventana más larga, así que 'dias' se acota a su largo.
+        """
+        with self._lock:
+            self._avanzar_dia()
+            ventana = max(self._ventanas.values(), key=lambda v: v.dias)
+            return ventana.serie(telegram_id, dias, self._hoy)
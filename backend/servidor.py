@@ -0,0 +1,204 @@
+import argparse
+import glob
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+# --- CONFIGURACIÓN ---
+HOST = '0.0.0.0'
+PUERTO = 5000
+WORKERS = os.cpu_count() or 1     # Procesos que atienden peticiones (cada uno con varios hilos)
+TIEMPO_ARRANQUE = 120             # Segundos que se espera a que un worker cargue los datos
+TIEMPO_APAGADO = 30               # Segundos para terminar las peticiones en curso al detenerse
+ESPERA_REINICIO = 1.0             # Pausa antes de reemplazar un worker que murió solo
+CARPETA_METRICAS = 'database/metricas'   # Cada worker vuelca aquí sus métricas; /metrics suma las de todos
+
+# Servidor de producción de la API: un proceso maestro abre el puerto y crea (fork)
+# varios workers que aceptan conexiones del mismo socket. Cada worker importa api.py y
+# carga los datos por su cuenta. Las escrituras se coordinan con el bloqueo de escritura
+# del almacén (api.escritura_exclusiva) y cada worker se pone al día con lo que
+# escribieron los demás antes de atender una petición.
+#
+# Señales al maestro:
+#   SIGHUP          recarga sin cortar el servicio: arranca workers nuevos (con el código
+#                   y los datos actuales) y, cuando están listos, detiene los viejos, que
+#                   terminan las peticiones en curso.
+#   SIGTERM/SIGINT  se detiene terminando las peticiones en curso.
+#
+# Uso (desde la carpeta backend, como api.py):
+#   python servidor.py --workers 4
+#   kill -HUP <pid del maestro>
+
+
+def _log(mensaje):
+    print(f"[servidor {os.getpid()}] {mensaje}", flush=True)
+
+
+# --- WORKER ---
+
+def _servir(sock, aviso_listo):
+    """Cuerpo de cada worker (después del fork). No vuelve: termina el proceso."""
+    # Ctrl+C llega a todo el grupo de procesos; el maestro decide cómo se apaga cada worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from werkzeug.serving import make_server
+    import api
+
+    servidor = make_server(sock.getsockname()[0], sock.getsockname()[1], api.app, threaded=True, fd=sock.fileno())
+    # Al detenerse, server_close() espera a los hilos de las peticiones en curso
+    servidor.daemon_threads = False
+
+    def detener(*_):
+        # shutdown() espera a que serve_forever termine: no puede llamarse desde su propio hilo
+        threading.Thread(target=servidor.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, detener)
+
+    os.write(aviso_listo, b'1')
+    os.close(aviso_listo)
+    servidor.serve_forever()
+    servidor.server_close()
+    # sys.exit (y no os._exit) para que corran los atexit: el almacén hace fsync del log
+    sys.exit(0)
+
+
+# --- MAESTRO ---
+
+class Maestro:
+    """Crea y vigila los workers, y atiende las señales de recarga y apagado."""
+
+    def __init__(self, host=HOST, puerto=PUERTO, workers=WORKERS):
+        self.workers = workers
+        self.sock = socket.create_server((host, puerto), backlog=1024)
+        self.activos = set()    # pid de los workers de la generación actual
+        self.saliendo = set()   # pid de workers a los que se pidió terminar
+        self._recargar = False
+        self._detener = False
+        # Los workers heredan la variable; los volcados de una ejecución anterior no se suman
+        carpeta = os.environ.setdefault('UCONNECT_METRICAS_DIR', CARPETA_METRICAS)
+        for ruta in glob.glob(os.path.join(carpeta, '*.json')):
+            os.remove(ruta)
+
+    def _crear_worker(self):
+        """Hace fork de un worker. Devuelve (pid, fd donde avisará que está listo)."""
+        lectura, escritura = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(lectura)
+            try:
+                _servir(self.sock, escritura)
+            except SystemExit:
+                raise
+            except BaseException as e:
+                print(f"[servidor {os.getpid()}] El worker no pudo iniciar: {e}", file=sys.stderr, flush=True)
+                os._exit(1)
+        os.close(escritura)
+        return pid, lectura
+
+    def _generacion(self, cantidad):
+        """Crea 'cantidad' workers y espera a que carguen. Devuelve (pid listos, pid fallidos)."""
+        pendientes = dict(self._crear_worker() for _ in range(cantidad))
+        listos = set()
+        limite = time.monotonic() + TIEMPO_ARRANQUE
+        for pid, lectura in pendientes.items():
+            restante = limite - time.monotonic()
+            if restante > 0 and self._esperar_aviso(lectura, restante):
+                listos.add(pid)
+            os.close(lectura)
+        fallidos = set(pendientes) - listos
+        for pid in fallidos:
+            self._terminar(pid)
+        return listos, fallidos
+
+    @staticmethod
+    def _esperar_aviso(lectura, segundos):
+        """True si el worker avisó que está listo; si murió antes, read devuelve b''."""
+        listos, _, _ = select.select([lectura], [], [], segundos)
+        return bool(listos) and os.read(lectura, 1) == b'1'
+
+    def _terminar(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            self.saliendo.add(pid)
+        except ProcessLookupError:
+            pass
+
+    def _recoger(self):
+        """Recoge workers terminados; reemplaza los de la generación actual que murieron solos."""
+        while True:
+            try:
+                pid, estado = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.saliendo.discard(pid)
+            if pid in self.activos and not self._detener:
+                self.activos.discard(pid)
+                _log(f"El worker {pid} terminó inesperadamente (estado {estado}); se reemplaza.")
+                time.sleep(ESPERA_REINICIO)
+                nuevos, _ = self._generacion(1)
+                self.activos |= nuevos
+
+    def recargar(self):
+        """Reemplazo sin corte: los workers viejos siguen atendiendo hasta que los nuevos están listos."""
+        _log("Recargando workers...")
+        nuevos, fallidos = self._generacion(self.workers)
+        if fallidos and not nuevos:
+            _log("Ningún worker nuevo pudo iniciar; se mantienen los anteriores.")
+            return
+        viejos, self.activos = self.activos, nuevos
+        for pid in viejos:
+            self._terminar(pid)
+        _log(f"Recarga lista: {len(nuevos)} workers nuevos, {len(viejos)} terminando sus peticiones.")
+
+    def detener(self):
+        _log("Deteniendo: se terminan las peticiones en curso.")
+        for pid in self.activos | self.saliendo:
+            self._terminar(pid)
+        limite = time.monotonic() + TIEMPO_APAGADO
+        while self.saliendo and time.monotonic() < limite:
+            self._recoger()
+            time.sleep(0.1)
+        for pid in self.saliendo:
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+
+    def ejecutar(self):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, '_recargar', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, '_detener', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, '_detener', True))
+
+        self.activos, _ = self._generacion(self.workers)
+        if not self.activos:
+            _log("Ningún worker pudo iniciar.")
+            self.detener()
+            return 1
+        host, puerto = self.sock.getsockname()[:2]
+        _log(f"API lista en http://{host}:{puerto}/ con {len(self.activos)} workers (pid del maestro {os.getpid()}).")
+
+        while not self._detener:
+            if self._recargar:
+                self._recargar = False
+                self.recargar()
+            self._recoger()
+            time.sleep(0.2)
+        self.detener()
+        return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor de producción de la API con varios procesos (pre-fork).")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--puerto', type=int, default=int(os.environ.get('PORT', PUERTO)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('UCONNECT_WORKERS', WORKERS)))
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        sys.exit("servidor.py necesita fork (Linux/macOS). En Windows usa: python api.py")
+    sys.exit(Maestro(args.host, args.puerto, args.workers).ejecutar())
@@ -0,0 +1,165 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from almacen import leer_fechas
+from rankings import PERIODOS
+
+# --- CONFIGURACIÓN ---
+CARPETA_SNAPSHOTS = 'database/snapshots'
+# Ligas según el XP total: (XP mínimo, nombre), de menor a mayor
+LIGAS = [
+    (0, 'Novato'),
+    (5000, 'Aprendiz'),
+    (15000, 'Guerrero'),
+    (30000, 'Maestro'),
+]
+_MINIMOS_LIGAS = np.array([minimo for minimo, _ in LIGAS])
+_NOMBRES_LIGAS = np.array([nombre for _, nombre in LIGAS], dtype=object)
+
+
+def codigo_liga(xp_totales):
+    """XP total (Serie o arreglo) -> índice en LIGAS de cada usuario, sin bucles."""
+    xp = np.asarray(pd.to_numeric(pd.Series(xp_totales), errors='coerce').fillna(0))
+    return np.maximum(np.searchsorted(_MINIMOS_LIGAS, xp, side='right') - 1, 0).astype('int8')
+
+
+def calcular_rankings(df_registros, hoy):
+    """
+    XP de cada usuario en cada periodo con una sola pasada por los registros: se marca
+    una vez en qué ventanas cae cada registro y se hace una única agrupación por usuario.
+    Devuelve {periodo: DataFrame(telegram_id, xp, posicion)} ordenado por posición.
+    Como en los rankings en vivo, las ventanas incluyen el día 'hoy' y solo entran usuarios con XP > 0.
+    """
+    fechas = leer_fechas(df_registros['fecha_registro'])
+    dias_atras = (pd.Timestamp(hoy) - fechas.dt.normalize()).dt.days
+    en_ventana = dias_atras.between(0, max(PERIODOS.values()) - 1)
+    xp = pd.to_numeric(df_registros['xp_ganado'], errors='coerce').fillna(0).astype('int64')[en_ventana]
+    dias_atras = dias_atras[en_ventana]
+
+    sumas = pd.DataFrame(
+        {periodo: xp.where(dias_atras < dias, 0) for periodo, dias in PERIODOS.items()}
+    ).groupby(pd.to_numeric(df_registros['telegram_id'], errors='coerce')[en_ventana].rename('telegram_id')).sum()
+
+    rankings = {}
+    for periodo in PERIODOS:
+        xp_periodo = sumas[periodo]
+        # Orden estable: a igual XP queda primero el telegram_id menor
+        xp_periodo = xp_periodo[xp_periodo > 0].sort_values(ascending=False, kind='stable')
+        rankings[periodo] = pd.DataFrame({
+            'telegram_id': xp_periodo.index.to_numpy(dtype='int64'),
+            'xp': xp_periodo.to_numpy(dtype='int64'),
+            'posicion': xp_periodo.rank(method='min', ascending=False).to_numpy(dtype='int32'),
+        })
+    return rankings
+
+
+def _guardar_npz(ruta, **arreglos):
+    """Escribe en un temporal y lo reemplaza de forma atómica: quien lee nunca ve un archivo a medias."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.npz.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **arreglos)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def _ruta_snapshot(carpeta, periodo, fecha):
+    return os.path.join(carpeta, periodo, f"{fecha.isoformat()}.npz")
+
+
+def generar_snapshots(almacen, hoy=None, carpeta=CARPETA_SNAPSHOTS, actualizar_ligas=True):
+    """
+    Trabajo por lotes: guarda el ranking de cada periodo al día 'hoy' y la liga de
+    cada usuario (carpeta/<periodo>/<fecha>.npz y carpeta/ligas/<fecha>.npz), y
+    opcionalmente actualiza liga_actual en el almacén. Devuelve un resumen, con los
+    telegram_id que cambiaron de liga en 'cambios_liga'.
+    """
+    inicio = time.perf_counter()
+    hoy = hoy or date.today()
+
+    # 1. Rankings de todos los periodos con una pasada por los registros de la ventana más larga
+    desde = datetime.combine(hoy - timedelta(days=max(PERIODOS.values())), datetime.min.time())
+    rankings = calcular_rankings(almacen.registros(desde=desde, columnas=['telegram_id', 'xp_ganado', 'fecha_registro']), hoy)
+    for periodo, ranking in rankings.items():
+        _guardar_npz(_ruta_snapshot(carpeta, periodo, hoy), **{c: ranking[c].to_numpy() for c in ranking.columns})
+
+    # 2. Ligas según el XP total de cada usuario
+    usuarios = almacen.usuarios()
+    telegram_ids = usuarios['telegram_id'].to_numpy(dtype='int64')
+    xp_totales = pd.to_numeric(usuarios['xp_total'], errors='coerce').fillna(0).to_numpy(dtype='int64')
+    codigos = codigo_liga(xp_totales)
+    _guardar_npz(_ruta_snapshot(carpeta, 'ligas', hoy), telegram_id=telegram_ids, xp_total=xp_totales,
+                 liga=codigos, nombres=_NOMBRES_LIGAS.astype(str))
+
+    # 3. Solo se escriben los usuarios que cambiaron de liga
+    ligas = pd.Series(_NOMBRES_LIGAS[codigos], index=telegram_ids)
+    cambios = ligas[ligas.to_numpy() != usuarios['liga_actual'].to_numpy()]
+    if actualizar_ligas and not cambios.empty:
+        almacen.actualizar_ligas({int(telegram_id): liga for telegram_id, liga in cambios.items()})
+
+    return {
+        "fecha": hoy.isoformat(),
+        "rankings": {periodo: len(ranking) for periodo, ranking in rankings.items()},
+        "ligas": {nombre: int((codigos == i).sum()) for i, nombre in enumerate(_NOMBRES_LIGAS)},
+        "cambios_liga": [int(telegram_id) for telegram_id in cambios.index] if actualizar_ligas else [],
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def fechas_snapshot(periodo, carpeta=CARPETA_SNAPSHOTS):
+    """Fechas (date) con snapshot guardado para el periodo, de la más antigua a la más reciente."""
+    ruta = os.path.join(carpeta, periodo)
+    if not os.path.isdir(ruta):
+        return []
+    return sorted(date.fromisoformat(nombre[:-len('.npz')]) for nombre in os.listdir(ruta) if nombre.endswith('.npz'))
+
+
+def leer_snapshot(periodo, fecha=None, carpeta=CARPETA_SNAPSHOTS):
+    """
+    Ranking guardado del periodo en la fecha indicada (o el más reciente) como
+    (fecha, DataFrame(telegram_id, xp, posicion)), o None si no hay snapshot.
+    """
+    if fecha is None:
+        fechas = fechas_snapshot(periodo, carpeta)
+        if not fechas:
+            return None
+        fecha = fechas[-1]
+    ruta = _ruta_snapshot(carpeta, periodo, fecha)
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta) as datos:
+        return fecha, pd.DataFrame({columna: datos[columna] for columna in ('telegram_id', 'xp', 'posicion')})
+
+
+if __name__ == '__main__':
+    from almacen import crear_almacen
+
+    parser = argparse.ArgumentParser(description="Guarda los snapshots de rankings y recalcula las ligas de todos los usuarios.")
+    parser.add_argument('--fecha', help="Día del snapshot YYYY-MM-DD (por defecto, hoy).")
+    parser.add_argument('--carpeta', default=CARPETA_SNAPSHOTS, help="Carpeta donde guardar los snapshots.")
+    parser.add_argument('--sin-ligas', action='store_true', help="No actualizar liga_actual en el almacén.")
+    args = parser.parse_args()
+
+    almacen = crear_almacen()
+    hoy = date.fromisoformat(args.fecha) if args.fecha else None
+    # Como /api/snapshots: con el bloqueo de escritura y al día con lo que escribieron los
+    # workers de la API, para no reescribir usuarios.csv con un xp_total viejo
+    with almacen.bloqueo_escritura():
+        almacen.sincronizar()
+        resumen = generar_snapshots(almacen, hoy, args.carpeta, actualizar_ligas=not args.sin_ligas)
+    almacen.cerrar()
+
+    print(f"Snapshots del {resumen['fecha']} guardados en {args.carpeta} ({resumen['segundos']}s)")
+    for periodo, usuarios in resumen['rankings'].items():
+        print(f"  {periodo}: {usuarios} usuarios con XP")
+    print(f"Ligas: {resumen['ligas']}")
+    print(f"Usuarios que cambiaron de liga: {len(resumen['cambios_liga'])}")
@@ -0,0 +1,13 @@
+"""
+Banco de pruebas de carga de UConnect (desde la raíz del repositorio):
+
+    python -m bench datos /tmp/uconnect-1m --usuarios 1000000 --eventos 50000000 --almacen mmap
+    python -m bench api --datos /tmp/uconnect-1m --almacen mmap --modo servidor --workers 4 --salida antes.json
+    python -m bench bot --salida bot.json
+    python -m bench comparar antes.json despues.json
+
+    datos.py         usuarios.csv y registros.csv sintéticos a la escala pedida
+    carga_api.py     latencia y rendimiento de cada ruta de backend/api.py
+    handlers_bot.py  microbenchmark de los handlers de telegram-bot.py
+    medicion.py      percentiles, resultados en JSON y comparación entre versiones
+"""
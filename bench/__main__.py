@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from . import carga_api, datos, handlers_bot
+from .medicion import TOLERANCIA, comparar, entorno, guardar, imprimir
+
+
+def _conjunto(args):
+    """Carpeta con los datos a usar (generada si hace falta). Devuelve (carpeta, resumen, es_temporal)."""
+    temporal = args.datos is None
+    carpeta = tempfile.mkdtemp(prefix='uconnect-bench-') if temporal else args.datos
+    if temporal or not os.path.exists(os.path.join(carpeta, 'database', 'usuarios.csv')):
+        os.makedirs(carpeta, exist_ok=True)
+        print(f"Generando {args.eventos} eventos de {args.usuarios} usuarios en {carpeta}...")
+        resumen = datos.generar(carpeta, args.usuarios, args.eventos, args.dias, args.semilla)
+    else:
+        resumen = datos.describir(carpeta)
+    datos.preparar_almacen(carpeta, args.almacen)
+    return carpeta, resumen, temporal
+
+
+def _api(args):
+    carpeta, resumen, temporal = _conjunto(args)
+    opciones = dict(peticiones=args.peticiones, lote=args.lote, solo=args.escenarios)
+    try:
+        if args.modo == 'test':
+            resultado = carga_api.en_proceso(carpeta, args.almacen, args.hilos or 1, **opciones)
+        else:
+            resultado = carga_api.con_servidor(carpeta, args.almacen, args.workers, args.hilos or carga_api.HILOS,
+                                               **opciones)
+    finally:
+        if temporal:
+            shutil.rmtree(carpeta, ignore_errors=True)
+    imprimir(f"API ({resultado['modo']}, almacén {args.almacen}, carga {resultado['carga_s']}s)",
+             resultado['escenarios'])
+    return resumen, resultado
+
+
+def _bot(args):
+    resultado = handlers_bot.ejecutar(args.iteraciones, args.escenarios)
+    if resultado.get('error'):
+        print(f"\nBot: {resultado['error']}", file=sys.stderr)
+    else:
+        imprimir("Bot (handlers con Update falso y backend simulado)", resultado['escenarios'])
+    return resultado
+
+
+def _comparar(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding='utf-8') as f:
+        nuevo = json.load(f)
+    filas = comparar(base, nuevo, args.tolerancia)
+    print(f"{base.get('version')} -> {nuevo.get('version')} (tolerancia {args.tolerancia:.0%})")
+    for escenario, metrica, antes, despues, cambio, regresion in filas:
+        marca = "  REGRESIÓN" if regresion else ""
+        print(f"  {escenario:<32}{metrica:<13}{antes:>12.2f}{despues:>12.2f}{cambio:>+9.1%}{marca}")
+    regresiones = sum(fila[-1] for fila in filas)
+    print(f"{regresiones} regresiones." if regresiones else "Sin regresiones.")
+    return 1 if regresiones else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Banco de pruebas de carga de UConnect.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    opciones_datos = argparse.ArgumentParser(add_help=False)
+    opciones_datos.add_argument('--usuarios', type=int, default=datos.USUARIOS)
+    opciones_datos.add_argument('--eventos', type=int, default=datos.EVENTOS)
+    opciones_datos.add_argument('--dias', type=int, default=datos.DIAS)
+    opciones_datos.add_argument('--semilla', type=int, default=datos.SEMILLA)
+    opciones_datos.add_argument('--almacen', choices=['csv', 'sqlite', 'mmap'], default='csv')
+
+    opciones_api = argparse.ArgumentParser(add_help=False)
+    opciones_api.add_argument('--datos', help="Carpeta con los datos (de 'datos'); si no se da, se generan en una temporal.")
+    opciones_api.add_argument('--modo', choices=['test', 'servidor'], default='test')
+    opciones_api.add_argument('--workers', type=int, default=2, help="Workers de servidor.py (modo servidor).")
+    opciones_api.add_argument('--hilos', type=int, help="Clientes en paralelo (por defecto 1 en modo test, "
+                                                         f"{carga_api.HILOS} en modo servidor).")
+    opciones_api.add_argument('--peticiones', type=int, default=carga_api.PETICIONES)
+    opciones_api.add_argument('--lote', type=int, default=carga_api.LOTE)
+
+    opciones_bot = argparse.ArgumentParser(add_help=False)
+    opciones_bot.add_argument('--iteraciones', type=int, default=handlers_bot.ITERACIONES)
+
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--escenarios', type=lambda s: set(s.split(',')), help="Solo estos escenarios (separados por coma).")
+    comunes.add_argument('--salida', help="Archivo JSON donde guardar los resultados.")
+
+    p = sub.add_parser('datos', parents=[opciones_datos], help="Genera un conjunto de datos sintético.")
+    p.add_argument('carpeta')
+    sub.add_parser('api', parents=[opciones_datos, opciones_api, comunes], help="Carga sobre las rutas de api.py.")
+    sub.add_parser('bot', parents=[opciones_bot, comunes], help="Microbenchmark de los handlers del bot.")
+    sub.add_parser('todo', parents=[opciones_datos, opciones_api, opciones_bot, comunes], help="api y bot.")
+    p = sub.add_parser('comparar', help="Compara dos resultados y sale con código 1 si hay regresiones.")
+    p.add_argument('base')
+    p.add_argument('nuevo')
+    p.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = parser.parse_args()
+
+    if args.comando == 'comparar':
+        return _comparar(args)
+    if args.comando == 'datos':
+        os.makedirs(args.carpeta, exist_ok=True)
+        resumen = datos.generar(args.carpeta, args.usuarios, args.eventos, args.dias, args.semilla)
+        print(f"{resumen['eventos']} eventos de {resumen['usuarios']} usuarios "
+              f"({resumen['bytes_registros'] / 1e6:.0f} MB) en {resumen['segundos_generacion']}s.")
+        datos.preparar_almacen(args.carpeta, args.almacen)
+        return 0
+
+    resultado = entorno()
+    if args.comando in ('api', 'todo'):
+        resultado['datos'], resultado['api'] = _api(args)
+    if args.comando in ('bot', 'todo'):
+        resultado['bot'] = _bot(args)
+    if args.salida:
+        guardar(resultado, args.salida)
+        print(f"\nResultados en {args.salida}")
+    # Un banco que no pudo medir falla: si no, una comparación en CI pasaría sin datos
+    return 1 if resultado.get('bot', {}).get('error') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
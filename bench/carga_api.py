@@ -0,0 +1,176 @@
+import importlib
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import pandas as pd
+import requests
+
+from .datos import BACKEND, PRIMER_ID, en_backend
+from .medicion import medir_concurrente, resumir
+
+# --- CONFIGURACIÓN ---
+PETICIONES = 1000          # Llamadas por escenario liviano
+HILOS = 8                  # Clientes en paralelo
+LOTE = 100                 # Eventos por llamada a /api/registrar_actividades
+REPETICIONES_PESADAS = 3   # Llamadas a /api/snapshots (recorre el semestre completo)
+TIEMPO_ARRANQUE = 600      # Segundos que se espera a que el servidor cargue los datos
+SERVIDOR = os.path.join(BACKEND, 'servidor.py')
+
+# Carga sobre cada ruta de backend/api.py, con dos formas de llamarla:
+#   'test'      el cliente de pruebas de Flask en este mismo proceso: mide el costo de
+#               la ruta (almacén, rankings, cache) sin red ni serialización HTTP.
+#   'servidor'  levanta servidor.py con varios workers y le pega por HTTP con 'hilos'
+#               clientes en paralelo: mide lo que ve el bot en producción.
+# Los escenarios de escritura anexan registros y usuarios nuevos a los datos usados.
+
+
+class _ClienteTest:
+    def __init__(self, app):
+        self._app = app
+        self._local = threading.local()
+
+    def pedir(self, metodo, ruta, cuerpo=None):
+        cliente = getattr(self._local, 'cliente', None) or self._app.test_client()
+        self._local.cliente = cliente
+        r = cliente.open(ruta, method=metodo, json=cuerpo)
+        return r.status_code, r.get_json(silent=True)
+
+
+class _ClienteHTTP:
+    def __init__(self, url):
+        self._url = url
+        self._local = threading.local()
+
+    def pedir(self, metodo, ruta, cuerpo=None):
+        sesion = getattr(self._local, 'sesion', None) or requests.Session()
+        self._local.sesion = sesion
+        r = sesion.request(metodo, self._url + ruta, json=cuerpo, timeout=300)
+        return r.status_code, (r.json() if r.headers.get('Content-Type', '').startswith('application/json') else None)
+
+
+def _evento(rng, ids):
+    minutos = rng.choice((20, 45, 60, 90))
+    return {'log_id': str(uuid.uuid4()), 'telegram_id': rng.choice(ids), 'tipo_actividad': 'ESTUDIO',
+            'xp_a_sumar': minutos * 2, 'valor': minutos}
+
+
+def escenarios(ids, peticiones=PETICIONES, lote=LOTE, repeticiones_pesadas=REPETICIONES_PESADAS, semilla=1):
+    """
+    Lista de (nombre, método, armar(i) -> (ruta, cuerpo), llamadas, eventos por llamada).
+    Van en este orden: lecturas, escrituras, snapshots y la lectura del snapshot guardado.
+    """
+    rng = random.Random(semilla)
+    base_nuevos = 10**12 + uuid.uuid4().int % 10**11   # IDs que no están en los datos
+    lista = [
+        ('inicio', 'GET', lambda i: ('/', None), peticiones, 1),
+        ('perfil', 'GET', lambda i: (f"/api/usuario/{rng.choice(ids)}", None), peticiones, 1),
+        ('dashboard', 'GET', lambda i: (f"/api/usuario/{rng.choice(ids)}/dashboard", None), peticiones, 1),
+    ]
+    for periodo in ('semanal', 'mensual', 'semestral'):
+        lista.append((f"ranking_{periodo}", 'GET', lambda i, p=periodo: (f"/api/ranking/{p}", None), peticiones, 1))
+    lista += [
+        ('ranking_semanal_legado', 'GET', lambda i: ('/api/ranking_semanal', None), peticiones, 1),
+        ('alertas', 'GET', lambda i: ('/api/alertas?desde={ultima_alerta}', None), peticiones, 1),
+        ('cache', 'GET', lambda i: ('/api/cache', None), peticiones, 1),
+        ('registrar_actividad', 'POST', lambda i: ('/api/registrar_actividad', _evento(rng, ids)), peticiones, 1),
+        ('registrar_actividades', 'POST',
+         lambda i: ('/api/registrar_actividades', [_evento(rng, ids) for _ in range(lote)]),
+         max(1, peticiones // 10), lote),
+        ('registrar_usuario', 'POST',
+         lambda i: ('/api/registrar_usuario', {'telegram_id': base_nuevos + i, 'nombre': f"Nuevo {i}"}),
+         peticiones, 1),
+        ('snapshots', 'POST', lambda i: ('/api/snapshots', None), repeticiones_pesadas, 1),
+        ('ranking_historial', 'GET', lambda i: ('/api/ranking/semanal/historial', None), peticiones, 1),
+    ]
+    return lista
+
+
+def ejecutar_escenarios(cliente, ids, hilos=HILOS, solo=None, **opciones):
+    """Corre cada escenario con 'hilos' clientes en paralelo. Devuelve {nombre: resumen}."""
+    # El bot consulta las alertas con el último id que recibió; se parte desde el actual
+    _, cuerpo = cliente.pedir('GET', '/api/alertas?desde=0')
+    ultima_alerta = (cuerpo or {}).get('ultimo', 0)
+
+    resultados = {}
+    for nombre, metodo, armar, llamadas, eventos in escenarios(ids, **opciones):
+        if solo and nombre not in solo:
+            continue
+
+        def llamar(i):
+            ruta, cuerpo = armar(i)
+            status, _ = cliente.pedir(metodo, ruta.format(ultima_alerta=ultima_alerta), cuerpo)
+            return 200 <= status < 300
+
+        latencias, segundos, errores = medir_concurrente(llamar, range(llamadas), hilos)
+        resultados[nombre] = resumir(latencias, segundos, errores, llamadas * eventos if eventos > 1 else None)
+    return resultados
+
+
+def _ids_usuarios(carpeta):
+    """telegram_id de los usuarios del conjunto (los perfiles se piden al azar entre ellos)."""
+    with en_backend(carpeta):
+        from almacen import USUARIOS_CSV
+        ids = pd.read_csv(USUARIOS_CSV, usecols=['telegram_id'])['telegram_id'].tolist()
+    return ids or [PRIMER_ID]
+
+
+def en_proceso(carpeta, tipo='csv', hilos=1, **opciones):
+    """Modo 'test': importa api.py sobre los datos de carpeta (una vez por proceso)."""
+    if 'api' in sys.modules:
+        raise RuntimeError("api.py ya fue importado en este proceso: el modo 'test' corre una vez por proceso.")
+    ids = _ids_usuarios(carpeta)
+    os.environ['UCONNECT_ALMACEN'] = tipo
+    with en_backend(carpeta):
+        inicio = time.perf_counter()
+        api = importlib.import_module('api')
+        carga = time.perf_counter() - inicio
+        escenarios_medidos = ejecutar_escenarios(_ClienteTest(api.app), ids, hilos, **opciones)
+        api.almacen.cerrar()
+    return {'modo': 'test', 'almacen': tipo, 'hilos': hilos, 'carga_s': round(carga, 3),
+            'escenarios': escenarios_medidos}
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def con_servidor(carpeta, tipo='csv', workers=2, hilos=HILOS, **opciones):
+    """Modo 'servidor': levanta servidor.py sobre carpeta y le pega por HTTP."""
+    ids = _ids_usuarios(carpeta)
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    errores_servidor = tempfile.TemporaryFile()
+    proceso = subprocess.Popen(
+        [sys.executable, SERVIDOR, '--host', '127.0.0.1', '--puerto', str(puerto), '--workers', str(workers)],
+        cwd=carpeta, env={**os.environ, 'UCONNECT_ALMACEN': tipo},
+        stdout=subprocess.DEVNULL, stderr=errores_servidor,
+    )
+    try:
+        inicio = time.perf_counter()
+        while True:
+            if proceso.poll() is not None or time.perf_counter() - inicio > TIEMPO_ARRANQUE:
+                errores_servidor.seek(0)
+                raise RuntimeError(f"El servidor no arrancó:\n{errores_servidor.read().decode()[-2000:]}")
+            try:
+                if requests.get(url + '/', timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                time.sleep(0.2)
+        carga = time.perf_counter() - inicio
+        escenarios_medidos = ejecutar_escenarios(_ClienteHTTP(url), ids, hilos, **opciones)
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=60)
+        errores_servidor.close()
+    return {'modo': 'servidor', 'almacen': tipo, 'workers': workers, 'hilos': hilos, 'carga_s': round(carga, 3),
+            'escenarios': escenarios_medidos}
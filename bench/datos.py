@@ -0,0 +1,154 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(RAIZ, 'backend')
+
+# --- CONFIGURACIÓN ---
+USUARIOS = 1_000
+EVENTOS = 100_000
+DIAS = 180                 # Periodo que cubren los registros (el ranking semestral mira 180 días)
+SEMILLA = 20251205
+FILAS_POR_BLOQUE = 1_000_000   # Eventos que se generan y escriben por vez (acota la memoria)
+PRIMER_ID = 100_000_000        # Los telegram_id sintéticos son PRIMER_ID, PRIMER_ID + 1, ...
+ALFA_ACTIVIDAD = 1.2           # Pareto: unos pocos estudiantes concentran muchos registros
+
+# Mezcla de actividades: (tipo, probabilidad)
+TIPOS = [('ESTUDIO', 0.5), ('ASISTENCIA', 0.3), ('SUENO', 0.15), ('OTRO', 0.05)]
+MINUTOS_ESTUDIO = np.array([20, 45, 60, 90, 120])
+XP_ASISTENCIA = 100
+XP_OTRO = 50
+
+# Datos sintéticos para el banco de pruebas: usuarios.csv y registros.csv con la forma
+# que escriben el bot y la API (registros en orden de fecha, como los deja el log de
+# solo-anexar) y xp_total de cada usuario igual a la suma de sus registros. Se generan
+# por bloques, así 50M de eventos caben en memoria; con la misma semilla salen iguales.
+
+
+@contextmanager
+def en_backend(carpeta):
+    """Importa los módulos de backend/ y trabaja con las rutas relativas 'database/...' dentro de carpeta."""
+    if BACKEND not in sys.path:
+        sys.path.insert(0, BACKEND)
+    anterior = os.getcwd()
+    os.chdir(carpeta)
+    try:
+        yield
+    finally:
+        os.chdir(anterior)
+
+
+def _bloque(rng, desde, hasta, cantidad, acumulado):
+    """Un bloque de eventos con fechas entre desde y hasta (segundos), en orden."""
+    tipos = rng.choice(len(TIPOS), cantidad, p=[p for _, p in TIPOS])
+    valor = np.full(cantidad, np.nan)
+    xp = np.full(cantidad, XP_OTRO, dtype='int64')
+
+    estudio = tipos == 0
+    valor[estudio] = rng.choice(MINUTOS_ESTUDIO, int(estudio.sum()))
+    xp[estudio] = valor[estudio] * 2
+
+    # Asistencia: minutos de atraso (la mayoría llega a tiempo)
+    asistencia = tipos == 1
+    atrasos = rng.exponential(4, int(asistencia.sum())).round()
+    valor[asistencia] = np.where(atrasos < 2, 0, atrasos)
+    xp[asistencia] = XP_ASISTENCIA
+
+    # Sueño: horas, con el mismo XP que da el bot (150 entre 7 y 9 horas)
+    sueno = tipos == 2
+    valor[sueno] = rng.normal(7, 1.5, int(sueno.sum())).clip(3, 12).round(1)
+    xp[sueno] = np.where((valor[sueno] >= 7) & (valor[sueno] <= 9), 150, 10)
+
+    usuarios = np.searchsorted(acumulado, rng.random(cantidad))
+    segundos = np.sort(rng.integers(desde, hasta, cantidad))
+    return usuarios, tipos, xp, valor, segundos
+
+
+def generar(carpeta, usuarios=USUARIOS, eventos=EVENTOS, dias=DIAS, semilla=SEMILLA,
+            filas_por_bloque=FILAS_POR_BLOQUE):
+    """Escribe carpeta/database/usuarios.csv y registros.csv. Devuelve un resumen del conjunto."""
+    with en_backend(carpeta):
+        from almacen import COLUMNAS_USUARIOS, COLUMNAS_REGISTROS, USUARIOS_CSV, REGISTROS_XP_CSV
+        from snapshots import LIGAS, codigo_liga
+
+        os.makedirs(os.path.dirname(USUARIOS_CSV), exist_ok=True)
+        rng = np.random.default_rng(semilla)
+        pesos = rng.pareto(ALFA_ACTIVIDAD, usuarios) + 1
+        acumulado = np.cumsum(pesos) / pesos.sum()
+        acumulado[-1] = 1.0
+        nombres_tipos = np.array([tipo for tipo, _ in TIPOS], dtype=object)
+
+        hasta = datetime.now().replace(microsecond=0)
+        # Segundos de la hora local sin zona (la misma que escriben la API y el bot)
+        inicio = pd.Timestamp(hasta - timedelta(days=dias)).value // 10**9
+        duracion = pd.Timestamp(hasta).value // 10**9 - inicio
+        xp_total = np.zeros(usuarios, dtype='int64')
+
+        # 1. Registros, bloque a bloque; cada bloque cubre su tramo del periodo
+        inicio_reloj = time.perf_counter()
+        with open(REGISTROS_XP_CSV, 'w', encoding='utf-8', newline='') as f:
+            f.write(','.join(COLUMNAS_REGISTROS) + '\n')
+            for desde_fila in range(0, eventos, filas_por_bloque):
+                cantidad = min(filas_por_bloque, eventos - desde_fila)
+                desde = inicio + duracion * desde_fila // eventos
+                hasta_bloque = inicio + duracion * (desde_fila + cantidad) // eventos
+                idx, tipos, xp, valor, segundos = _bloque(rng, desde, max(hasta_bloque, desde + 1), cantidad, acumulado)
+                pd.DataFrame({
+                    'log_id': np.arange(desde_fila + 1, desde_fila + cantidad + 1),
+                    'telegram_id': PRIMER_ID + idx,
+                    'xp_ganado': xp,
+                    'tipo_actividad': nombres_tipos[tipos],
+                    'fecha_registro': pd.to_datetime(segundos, unit='s'),
+                    'valor': valor,
+                })[COLUMNAS_REGISTROS].to_csv(f, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+                xp_total += np.bincount(idx, weights=xp, minlength=usuarios).astype('int64')
+
+        # 2. Usuarios, con el XP y la liga que corresponden a sus registros
+        nombres_ligas = np.array([nombre for _, nombre in LIGAS], dtype=object)
+        pd.DataFrame({
+            'telegram_id': PRIMER_ID + np.arange(usuarios),
+            'nombre': [f"Estudiante {i}" for i in range(1, usuarios + 1)],
+            'xp_total': xp_total,
+            'liga_actual': nombres_ligas[codigo_liga(xp_total)],
+            'fecha_creacion': (hasta - timedelta(days=dias + 1)).strftime('%Y-%m-%d %H:%M:%S'),
+        })[COLUMNAS_USUARIOS].to_csv(USUARIOS_CSV, index=False)
+
+        return {
+            'usuarios': usuarios,
+            'eventos': eventos,
+            'dias': dias,
+            'semilla': semilla,
+            'bytes_registros': os.path.getsize(REGISTROS_XP_CSV),
+            'segundos_generacion': round(time.perf_counter() - inicio_reloj, 2),
+        }
+
+
+def preparar_almacen(carpeta, tipo):
+    """
+    Deja los datos listos para el almacén 'tipo', como estaría en producción:
+    'sqlite' migra los CSV a la base; 'mmap' indexa registros.csv en segmentos.
+    """
+    with en_backend(carpeta):
+        if tipo == 'sqlite':
+            from almacen_sqlite import SQLITE_DB, migrar_desde_csv
+            if not os.path.exists(SQLITE_DB):
+                migrar_desde_csv()
+        elif tipo == 'mmap':
+            from columnar import indexar_csv
+            indexar_csv()
+
+
+def describir(carpeta):
+    """Tamaño de un conjunto ya generado (para el resultado del banco)."""
+    with en_backend(carpeta):
+        from almacen import USUARIOS_CSV, REGISTROS_XP_CSV
+        with open(USUARIOS_CSV, 'rb') as f:
+            usuarios = sum(1 for _ in f) - 1
+        return {'usuarios': usuarios, 'bytes_registros': os.path.getsize(REGISTROS_XP_CSV)}
+
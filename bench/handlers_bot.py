@@ -0,0 +1,199 @@
+import asyncio
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from types import SimpleNamespace
+
+from .datos import RAIZ
+from .medicion import resumir
+
+# --- CONFIGURACIÓN ---
+ITERACIONES = 2000          # Llamadas por handler
+LATENCIA_BACKEND = 0.0      # Segundos que tarda el backend simulado en responder
+LATENCIA_IA = 0.0           # Segundos que tarda la IA simulada en generar una respuesta
+RUTA_BOT = os.path.join(RAIZ, 'telegram-bot.py')
+
+# Microbenchmark de los handlers de telegram-bot.py: se llaman directo (sin Telegram ni
+# red) con un Update falso que registra las respuestas, un backend simulado en lugar de
+# ClienteAPI y la IA de prueba de ia.py. La cola de eventos y el cache de la IA son los
+# reales, sobre archivos temporales: su costo (fsync de SQLite, MinHash) es parte de lo
+# que se mide.
+
+
+class BackendSimulado:
+    """Responde como el backend (mismas formas de respuesta que api.py), con latencia fija."""
+
+    def __init__(self, latencia=LATENCIA_BACKEND):
+        self.latencia = latencia
+        self.llamadas = 0
+
+    async def _esperar(self):
+        self.llamadas += 1
+        await asyncio.sleep(self.latencia)
+
+    async def registrar_usuario(self, telegram_id, nombre):
+        await self._esperar()
+        return {"status": "success", "mensaje": "Usuario registrado correctamente."}
+
+    async def obtener_perfil(self, telegram_id):
+        await self._esperar()
+        return {
+            'telegram_id': telegram_id, 'nombre': 'Estudiante', 'xp_total': 12500, 'liga_actual': 'Aprendiz',
+            'estadisticas': {
+                'xp_semana': 1800, 'racha_dias': 4, 'racha_maxima': 12,
+                'por_tipo': {
+                    'ESTUDIO': {'valor_semana': 240.0, 'registros_semana': 5},
+                    'SUENO': {'promedio_valor_semana': 7.2},
+                    'ASISTENCIA': {'registros_semana': 8},
+                },
+            },
+        }
+
+    async def obtener_ranking(self, periodo):
+        await self._esperar()
+        return [{'telegram_id': i, 'nombre': f"Estudiante {i}", f'xp_{periodo}': 10000 - i * 350} for i in range(10)]
+
+
+class MensajeFalso:
+    """Message de Telegram: reply_text devuelve un mensaje editable, como el real."""
+
+    def __init__(self, texto=""):
+        self.text = texto
+        self.enviados = 0
+
+    async def reply_text(self, texto, **kwargs):
+        self.enviados += 1
+        return MensajeFalso(texto)
+
+    reply_html = reply_text
+
+    async def edit_text(self, texto, **kwargs):
+        self.text = texto
+
+    async def reply_chat_action(self, accion):
+        pass
+
+
+class ConsultaFalsa:
+    """CallbackQuery de un botón inline."""
+
+    def __init__(self, datos, usuario):
+        self.data = datos
+        self.from_user = usuario
+        self.message = MensajeFalso()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, texto, **kwargs):
+        self.message.text = texto
+
+
+def update_falso(texto="", args=None, boton=None, telegram_id=100_000_000):
+    """(Update, Context) mínimos con lo que leen los handlers."""
+    usuario = SimpleNamespace(id=telegram_id, first_name="Estudiante")
+    update = SimpleNamespace(
+        effective_user=usuario,
+        message=MensajeFalso(texto),
+        callback_query=ConsultaFalsa(boton, usuario) if boton else None,
+    )
+    return update, SimpleNamespace(args=args or [])
+
+
+def cargar_bot(ruta=RUTA_BOT):
+    """
+    Importa telegram-bot.py como módulo. Si no existen parametros.py o backend/API_KEY.py
+    (son locales de cada instalación) se usan valores vacíos: el benchmark no llama a
+    Telegram ni a Gemini.
+    """
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    for nombre, valores in (('parametros', {'API_URL': 'http://127.0.0.1:5000', 'TOKEN_TELEGRAM': ''}),
+                            ('backend.API_KEY', {'GEMINI_KEY': ''})):
+        try:
+            importlib.import_module(nombre)
+        except ImportError:
+            sys.modules[nombre] = types.ModuleType(nombre)
+            sys.modules[nombre].__dict__.update(valores)
+
+    spec = importlib.util.spec_from_file_location('telegram_bot', ruta)
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    # El bot configura logging en INFO; los handlers no deben escribir una línea por llamada
+    logging.getLogger().setLevel(logging.WARNING)
+    return bot
+
+
+def handlers(bot):
+    """(nombre, handler, armar(i) -> (Update, Context)) de cada caso medido."""
+    return [
+        ('start', bot.start_command, lambda i: update_falso("/start")),
+        ('miperfil', bot.miperfil_command, lambda i: update_falso("/miperfil")),
+        ('ranking', bot.ranking_command, lambda i: update_falso("/ranking mensual", ['mensual'])),
+        ('estudio_menu', bot.estudio_command, lambda i: update_falso("/estudio")),
+        ('estudio', bot.estudio_command, lambda i: update_falso("/estudio 45", ['45'])),
+        ('boton_estudio', bot.button_handler, lambda i: update_falso(boton="estudio_45")),
+        ('sueno', bot.sueno_command, lambda i: update_falso("/sueno 8", ['8'])),
+        ('misiones', bot.misiones_command, lambda i: update_falso("/misiones")),
+        ('ayuda', bot.ayuda_command, lambda i: update_falso("/ayuda")),
+        # La misma pregunta: después de la primera, la responde el cache
+        ('ia_repetida', bot.ia_handler, lambda i: update_falso("¿Cómo organizo mi semana de certámenes?")),
+        # Una pregunta distinta cada vez: MinHash sin acierto, IA simulada y guardado en el cache
+        ('ia_nueva', bot.ia_handler, lambda i: update_falso(f"Pregunta {i}: ¿qué estudio primero, cálculo {i * 7919} o física?")),
+    ]
+
+
+async def _medir(handler, armar, iteraciones):
+    latencias = []
+    errores = 0
+    inicio = time.perf_counter()
+    for i in range(iteraciones):
+        update, context = armar(i)
+        t = time.perf_counter()
+        try:
+            await handler(update, context)
+        except Exception:
+            errores += 1
+        latencias.append(time.perf_counter() - t)
+    return latencias, time.perf_counter() - inicio, errores
+
+
+async def _ejecutar(bot, iteraciones, solo):
+    carpeta = tempfile.mkdtemp(prefix='uconnect-bench-bot-')
+    from cache_ia import CacheRespuestasIA
+    from cola_eventos import ColaEventos
+    from ia import ProveedorStub, ServicioIA
+
+    bot.api_cliente = BackendSimulado(LATENCIA_BACKEND)
+    bot.cola_eventos = ColaEventos(os.path.join(carpeta, 'cola_eventos.db'))
+    bot.cache_ia = CacheRespuestasIA(ruta=os.path.join(carpeta, 'cache_ia.json'))
+    bot.servicio_ia = ServicioIA(ProveedorStub(LATENCIA_IA))
+
+    resultados = {}
+    try:
+        for nombre, handler, armar in handlers(bot):
+            if solo and nombre not in solo:
+                continue
+            latencias, segundos, errores = await _medir(handler, armar, iteraciones)
+            resultados[nombre] = resumir(latencias, segundos, errores)
+    finally:
+        bot.cola_eventos.cerrar()
+    return resultados
+
+
+def ejecutar(iteraciones=ITERACIONES, solo=None):
+    """
+    Mide cada handler. Si telegram-bot.py no se puede importar devuelve el motivo en 'error'
+    (sin escenarios): python -m bench lo guarda en el JSON y sale con código distinto de cero.
+    """
+    try:
+        bot = cargar_bot()
+    except (ImportError, SyntaxError) as e:
+        return {'error': f"No se pudo importar telegram-bot.py: {e!r}", 'escenarios': {}}
+    return {'iteraciones': iteraciones, 'latencia_backend_s': LATENCIA_BACKEND, 'latencia_ia_s': LATENCIA_IA,
+            'escenarios': asyncio.run(_ejecutar(bot, iteraciones, solo))}
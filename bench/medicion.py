@@ -0,0 +1,138 @@
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+PERCENTILES = (50, 95, 99)
+TOLERANCIA = 0.20   # Empeoramiento relativo (p95 o por segundo) que se reporta como regresión
+
+
+def resumir(latencias, segundos, errores=0, unidades=None):
+    """
+    Resumen de un escenario: latencias en segundos de cada llamada y duración total
+    (reloj de pared, con todos los clientes en paralelo). unidades: eventos procesados
+    si cada llamada lleva varios (lotes), para reportar también eventos por segundo.
+    """
+    ms = np.asarray(latencias, dtype='float64') * 1000
+    resumen = {
+        'n': len(ms),
+        'errores': errores,
+        'segundos': round(segundos, 4),
+        'por_segundo': round(len(ms) / segundos, 2) if segundos > 0 else None,
+        'latencia_ms': {
+            **{f"p{p}": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES},
+            'media': round(float(ms.mean()), 3),
+            'max': round(float(ms.max()), 3),
+        } if len(ms) else None,
+    }
+    if unidades is not None:
+        resumen['unidades_por_segundo'] = round(unidades / segundos, 2) if segundos > 0 else None
+    return resumen
+
+
+def medir_concurrente(llamar, argumentos, hilos=1):
+    """
+    Ejecuta llamar(arg) para cada argumento con 'hilos' clientes en paralelo.
+    llamar devuelve True si la respuesta fue correcta. Devuelve (latencias, segundos, errores).
+    """
+    latencias = []
+    errores = 0
+    lock = threading.Lock()
+
+    def una(argumento):
+        nonlocal errores
+        inicio = time.perf_counter()
+        try:
+            ok = llamar(argumento)
+        except Exception:
+            ok = False
+        latencia = time.perf_counter() - inicio
+        with lock:
+            latencias.append(latencia)
+            errores += not ok
+
+    inicio = time.perf_counter()
+    if hilos <= 1:
+        for argumento in argumentos:
+            una(argumento)
+    else:
+        with ThreadPoolExecutor(hilos) as ejecutor:
+            list(ejecutor.map(una, argumentos))
+    return latencias, time.perf_counter() - inicio, errores
+
+
+def entorno():
+    """Datos de la máquina y del código medido, para poder comparar resultados entre versiones."""
+    try:
+        version = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        version = None
+    return {
+        'version': version,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def guardar(resultado, ruta):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+
+def imprimir(titulo, escenarios):
+    """Tabla legible de {nombre: resumen}."""
+    print(f"\n{titulo}")
+    print(f"  {'escenario':<26}{'n':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'/s':>11}")
+    for nombre, r in escenarios.items():
+        if r.get('omitido'):
+            print(f"  {nombre:<26}omitido: {r['omitido']}")
+            continue
+        lat = r['latencia_ms'] or {}
+        por_segundo = r.get('unidades_por_segundo') or r['por_segundo']
+        print(f"  {nombre:<26}{r['n']:>7}{r['errores']:>5}{lat.get('p50', 0):>10.2f}{lat.get('p95', 0):>10.2f}"
+              f"{lat.get('p99', 0):>10.2f}{por_segundo or 0:>11.1f}")
+
+
+# --- COMPARACIÓN ENTRE VERSIONES ---
+
+def _escenarios(resultado):
+    """{'api/perfil': resumen, 'bot/miperfil': resumen, ...} de un archivo de resultados."""
+    planos = {}
+    for seccion in ('api', 'bot'):
+        for nombre, r in (resultado.get(seccion) or {}).get('escenarios', {}).items():
+            if not r.get('omitido'):
+                planos[f"{seccion}/{nombre}"] = r
+    return planos
+
+
+def comparar(base, nuevo, tolerancia=TOLERANCIA):
+    """
+    Compara dos resultados escenario por escenario. Devuelve una lista de
+    (escenario, métrica, valor base, valor nuevo, cambio relativo, es_regresion).
+    Empeora si el p95 sube o lo atendido por segundo baja más que la tolerancia.
+    """
+    filas = []
+    escenarios_base, escenarios_nuevo = _escenarios(base), _escenarios(nuevo)
+    for nombre in escenarios_base.keys() & escenarios_nuevo.keys():
+        b, n = escenarios_base[nombre], escenarios_nuevo[nombre]
+        metricas = [
+            ('p95_ms', (b['latencia_ms'] or {}).get('p95'), (n['latencia_ms'] or {}).get('p95'), 1),
+            ('por_segundo', b.get('unidades_por_segundo') or b['por_segundo'],
+             n.get('unidades_por_segundo') or n['por_segundo'], -1),
+        ]
+        for metrica, valor_base, valor_nuevo, signo in metricas:
+            if not valor_base or valor_nuevo is None:
+                continue
+            cambio = (valor_nuevo - valor_base) / valor_base
+            filas.append((nombre, metrica, valor_base, valor_nuevo, cambio, signo * cambio > tolerancia))
+    return sorted(filas)
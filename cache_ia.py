@@ -0,0 +1,246 @@
+# cache_ia.py
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN POR DEFECTO ---
+RUTA_CACHE_IA = 'cache_ia.json'
+CAPACIDAD_CACHE_IA = 2000            # Respuestas guardadas como máximo (LRU)
+TTL_CACHE_IA_SEGUNDOS = 7 * 24 * 3600  # Una respuesta vale por una semana
+UMBRAL_SIMILITUD = 0.8               # Jaccard mínimo entre trigramas de las preguntas para reutilizar la respuesta
+UMBRAL_PALABRAS = 0.6                # Y Jaccard mínimo entre sus palabras
+LARGO_MAXIMO_OPERANDO = 2            # Palabras de hasta este largo (x, 2, pi) deben coincidir exactas
+GUARDAR_CADA_N = 20                  # Persistir a disco cada N respuestas nuevas
+
+# MinHash: NUM_PERMUTACIONES firmas agrupadas en bandas para buscar candidatos (LSH)
+NUM_PERMUTACIONES = 64
+FILAS_POR_BANDA = 4
+_PRIMO = (1 << 61) - 1
+_rng = random.Random(20251205)  # semilla fija: las firmas deben ser iguales entre ejecuciones
+_PERMUTACIONES = [(_rng.randrange(1, _PRIMO), _rng.randrange(0, _PRIMO)) for _ in range(NUM_PERMUTACIONES)]
+
+# Palabras que no cambian el sentido de la pregunta
+PALABRAS_VACIAS = {
+    'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas', 'de', 'del', 'al', 'a', 'en', 'y', 'o',
+    'que', 'me', 'mi', 'por', 'para', 'con', 'se', 'lo', 'le', 'es', 'hola', 'porfa', 'favor',
+}
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes, sin signos de puntuación ni palabras vacías."""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    palabras = re.findall(r'[a-z0-9ñ]+', texto)
+    return ' '.join(p for p in palabras if p not in PALABRAS_VACIAS)
+
+
+def shingles(texto_normalizado, n=3):
+    """Conjunto de n-gramas de caracteres (tolera errores de tipeo y cambios de orden menores)."""
+    texto = f" {texto_normalizado} "
+    if len(texto) <= n:
+        return {texto}
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+
+def firma_minhash(conjunto):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'big') for s in conjunto]
+    return tuple(min((a * h + b) % _PRIMO for h in hashes) for a, b in _PERMUTACIONES)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def operandos(texto_normalizado):
+    """
+    Números y palabras cortas (variables, exponentes, unidades) con sus repeticiones.
+    Dos preguntas que difieren en uno de ellos ("x^2" y "x^3") piden cosas distintas
+    aunque sus trigramas casi coincidan.
+    """
+    return Counter(p for p in texto_normalizado.split() if p.isdigit() or len(p) <= LARGO_MAXIMO_OPERANDO)
+
+
+def mismos_terminos(a, b):
+    """Confirma un candidato por trigramas: mismos operandos y Jaccard de palabras >= UMBRAL_PALABRAS."""
+    return operandos(a) == operandos(b) and jaccard(set(a.split()), set(b.split())) >= UMBRAL_PALABRAS
+
+
+class CacheRespuestasIA:
+    """
+    Cache de respuestas de la IA por pregunta.
+
+    Primero busca la pregunta normalizada exacta; si no está, usa MinHash + LSH
+    sobre trigramas de caracteres para encontrar preguntas parecidas y confirma
+    con Jaccard de trigramas >= umbral y mismos_terminos() (palabras parecidas y
+    los mismos números y operandos). LRU + TTL, persistido en un JSON.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE_IA, capacidad=CAPACIDAD_CACHE_IA, ttl=TTL_CACHE_IA_SEGUNDOS,
+                 umbral=UMBRAL_SIMILITUD):
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.umbral = umbral
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()      # pregunta normalizada -> (creada, respuesta)
+        self._shingles = {}                 # pregunta normalizada -> conjunto de trigramas
+        self._bandas = defaultdict(set)     # (banda, valores) -> preguntas normalizadas
+        self._firmas = {}                   # pregunta normalizada -> firma MinHash
+        self._sin_guardar = 0
+        # Métricas
+        self.aciertos_exactos = 0
+        self.aciertos_aproximados = 0
+        self.fallos = 0
+        if ruta:
+            self.cargar()
+
+    # --- ÍNDICE ---
+
+    def _bandas_de(self, firma):
+        for i in range(0, NUM_PERMUTACIONES, FILAS_POR_BANDA):
+            yield (i, firma[i:i + FILAS_POR_BANDA])
+
+    def _indexar(self, clave, creada, respuesta):
+        conjunto = shingles(clave)
+        firma = firma_minhash(conjunto)
+        self._entradas[clave] = (creada, respuesta)
+        self._shingles[clave] = conjunto
+        self._firmas[clave] = firma
+        for banda in self._bandas_de(firma):
+            self._bandas[banda].add(clave)
+
+    def _quitar(self, clave):
+        self._entradas.pop(clave, None)
+        self._shingles.pop(clave, None)
+        firma = self._firmas.pop(clave, None)
+        if firma is not None:
+            for banda in self._bandas_de(firma):
+                self._bandas[banda].discard(clave)
+                if not self._bandas[banda]:
+                    del self._bandas[banda]
+
+    def _vigente(self, clave):
+        creada, _ = self._entradas[clave]
+        if time.time() - creada > self.ttl:
+            self._quitar(clave)
+            return False
+        return True
+
+    # --- API ---
+
+    def buscar(self, pregunta):
+        """Devuelve la respuesta guardada para esta pregunta (o una muy parecida), o None."""
+        clave = normalizar(pregunta)
+        with self._lock:
+            # 1. Coincidencia exacta de la pregunta normalizada
+            if clave in self._entradas and self._vigente(clave):
+                self._entradas.move_to_end(clave)
+                self.aciertos_exactos += 1
+                return self._entradas[clave][1]
+
+            # 2. Candidatos que comparten alguna banda MinHash; se confirma con Jaccard real y los términos
+            conjunto = shingles(clave)
+            candidatos = set()
+            for banda in self._bandas_de(firma_minhash(conjunto)):
+                candidatos |= self._bandas.get(banda, set())
+
+            mejor, mejor_similitud = None, self.umbral
+            for candidato in candidatos:
+                similitud = jaccard(conjunto, self._shingles[candidato])
+                if (similitud >= mejor_similitud
+                        and mismos_terminos(clave, candidato)
+                        and self._vigente(candidato)):
+                    mejor, mejor_similitud = candidato, similitud
+
+            if mejor is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(mejor)
+            self.aciertos_aproximados += 1
+            return self._entradas[mejor][1]
+
+    def guardar(self, pregunta, respuesta):
+        clave = normalizar(pregunta)
+        if not clave or not respuesta:
+            return
+        with self._lock:
+            self._quitar(clave)
+            self._indexar(clave, time.time(), respuesta)
+            while len(self._entradas) > self.capacidad:
+                self._quitar(next(iter(self._entradas)))
+            self._sin_guardar += 1
+            persistir = self.ruta and self._sin_guardar >= GUARDAR_CADA_N
+        if persistir:
+            self.persistir()
+
+    def estadisticas(self):
+        with self._lock:
+            aciertos = self.aciertos_exactos + self.aciertos_aproximados
+            total = aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "aciertos_exactos": self.aciertos_exactos,
+                "aciertos_aproximados": self.aciertos_aproximados,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(aciertos / total, 4) if total else 0.0,
+            }
+
+    # --- PERSISTENCIA ---
+
+    def cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo leer el cache de IA {self.ruta}: {e}")
+            return
+        ahora = time.time()
+        with self._lock:
+            for clave, creada, respuesta in datos:
+                if ahora - creada <= self.ttl:
+                    self._indexar(clave, creada, respuesta)
+
+    def persistir(self):
+        """Escribe el cache a disco (temporal + rename, para no dejar un JSON a medias)."""
+        with self._lock:
+            datos = [[clave, creada, respuesta] for clave, (creada, respuesta) in self._entradas.items()]
+            self._sin_guardar = 0
+        tmp = f"{self.ruta}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(tmp, self.ruta)
+
+
+if __name__ == '__main__':
+    # Comprobación rápida de la búsqueda (python cache_ia.py): aciertos exactos y
+    # aproximados, y preguntas que difieren en un número u operando, que no deben acertar
+    cache = CacheRespuestasIA(ruta=None)
+    cache.guardar("¿Cuál es la derivada de x^2?", "2x")
+    cache.guardar("¿Cómo puedo dormir mejor antes de un examen?", "Duerme 7-8 horas.")
+    casos = [
+        ("cual es la derivada de x^2", "2x"),                                    # exacta tras normalizar
+        ("¿Cuál es la derivada de x^3?", None),                                  # otro exponente
+        ("¿Cuál es la derivada de y^2?", None),                                  # otra variable
+        ("¿Cómo puedo dormir mejor antes del examen?", "Duerme 7-8 horas."),     # igual tras normalizar (del/de)
+        ("¿Cómo puedo dormir mejor antes de mi examen final?", "Duerme 7-8 horas."),  # casi igual
+    ]
+    fallidos = 0
+    for pregunta, esperada in casos:
+        obtenida = cache.buscar(pregunta)
+        if obtenida != esperada:
+            fallidos += 1
+            print(f"FALLÓ: {pregunta!r}: se esperaba {esperada!r}, se obtuvo {obtenida!r}")
+    print(f"{len(casos) - fallidos}/{len(casos)} casos OK. {cache.estadisticas()}")
+    raise SystemExit(1 if fallidos else 0)
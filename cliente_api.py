@@ -0,0 +1,122 @@
+# cliente_api.py
+
+import asyncio
+import logging
+import random
+import uuid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN POR DEFECTO ---
+TIMEOUT_SEGUNDOS = 5.0        # Tiempo máximo por llamada (conexión + respuesta)
+MAX_REINTENTOS = 3            # Reintentos ante fallos transitorios
+BACKOFF_BASE_SEGUNDOS = 0.25  # Espera base del backoff exponencial (con jitter)
+MAX_CONCURRENCIA = 32         # Llamadas simultáneas al backend como máximo
+MAX_CONEXIONES = 32           # Conexiones keep-alive en el pool
+TIMEOUT_SNAPSHOTS_SEGUNDOS = 120.0  # El trabajo de snapshots recorre todos los registros del semestre
+
+# Respuestas del backend que vale la pena reintentar
+STATUS_REINTENTABLES = {502, 503, 504}
+# Errores en los que la petición nunca llegó al backend: reintentar no duplica nada
+ERRORES_SIN_ENVIO = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class ClienteAPI:
+    """
+    Cliente asíncrono del backend de UConnect para el bot.
+
+    Usa un único httpx.AsyncClient con pool de conexiones keep-alive, timeout por
+    llamada, reintentos con backoff exponencial y un semáforo que limita cuántas
+    llamadas hay en vuelo. Así una llamada lenta no bloquea el event loop del bot.
+    """
+
+    def __init__(self, base_url, timeout=TIMEOUT_SEGUNDOS, reintentos=MAX_REINTENTOS,
+                 backoff=BACKOFF_BASE_SEGUNDOS, max_concurrencia=MAX_CONCURRENCIA,
+                 max_conexiones=MAX_CONEXIONES):
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._cliente = httpx.AsyncClient(
+            base_url=base_url.rstrip('/') + '/',
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_conexiones, max_keepalive_connections=max_conexiones),
+        )
+
+    async def cerrar(self):
+        await self._cliente.aclose()
+
+    async def _pedir(self, metodo, ruta, idempotente=True, **kwargs):
+        """
+        Hace la petición con reintentos. Las peticiones no idempotentes solo se
+        reintentan si nunca llegaron a enviarse (error de conexión).
+        Lanza httpx.HTTPError si todos los intentos fallan.
+        """
+        for intento in range(self.reintentos + 1):
+            try:
+                async with self._semaforo:
+                    response = await self._cliente.request(metodo, ruta.lstrip('/'), **kwargs)
+                if response.status_code not in STATUS_REINTENTABLES or not idempotente:
+                    response.raise_for_status() # Lanza un error para códigos 4xx/5xx
+                    return response
+                error = httpx.HTTPStatusError(f"Status {response.status_code}", request=response.request, response=response)
+            except ERRORES_SIN_ENVIO as e:
+                error = e
+            except httpx.TransportError as e:
+                # Timeout de lectura, conexión cortada, etc.: el backend pudo haber procesado la petición
+                if not idempotente:
+                    raise
+                error = e
+
+            if intento == self.reintentos:
+                raise error
+            espera = self.backoff * (2 ** intento) * (0.5 + random.random())
+            logger.warning(f"{metodo} {ruta} falló ({error!r}); reintento {intento + 1} en {espera:.2f}s")
+            await asyncio.sleep(espera)
+
+    # --- ENDPOINTS DEL BACKEND ---
+
+    async def registrar_usuario(self, user_id, nombre):
+        response = await self._pedir("POST", "registrar_usuario", idempotente=False, json={
+            "telegram_id": user_id,
+            "nombre": nombre
+        })
+        return response.json()
+
+    async def registrar_actividad(self, user_id, tipo, xp, log_id=None, valor=None):
+        """
+        El log_id se genera aquí (una vez por actividad, no por intento): el backend
+        reconoce los reintentos por ese ID, así que la llamada se puede reintentar.
+        """
+        response = await self._pedir("POST", "registrar_actividad", json={
+            "telegram_id": user_id,
+            "tipo_actividad": tipo,
+            "xp_a_sumar": xp,
+            "log_id": log_id or str(uuid.uuid4()),
+            "valor": valor
+        })
+        return response.json()
+
+    async def registrar_actividades(self, eventos):
+        """Envía un lote de eventos (cada uno con su log_id) a /api/registrar_actividades."""
+        response = await self._pedir("POST", "registrar_actividades", json=eventos)
+        return response.json()
+
+    async def obtener_perfil(self, user_id):
+        response = await self._pedir("GET", f"usuario/{user_id}")
+        return response.json()
+
+    async def obtener_ranking(self, periodo="semanal"):
+        response = await self._pedir("GET", f"ranking/{periodo}")
+        return response.json().get('ranking', [])
+
+    async def generar_snapshots(self):
+        """Pide al backend los snapshots de rankings del día y el recálculo de ligas (rehacerlo el mismo día no cambia nada)."""
+        response = await self._pedir("POST", "snapshots", timeout=TIMEOUT_SNAPSHOTS_SEGUNDOS)
+        return response.json()
+
+    async def obtener_alertas(self, desde=0):
+        """Alertas de bienestar con id mayor a desde, y el último id emitido."""
+        response = await self._pedir("GET", "alertas", params={"desde": desde})
+        return response.json()
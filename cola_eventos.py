@@ -0,0 +1,272 @@
+# cola_eventos.py
+
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN POR DEFECTO ---
+RUTA_COLA_EVENTOS = 'cola_eventos.db'
+TAMANO_LOTE = 500                 # Eventos por llamada a /api/registrar_actividades
+INTERVALO_DRENADO_SEGUNDOS = 5.0  # Revisión periódica aunque nadie avise de eventos nuevos
+ESPERA_MAXIMA_SEGUNDOS = 60.0     # Tope del backoff cuando el backend no responde
+# Eventos de un usuario que el backend todavía no conoce (su /start sigue en cola o se perdió):
+# se reintentan con backoff propio en vez de apartarlos, y se apartan tras MAX_INTENTOS_SIN_USUARIO
+ESPERA_SIN_USUARIO_SEGUNDOS = 30.0
+ESPERA_MAXIMA_SIN_USUARIO_SEGUNDOS = 3600.0
+MAX_INTENTOS_SIN_USUARIO = 30     # ~1 día con el tope de una hora
+CODIGO_USUARIO_NO_ENCONTRADO = 'USUARIO_NO_ENCONTRADO'   # 'codigo' del resultado de /api/registrar_actividades
+
+
+class ColaEventos:
+    """
+    Cola durable (SQLite) de actividades pendientes de enviar al backend.
+
+    El bot encola y responde de inmediato; un trabajador en segundo plano envía
+    los eventos por lotes. Cada evento lleva su log_id (UUID) y la fecha en que
+    ocurrió, así un reenvío tras un corte no cambia el día en que cuenta y el
+    backend descarta los duplicados (un lote reenviado no suma XP dos veces).
+
+    Los registros de usuario (/start) que no llegaron al backend también esperan
+    aquí, y se envían antes que los eventos: sin ellos el backend rechaza la XP.
+    """
+
+    def __init__(self, ruta=RUTA_COLA_EVENTOS):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        # FULL: el evento está en disco antes de responder al usuario
+        self._conexion.execute("PRAGMA synchronous=FULL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS eventos (
+                orden INTEGER PRIMARY KEY AUTOINCREMENT,
+                log_id TEXT NOT NULL UNIQUE,
+                telegram_id INTEGER NOT NULL,
+                tipo_actividad TEXT NOT NULL,
+                xp_a_sumar INTEGER NOT NULL,
+                fecha_registro TEXT NOT NULL,
+                valor REAL,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                error TEXT
+            )
+        """)
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_eventos_estado ON eventos (estado, orden)")
+        # Colas creadas antes de la columna 'valor'
+        columnas = [fila[1] for fila in self._conexion.execute("PRAGMA table_info(eventos)")]
+        if 'valor' not in columnas:
+            self._conexion.execute("ALTER TABLE eventos ADD COLUMN valor REAL")
+        # Y antes del backoff por evento (proximo_intento en segundos epoch; 0 = ya)
+        if 'intentos' not in columnas:
+            self._conexion.execute("ALTER TABLE eventos ADD COLUMN intentos INTEGER NOT NULL DEFAULT 0")
+            self._conexion.execute("ALTER TABLE eventos ADD COLUMN proximo_intento REAL NOT NULL DEFAULT 0")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS usuarios (
+                telegram_id INTEGER PRIMARY KEY,
+                nombre TEXT NOT NULL
+            )
+        """)
+        # Avisa al trabajador que hay eventos nuevos (se asignan al iniciarlo)
+        self._aviso = None
+        self._loop = None
+
+    def _avisar(self):
+        # encolar corre en un hilo (asyncio.to_thread) para no frenar el event loop con el fsync;
+        # asyncio.Event no es seguro entre hilos, así que el aviso se agenda en el loop del trabajador
+        if self._aviso is not None:
+            self._loop.call_soon_threadsafe(self._aviso.set)
+
+    def encolar(self, telegram_id, tipo_actividad, xp_a_sumar, valor=None):
+        """Guarda el evento y devuelve su log_id. valor: minutos de estudio, horas de sueño, etc."""
+        log_id = str(uuid.uuid4())
+        with self._lock:
+            self._conexion.execute(
+                "INSERT INTO eventos (log_id, telegram_id, tipo_actividad, xp_a_sumar, fecha_registro, valor) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (log_id, telegram_id, tipo_actividad, xp_a_sumar, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), valor),
+            )
+        self._avisar()
+        return log_id
+
+    def encolar_usuario(self, telegram_id, nombre):
+        """Guarda un registro de usuario que no llegó al backend; el trabajador lo envía antes que sus eventos."""
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO usuarios (telegram_id, nombre) VALUES (?, ?)", (telegram_id, nombre))
+        self._avisar()
+
+    def usuarios_pendientes(self):
+        with self._lock:
+            return self._conexion.execute("SELECT telegram_id, nombre FROM usuarios").fetchall()
+
+    def confirmar_usuario(self, telegram_id):
+        """Quita el registro y libera de inmediato los eventos del usuario que esperaban su backoff."""
+        with self._lock:
+            self._conexion.execute("DELETE FROM usuarios WHERE telegram_id = ?", (telegram_id,))
+            self._conexion.execute(
+                "UPDATE eventos SET proximo_intento = 0 WHERE telegram_id = ? AND estado = 'pendiente'", (telegram_id,))
+
+    def pendientes(self, limite=TAMANO_LOTE):
+        """
+        Los eventos pendientes más antiguos que ya toca enviar, en el formato de
+        /api/registrar_actividades. Los que esperan su backoff no tapan la cola.
+        """
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT log_id, telegram_id, tipo_actividad, xp_a_sumar, fecha_registro, valor "
+                "FROM eventos WHERE estado = 'pendiente' AND proximo_intento <= ? ORDER BY orden LIMIT ?",
+                (time.time(), limite),
+            ).fetchall()
+        return [
+            {"log_id": log_id, "telegram_id": telegram_id, "tipo_actividad": tipo,
+             "xp_a_sumar": xp, "fecha_registro": fecha, "valor": valor}
+            for log_id, telegram_id, tipo, xp, fecha, valor in filas
+        ]
+
+    def confirmar(self, log_ids):
+        """Elimina los eventos que el backend ya registró."""
+        with self._lock:
+            self._conexion.executemany("DELETE FROM eventos WHERE log_id = ?", [(log_id,) for log_id in log_ids])
+
+    def rechazar(self, errores):
+        """
+        Aparta los eventos que el backend rechazó ({log_id: motivo}): reintentarlos
+        no cambia el resultado y bloquearían la cola. Quedan en la tabla para revisarlos.
+        """
+        with self._lock:
+            self._conexion.executemany(
+                "UPDATE eventos SET estado = 'rechazado', error = ? WHERE log_id = ?",
+                [(motivo, log_id) for log_id, motivo in errores.items()],
+            )
+
+    def posponer(self, errores):
+        """
+        Deja pendientes los eventos de usuarios que el backend aún no conoce ({log_id: motivo}),
+        con backoff exponencial. Pasados MAX_INTENTOS_SIN_USUARIO se apartan como rechazados.
+        Devuelve cuántos se apartaron.
+        """
+        ahora = time.time()
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT log_id, intentos FROM eventos WHERE log_id IN ({','.join('?' * len(errores))})",
+                list(errores),
+            ).fetchall()
+            posponer, apartar = [], []
+            for log_id, intentos in filas:
+                if intentos + 1 >= MAX_INTENTOS_SIN_USUARIO:
+                    apartar.append((errores[log_id], log_id))
+                else:
+                    espera = min(ESPERA_MAXIMA_SIN_USUARIO_SEGUNDOS, ESPERA_SIN_USUARIO_SEGUNDOS * (2 ** intentos))
+                    posponer.append((ahora + espera, errores[log_id], log_id))
+            self._conexion.executemany(
+                "UPDATE eventos SET intentos = intentos + 1, proximo_intento = ?, error = ? WHERE log_id = ?", posponer)
+            self._conexion.executemany(
+                "UPDATE eventos SET estado = 'rechazado', error = ? WHERE log_id = ?", apartar)
+        return len(apartar)
+
+    def estadisticas(self):
+        with self._lock:
+            conteos = dict(self._conexion.execute("SELECT estado, COUNT(*) FROM eventos GROUP BY estado").fetchall())
+            usuarios = self._conexion.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0]
+        return {"pendientes": conteos.get('pendiente', 0), "rechazados": conteos.get('rechazado', 0),
+                "usuarios_pendientes": usuarios}
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    # --- TRABAJADOR ---
+
+    async def enviar_usuarios(self, cliente):
+        """
+        Envía los registros de usuario pendientes. Un 409 (ya existía) también cuenta
+        como hecho. Lanza httpx.HTTPError si el backend no respondió.
+        """
+        for telegram_id, nombre in await asyncio.to_thread(self.usuarios_pendientes):
+            try:
+                await cliente.registrar_usuario(telegram_id, nombre)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code >= 500 or e.response.status_code == 429:
+                    raise
+                if e.response.status_code != 409:
+                    # 400: datos inválidos, reintentarlo no cambia nada
+                    logger.warning(f"Registro del usuario {telegram_id} rechazado por el backend: {e.response.text}")
+            await asyncio.to_thread(self.confirmar_usuario, telegram_id)
+
+    async def enviar_lote(self, cliente):
+        """
+        Envía un lote de pendientes. Devuelve cuántos eventos se procesaron (confirmados,
+        apartados o pospuestos). Lanza httpx.HTTPError si el backend no respondió (los
+        eventos siguen pendientes).
+        """
+        # 1. Primero los usuarios: sus eventos dependen de que el backend los conozca
+        await self.enviar_usuarios(cliente)
+
+        # Las lecturas y commits de SQLite corren en un hilo, como encolar: el event loop sigue atendiendo al bot
+        eventos = await asyncio.to_thread(self.pendientes)
+        if not eventos:
+            return 0
+
+        respuesta = await cliente.registrar_actividades(eventos)
+
+        # Los resultados vienen en el mismo orden que el lote
+        # 2. Usuario desconocido: se reintenta más tarde. Cualquier otro error (validación) es definitivo
+        confirmados = []
+        rechazados = {}
+        sin_usuario = {}
+        for evento, resultado in zip(eventos, respuesta.get('resultados', [])):
+            if resultado.get('status') == 'success':
+                confirmados.append(evento['log_id'])
+                continue
+            error = resultado.get('error', 'Rechazado por el backend.')
+            if resultado.get('codigo') == CODIGO_USUARIO_NO_ENCONTRADO:
+                sin_usuario[evento['log_id']] = error
+            else:
+                rechazados[evento['log_id']] = error
+
+        await asyncio.to_thread(self.confirmar, confirmados)
+        if rechazados:
+            logger.warning(f"{len(rechazados)} eventos rechazados por el backend; quedan apartados en {self.ruta}")
+            await asyncio.to_thread(self.rechazar, rechazados)
+        if sin_usuario:
+            apartados = await asyncio.to_thread(self.posponer, sin_usuario)
+            logger.warning(f"{len(sin_usuario)} eventos de usuarios no registrados; se reintentan más tarde "
+                           f"({apartados} apartados tras {MAX_INTENTOS_SIN_USUARIO} intentos)")
+        return len(confirmados) + len(rechazados) + len(sin_usuario)
+
+    async def trabajar(self, cliente, intervalo=INTERVALO_DRENADO_SEGUNDOS):
+        """
+        Bucle del trabajador: vacía la cola por lotes cada vez que llega un evento
+        (o cada `intervalo` segundos). Si el backend no responde espera con backoff
+        exponencial; los eventos no se pierden porque siguen en disco.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._aviso = asyncio.Event()
+        fallos = 0
+        while True:
+            # Se limpia antes de vaciar: un evento que llegue durante el envío vuelve a despertar el bucle
+            self._aviso.clear()
+            try:
+                while await self.enviar_lote(cliente):
+                    pass
+                fallos = 0
+            except httpx.HTTPError as e:
+                fallos += 1
+                espera = min(ESPERA_MAXIMA_SEGUNDOS, intervalo * (2 ** (fallos - 1))) * (0.5 + random.random())
+                logger.warning(f"Backend no disponible ({e!r}); {self.estadisticas()['pendientes']} eventos en cola, "
+                               f"reintento en {espera:.1f}s")
+                await asyncio.sleep(espera)
+                continue
+
+            try:
+                await asyncio.wait_for(self._aviso.wait(), timeout=intervalo)
+            except asyncio.TimeoutError:
+                pass
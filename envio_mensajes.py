@@ -0,0 +1,143 @@
+# envio_mensajes.py
+
+import logging
+import re
+import time
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN ---
+MAX_LENGTH = 4000                 # Límite de Telegram es 4096: dejamos margen de seguridad
+INTERVALO_EDICION_SEGUNDOS = 1.2  # Telegram limita las ediciones por chat (~1 por segundo)
+
+
+# --- MARKDOWN ---
+
+def adaptar_markdown(texto):
+    """
+    Adapta el Markdown de Gemini al Markdown clásico de Telegram:
+    '**negrita**' pasa a '*negrita*' y las viñetas '* ' al inicio de línea a '• '.
+    """
+    texto = re.sub(r'^(\s*)[*-] ', r'\1• ', texto, flags=re.MULTILINE)
+    return texto.replace('**', '*')
+
+
+def markdown_valido(texto):
+    """
+    True si Telegram puede interpretar el texto con parse_mode="Markdown":
+    cada *, _, ` y ``` tiene su cierre, y cada [texto] tiene su ] (y su ) si lleva enlace).
+    """
+    i = 0
+    n = len(texto)
+    while i < n:
+        c = texto[i]
+        if c == '\\':
+            i += 2
+            continue
+        if texto.startswith('```', i):
+            cierre = texto.find('```', i + 3)
+            if cierre == -1:
+                return False
+            i = cierre + 3
+            continue
+        if c in '*_`':
+            cierre = texto.find(c, i + 1)
+            if cierre == -1:
+                return False
+            i = cierre + 1
+            continue
+        if c == '[':
+            cierre = texto.find(']', i + 1)
+            if cierre == -1:
+                return False
+            i = cierre + 1
+            if texto.startswith('(', i):
+                cierre = texto.find(')', i)
+                if cierre == -1:
+                    return False
+                i = cierre + 1
+            continue
+        i += 1
+    return True
+
+
+def punto_de_corte(texto, limite=MAX_LENGTH):
+    """Posición donde cortar un texto largo: fin de párrafo, luego fin de línea, luego espacio."""
+    for separador in ('\n\n', '\n', ' '):
+        corte = texto.rfind(separador, 0, limite)
+        if corte > 0:
+            return corte
+    # Palabra gigante: cortar a la fuerza
+    return limite
+
+
+# --- ENVÍO PROGRESIVO ---
+
+class MensajeProgresivo:
+    """
+    Publica una respuesta a medida que se genera.
+
+    El primer fragmento se envía apenas llega; los siguientes editan ese mismo
+    mensaje como máximo cada INTERVALO_EDICION_SEGUNDOS. Cuando el texto supera
+    MAX_LENGTH se cierra el mensaje en un límite de párrafo y se empieza otro.
+    El Markdown se valida antes de enviar: si no es válido (p. ej. una negrita
+    todavía abierta a mitad de la generación) se envía como texto plano.
+    """
+
+    def __init__(self, mensaje_origen, intervalo=INTERVALO_EDICION_SEGUNDOS):
+        self._origen = mensaje_origen
+        self._intervalo = intervalo
+        self._mensaje = None          # Mensaje de Telegram que se está editando
+        self._publicado = None        # Texto que tiene ese mensaje ahora
+        self._actual = ""             # Texto acumulado del mensaje en curso
+        self._ultima_edicion = 0.0
+        self.mensajes_enviados = 0
+
+    async def agregar(self, fragmento):
+        self._actual += fragmento
+
+        # 1. Si el mensaje en curso se pasó del límite, cerrarlo y seguir en uno nuevo
+        while len(self._actual) > MAX_LENGTH:
+            corte = punto_de_corte(self._actual)
+            parte, self._actual = self._actual[:corte], self._actual[corte:].lstrip()
+            await self._publicar(parte)
+            self._mensaje = None
+            self._publicado = None
+
+        # 2. Primer fragmento: enviarlo de inmediato. Después: editar con frecuencia limitada
+        if not self._actual.strip():
+            return
+        if self._mensaje is None or time.monotonic() - self._ultima_edicion >= self._intervalo:
+            await self._publicar(self._actual)
+
+    async def finalizar(self):
+        """Publica el texto final del mensaje en curso (con formato si es válido)."""
+        if self._actual.strip():
+            await self._publicar(self._actual)
+
+    async def _publicar(self, texto):
+        texto = adaptar_markdown(texto)
+        if texto == self._publicado:
+            return
+        parse_mode = "Markdown" if markdown_valido(texto) else None
+
+        try:
+            await self._enviar(texto, parse_mode)
+        except BadRequest as e:
+            # Salvaguarda para casos que la validación no cubre: reenviar como texto plano
+            if parse_mode is None:
+                raise
+            logger.warning(f"Telegram rechazó el Markdown ({e}); se envía como texto plano.")
+            await self._enviar(texto, None)
+
+        self._publicado = texto
+        self._ultima_edicion = time.monotonic()
+
+    async def _enviar(self, texto, parse_mode):
+        if self._mensaje is None:
+            self._mensaje = await self._origen.reply_text(texto, parse_mode=parse_mode)
+            self.mensajes_enviados += 1
+        else:
+            await self._mensaje.edit_text(texto, parse_mode=parse_mode)
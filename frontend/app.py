@@ -1,10 +1,28 @@
+import os
+import sys
+
 from flask import Flask, render_template, request, redirect, url_for
-import requests
+
+from cliente_backend import ClienteBackend, ErrorBackend
+from recursos import Recursos
+
+# metricas.py vive en la raíz del repo y lo comparten la API, esta app y el bot
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metricas import metricas_proceso, registrar_flask
 
 app = Flask(__name__)
 
+# Tiempo, tamaños y errores de cada página, publicados en /metrics
+registrar_flask(app, metricas_proceso)
+
 API_URL = "http://localhost:5000/api"  # Ajusta si tu API está en otro host
 
+# Una sola sesión keep-alive para toda la app, con cache corto de respuestas (ver cliente_backend.py)
+backend = ClienteBackend(API_URL)
+
+# CSS, íconos e imágenes construidos con construir_recursos.py (nombres con hash, cache inmutable)
+Recursos().registrar(app)
+
 
 @app.get("/")
 def login():
@@ -16,18 +34,21 @@ def do_login():
     user_input = request.form.get("user_id")
     if not user_input:
         return "Falta el ID", 400
-    
+
     return redirect(url_for("perfil", telegram_id=user_input))
 
 
 @app.get("/perfil/<telegram_id>")
 def perfil(telegram_id):
-    resp = requests.get(f"{API_URL}/usuario/{telegram_id}")
+    try:
+        # Perfil, posiciones y XP por día en una sola llamada a la API
+        datos = backend.obtener_dashboard(telegram_id)
+    except ErrorBackend:
+        return "No se pudo contactar la API. Intenta de nuevo en un momento.", 502
 
-    if resp.status_code != 200:
+    if datos is None:
         return f"Usuario {telegram_id} no encontrado", 404
 
-    datos = resp.json()
     return render_template("perfil.html", user=datos)
 
 
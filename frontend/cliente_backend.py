@@ -0,0 +1,165 @@
+# cliente_backend.py
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN POR DEFECTO ---
+TIMEOUT_CONEXION_SEGUNDOS = 2.0   # Tiempo máximo para abrir la conexión con la API
+TIMEOUT_LECTURA_SEGUNDOS = 5.0    # Tiempo máximo esperando la respuesta
+MAX_CONEXIONES = 32               # Conexiones keep-alive en el pool
+TTL_PERFIL_SEGUNDOS = 5.0         # Un perfil se usa sin preguntar a la API durante este tiempo
+CAPACIDAD_CACHE = 4096            # Respuestas guardadas como máximo (LRU)
+DIAS_DASHBOARD = 7                # Días de la serie de XP que pide la página de perfil
+
+
+class ErrorBackend(Exception):
+    """La API no respondió (o respondió con un error) y no hay copia guardada que mostrar."""
+
+
+class _Vuelo:
+    """Una petición en curso a la API; los demás hilos que piden lo mismo esperan su resultado."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class ClienteBackend:
+    """
+    Cliente del backend para el frontend web.
+
+    Usa una sola requests.Session con pool de conexiones keep-alive y timeouts.
+    Las respuestas (perfil o dashboard) se guardan TTL_PERFIL_SEGUNDOS; al vencer se
+    revalidan con If-None-Match (la API responde 304 sin cuerpo si no cambiaron).
+    Las peticiones simultáneas a la misma ruta se juntan en una sola llamada.
+    """
+
+    def __init__(self, base_url, ttl=TTL_PERFIL_SEGUNDOS, capacidad=CAPACIDAD_CACHE,
+                 timeout=(TIMEOUT_CONEXION_SEGUNDOS, TIMEOUT_LECTURA_SEGUNDOS), max_conexiones=MAX_CONEXIONES):
+        self.base_url = base_url.rstrip('/')
+        self.ttl = ttl
+        self.capacidad = capacidad
+        self.timeout = timeout
+        self._sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones)
+        self._sesion.mount('http://', adaptador)
+        self._sesion.mount('https://', adaptador)
+
+        self._lock = threading.Lock()
+        self._respuestas = OrderedDict()   # ruta -> (expira, etag, datos)
+        self._vuelos = {}                  # ruta -> _Vuelo
+        self.aciertos = 0
+        self.revalidados = 0
+        self.descargas = 0
+        self.coalescidas = 0
+        self.errores = 0
+
+    def obtener_perfil(self, telegram_id):
+        """
+        Datos del perfil (dict), o None si el usuario no existe.
+        Lanza ErrorBackend si la API no responde y no hay copia guardada.
+        """
+        return self._obtener(f"/usuario/{telegram_id}")
+
+    def obtener_dashboard(self, telegram_id, dias=DIAS_DASHBOARD):
+        """
+        Perfil más posición en cada ranking y XP por día (una sola llamada a la API),
+        o None si el usuario no existe. Lanza ErrorBackend como obtener_perfil.
+        """
+        return self._obtener(f"/usuario/{telegram_id}/dashboard?dias={dias}")
+
+    def _obtener(self, ruta):
+        with self._lock:
+            entrada = self._respuestas.get(ruta)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._respuestas.move_to_end(ruta)
+                self.aciertos += 1
+                return entrada[2]
+
+            # Si otro hilo ya está pidiendo esta ruta, se espera su respuesta
+            vuelo = self._vuelos.get(ruta)
+            propio = vuelo is None
+            if propio:
+                vuelo = self._vuelos[ruta] = _Vuelo()
+            else:
+                self.coalescidas += 1
+
+        if not propio:
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = self._pedir(ruta, entrada)
+        except ErrorBackend as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[ruta]
+            vuelo.listo.set()
+        return vuelo.resultado
+
+    def _pedir(self, ruta, entrada):
+        """Pide la ruta a la API (condicional si hay copia vencida) y actualiza el cache."""
+        headers = {'If-None-Match': entrada[1]} if entrada is not None and entrada[1] else {}
+        try:
+            resp = self._sesion.get(f"{self.base_url}{ruta}", headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            resp, error = None, e
+        else:
+            error = None if resp.status_code in (200, 304, 404) else f"status {resp.status_code}"
+
+        if error is not None:
+            with self._lock:
+                self.errores += 1
+            # Mejor un perfil de hace unos segundos que una página de error
+            if entrada is not None:
+                logger.warning(f"La API no respondió ({error}); se muestra la copia guardada de {ruta}.")
+                return entrada[2]
+            raise ErrorBackend(str(error))
+
+        if resp.status_code == 404:
+            with self._lock:
+                self._respuestas.pop(ruta, None)
+            return None
+
+        if resp.status_code == 304:
+            etag, datos = entrada[1], entrada[2]
+        else:
+            etag, datos = resp.headers.get('ETag'), resp.json()
+        with self._lock:
+            if resp.status_code == 304:
+                self.revalidados += 1
+            else:
+                self.descargas += 1
+            self._respuestas[ruta] = (time.monotonic() + self.ttl, etag, datos)
+            self._respuestas.move_to_end(ruta)
+            while len(self._respuestas) > self.capacidad:
+                self._respuestas.popitem(last=False)
+        return datos
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "respuestas": len(self._respuestas),
+                "capacidad": self.capacidad,
+                "ttl_segundos": self.ttl,
+                "aciertos": self.aciertos,
+                "revalidados": self.revalidados,
+                "descargas": self.descargas,
+                "coalescidas": self.coalescidas,
+                "errores": self.errores,
+            }
+
+    def cerrar(self):
+        self._sesion.close()
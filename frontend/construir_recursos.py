@@ -0,0 +1,280 @@
+# construir_recursos.py
+
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# --- CONFIGURACIÓN ---
+FRONTEND = os.path.dirname(os.path.abspath(__file__))
+CARPETA_PLANTILLAS = os.path.join(FRONTEND, 'templates')
+CARPETA_ESTATICOS = os.path.join(FRONTEND, 'static')
+CARPETA_DIST = os.path.join(CARPETA_ESTATICOS, 'dist')
+ENTRADA_CSS = os.path.join(FRONTEND, 'estilos.css')
+ARCHIVO_MANIFIESTO = 'manifiesto.json'
+LARGO_HASH = 10
+
+# Imágenes de static/ -> ancho máximo en px (el logo se muestra a 96 px: el doble para pantallas densas)
+IMAGENES = {'logo.png': 192}
+CALIDAD_WEBP = 85
+
+# Clase de estilo de Font Awesome -> archivo de la fuente y peso
+ESTILOS_ICONOS = {
+    'fa-solid': ('fa-solid-900', 900),
+    'fa-regular': ('fa-regular-400', 400),
+    'fa-brands': ('fa-brands-400', 400),
+}
+FAMILIA_ICONOS = 'Iconos UConnect'
+
+# Archivos de texto que se guardan también comprimidos (.gz y, con brotli, .br)
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.svg', '.json')
+
+# Construye los recursos estáticos de las páginas para servirlos sin CDN:
+#   app.css     Tailwind compilado solo con las clases que usan las plantillas (minificado)
+#   iconos.css  Font Awesome reducido a los íconos usados, con su fuente recortada a esos glifos
+#   logo.*      el logo redimensionado, en WebP y en PNG (para navegadores sin WebP)
+# Cada archivo queda en static/dist/ con el hash de su contenido en el nombre
+# (app.3f9c2e1a7b.css) y manifiesto.json traduce el nombre lógico al real; recursos.py
+# lo usa para armar las URLs y servir con cache inmutable y la versión precomprimida.
+#
+# Herramientas (todas opcionales; lo que falte se informa y la página usa el CDN o el original):
+#   Tailwind CSS 4 (CLI)   pip install tailwindcss-bin   o   npm install -D @tailwindcss/cli
+#   Font Awesome Free      pip install fontawesomefree   o   --fontawesome <carpeta del paquete npm>
+#   fontTools              pip install fonttools          (recorte de la fuente de íconos)
+#   Pillow                 pip install pillow             (WebP y redimensionado)
+#   brotli                 pip install brotli             (archivos .br y fuentes woff2)
+#
+# Uso (desde cualquier carpeta):
+#   python frontend/construir_recursos.py
+
+
+def _disponible(modulo):
+    return importlib.util.find_spec(modulo) is not None
+
+
+def _clases_en_plantillas():
+    """Conjuntos de clases de cada atributo class="..." de las plantillas."""
+    grupos = []
+    for nombre in sorted(os.listdir(CARPETA_PLANTILLAS)):
+        if nombre.endswith('.html'):
+            with open(os.path.join(CARPETA_PLANTILLAS, nombre), encoding='utf-8') as f:
+                grupos += [set(clases.split()) for clases in re.findall(r'class="([^"]*)"', f.read())]
+    return grupos
+
+
+# --- PUBLICACIÓN CON HASH ---
+
+class Publicador:
+    """Copia archivos a la carpeta de salida con el hash en el nombre y arma el manifiesto."""
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.manifiesto = {}
+        self.tamanos = {}
+
+    def publicar(self, nombre_logico, contenido):
+        base, extension = os.path.splitext(nombre_logico)
+        huella = hashlib.sha256(contenido).hexdigest()[:LARGO_HASH]
+        nombre = f"{base}.{huella}{extension}"
+        with open(os.path.join(self.carpeta, nombre), 'wb') as f:
+            f.write(contenido)
+        self.manifiesto[nombre_logico] = nombre
+        self.tamanos[nombre_logico] = {'bytes': len(contenido), **self._precomprimir(nombre, contenido)}
+        return nombre
+
+    def _precomprimir(self, nombre, contenido):
+        """Versiones .gz y .br al lado del archivo (solo si ahorran algo)."""
+        if not nombre.endswith(EXTENSIONES_COMPRIMIBLES):
+            return {}
+        versiones = {'gz': gzip.compress(contenido, compresslevel=9, mtime=0)}
+        if _disponible('brotli'):
+            import brotli
+            versiones['br'] = brotli.compress(contenido, quality=11)
+        tamanos = {}
+        for extension, comprimido in versiones.items():
+            if len(comprimido) < len(contenido):
+                with open(os.path.join(self.carpeta, f"{nombre}.{extension}"), 'wb') as f:
+                    f.write(comprimido)
+                tamanos[extension] = len(comprimido)
+        return tamanos
+
+
+# --- CSS (Tailwind) ---
+
+def _buscar_tailwind(ruta=None):
+    candidatos = [ruta, os.environ.get('TAILWIND_CLI'),
+                  os.path.join(FRONTEND, 'node_modules', '.bin', 'tailwindcss'), shutil.which('tailwindcss')]
+    return next((c for c in candidatos if c and os.path.exists(c)), None)
+
+
+def construir_css(publicador, tailwind=None):
+    cli = _buscar_tailwind(tailwind)
+    if cli is None:
+        print("app.css: no se encontró el CLI de Tailwind 4 (pip install tailwindcss-bin); las páginas usan el CDN.")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        salida = os.path.join(tmp, 'app.css')
+        proceso = subprocess.run([cli, '--input', ENTRADA_CSS, '--output', salida, '--minify'],
+                                 cwd=FRONTEND, capture_output=True, text=True)
+        if proceso.returncode != 0:
+            sys.exit(f"Tailwind falló:\n{proceso.stderr}")
+        with open(salida, 'rb') as f:
+            publicador.publicar('app.css', f.read())
+
+
+# --- ÍCONOS (Font Awesome) ---
+
+def _buscar_fontawesome(carpeta=None):
+    """Carpeta de Font Awesome Free con metadata/icons.json y webfonts/."""
+    candidatos = [carpeta, os.path.join(FRONTEND, 'node_modules', '@fortawesome', 'fontawesome-free')]
+    if _disponible('fontawesomefree'):
+        paquete = os.path.dirname(importlib.util.find_spec('fontawesomefree').origin)
+        candidatos.append(os.path.join(paquete, 'static', 'fontawesomefree'))
+    return next((c for c in candidatos if c and os.path.exists(os.path.join(c, 'metadata', 'icons.json'))), None)
+
+
+def _iconos_usados(codigos):
+    """{estilo: {nombre: código}} de los íconos que aparecen en las plantillas."""
+    usados = {}
+    for clases in _clases_en_plantillas():
+        for estilo in clases & ESTILOS_ICONOS.keys():
+            for clase in clases:
+                nombre = clase[3:]
+                if clase.startswith('fa-') and nombre in codigos:
+                    usados.setdefault(estilo, {})[nombre] = codigos[nombre]
+    return usados
+
+
+def _recortar_fuente(origen, codigos):
+    """Fuente con solo esos glifos. Devuelve (bytes, formato)."""
+    from fontTools import subset
+    opciones = subset.Options()
+    opciones.flavor = 'woff2' if _disponible('brotli') else 'woff'
+    opciones.layout_features = []
+    opciones.name_IDs = []
+    opciones.notdef_outline = True
+    fuente = subset.load_font(origen, opciones)
+    recortador = subset.Subsetter(opciones)
+    recortador.populate(unicodes=codigos)
+    recortador.subset(fuente)
+    with tempfile.TemporaryDirectory() as tmp:
+        salida = os.path.join(tmp, f"fuente.{opciones.flavor}")
+        subset.save_font(fuente, salida, opciones)
+        with open(salida, 'rb') as f:
+            return f.read(), opciones.flavor
+
+
+def construir_iconos(publicador, fontawesome=None):
+    carpeta = _buscar_fontawesome(fontawesome)
+    if carpeta is None:
+        print("iconos.css: no se encontró Font Awesome Free (pip install fontawesomefree); las páginas usan el CDN.")
+        return
+    with open(os.path.join(carpeta, 'metadata', 'icons.json'), encoding='utf-8') as f:
+        iconos = json.load(f)
+    codigos = {}
+    for nombre, datos in iconos.items():
+        for alias in [nombre, *datos.get('aliases', {}).get('names', [])]:
+            codigos[alias] = int(datos['unicode'], 16)
+
+    usados = _iconos_usados(codigos)
+    reglas = []
+    for estilo, nombres in sorted(usados.items()):
+        archivo, peso = ESTILOS_ICONOS[estilo]
+        if _disponible('fontTools'):
+            # Leer woff2 también necesita brotli: sin él se parte del .ttf
+            origen = os.path.join(carpeta, 'webfonts', f"{archivo}.{'woff2' if _disponible('brotli') else 'ttf'}")
+            contenido, formato = _recortar_fuente(origen, sorted(set(nombres.values())))
+        else:
+            print(f"iconos.css: sin fontTools se usa {archivo}.woff2 completo (pip install fonttools).")
+            with open(os.path.join(carpeta, 'webfonts', f"{archivo}.woff2"), 'rb') as f:
+                contenido, formato = f.read(), 'woff2'
+        fuente = publicador.publicar(f"{archivo}.{formato}", contenido)
+        reglas.append(f'@font-face{{font-family:"{FAMILIA_ICONOS}";font-style:normal;font-weight:{peso};'
+                      f'font-display:block;src:url({fuente}) format("{formato}")}}')
+        reglas.append(f'.{estilo}{{font-family:"{FAMILIA_ICONOS}";font-weight:{peso};font-style:normal;'
+                      'font-variant:normal;line-height:1;text-rendering:auto;display:inline-block;'
+                      '-webkit-font-smoothing:antialiased;-moz-osx-font-smoothing:grayscale}')
+        reglas += [f'.fa-{nombre}:before{{content:"\\{codigo:x}"}}' for nombre, codigo in sorted(nombres.items())]
+    if reglas:
+        publicador.publicar('iconos.css', '\n'.join(reglas).encode())
+
+
+# --- IMÁGENES ---
+
+def construir_imagenes(publicador):
+    for nombre, ancho_maximo in IMAGENES.items():
+        origen = os.path.join(CARPETA_ESTATICOS, nombre)
+        base = os.path.splitext(nombre)[0]
+        if not _disponible('PIL'):
+            print(f"{nombre}: sin Pillow se publica el original, sin WebP (pip install pillow).")
+            with open(origen, 'rb') as f:
+                publicador.publicar(nombre, f.read())
+            continue
+
+        from io import BytesIO
+        from PIL import Image
+        with Image.open(origen) as imagen:
+            imagen.load()
+            if imagen.width > ancho_maximo:
+                alto = round(imagen.height * ancho_maximo / imagen.width)
+                imagen = imagen.resize((ancho_maximo, alto), Image.LANCZOS)
+            for formato, opciones in (('webp', {'quality': CALIDAD_WEBP, 'method': 6}), ('png', {'optimize': True})):
+                salida = BytesIO()
+                imagen.save(salida, formato.upper(), **opciones)
+                publicador.publicar(f"{base}.{formato}", salida.getvalue())
+
+
+# --- CONSTRUCCIÓN COMPLETA ---
+
+def _leer_manifiesto(carpeta):
+    try:
+        with open(os.path.join(carpeta, ARCHIVO_MANIFIESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def construir(carpeta=CARPETA_DIST, tailwind=None, fontawesome=None):
+    """
+    Construye todo en carpeta y publica el manifiesto nuevo al final (reemplazo atómico).
+    Los archivos con hash nunca se sobrescriben: se conservan los de la versión anterior
+    (páginas ya enviadas que todavía los piden) y se borra lo más viejo. Devuelve el manifiesto.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    anterior = _leer_manifiesto(carpeta)
+    publicador = Publicador(carpeta)
+    construir_css(publicador, tailwind)
+    construir_iconos(publicador, fontawesome)
+    construir_imagenes(publicador)
+
+    temporal = os.path.join(carpeta, f".{ARCHIVO_MANIFIESTO}.tmp")
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(publicador.manifiesto, f, indent=2, sort_keys=True)
+    os.replace(temporal, os.path.join(carpeta, ARCHIVO_MANIFIESTO))
+
+    vigentes = set(publicador.manifiesto.values()) | set(anterior.values())
+    for nombre in os.listdir(carpeta):
+        if nombre != ARCHIVO_MANIFIESTO and re.sub(r'\.(gz|br)$', '', nombre) not in vigentes:
+            os.remove(os.path.join(carpeta, nombre))
+
+    for nombre, tamanos in sorted(publicador.tamanos.items()):
+        detalle = ', '.join(f"{extension} {bytes_ / 1024:.1f} KB" for extension, bytes_ in tamanos.items() if extension != 'bytes')
+        print(f"  {publicador.manifiesto[nombre]:<36}{tamanos['bytes'] / 1024:>8.1f} KB" + (f"  ({detalle})" if detalle else ""))
+    return publicador.manifiesto
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Construye los recursos estáticos del frontend (CSS, íconos, imágenes).")
+    parser.add_argument('--tailwind', help="Ruta al CLI de Tailwind CSS 4 (por defecto se busca en el PATH).")
+    parser.add_argument('--fontawesome', help="Carpeta de Font Awesome Free (con metadata/ y webfonts/).")
+    args = parser.parse_args()
+
+    manifiesto = construir(tailwind=args.tailwind, fontawesome=args.fontawesome)
+    print(f"{len(manifiesto)} recursos en {CARPETA_DIST}")
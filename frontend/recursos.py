@@ -0,0 +1,78 @@
+# recursos.py
+
+import json
+import mimetypes
+import os
+import threading
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+from construir_recursos import ARCHIVO_MANIFIESTO, CARPETA_DIST
+
+# --- CONFIGURACIÓN ---
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'   # Un año: el nombre cambia si cambia el contenido
+# Codificaciones precomprimidas, en orden de preferencia: (Accept-Encoding, extensión)
+CODIFICACIONES = (('br', '.br'), ('gzip', '.gz'))
+
+
+class Recursos:
+    """
+    Recursos construidos por construir_recursos.py (static/dist/ y su manifiesto).
+
+    En las plantillas, recurso('app.css') da la URL con hash, o None si no se construyó
+    (la página usa entonces el CDN o el archivo original). La ruta /static/dist/ sirve
+    la versión .br o .gz si el navegador la acepta, con cache inmutable.
+    """
+
+    def __init__(self, carpeta=CARPETA_DIST):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._manifiesto = {}
+        self._firma = None
+
+    def _actualizar(self):
+        """Relee el manifiesto si se volvió a construir (sin reiniciar el servidor)."""
+        ruta = os.path.join(self.carpeta, ARCHIVO_MANIFIESTO)
+        try:
+            st = os.stat(ruta)
+            firma = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            firma = None
+        if firma == self._firma:
+            return
+        with self._lock:
+            try:
+                with open(ruta, encoding='utf-8') as f:
+                    self._manifiesto = json.load(f)
+            except FileNotFoundError:
+                self._manifiesto = {}
+            self._firma = firma
+
+    def url(self, nombre):
+        self._actualizar()
+        archivo = self._manifiesto.get(nombre)
+        return url_for('recursos', archivo=archivo) if archivo else None
+
+    def servir(self, archivo):
+        ruta = safe_join(self.carpeta, archivo)
+        if ruta is None or not os.path.isfile(ruta):
+            abort(404)
+        mimetype = mimetypes.guess_type(archivo)[0] or 'application/octet-stream'
+
+        codificacion = None
+        for nombre, extension in CODIFICACIONES:
+            if request.accept_encodings[nombre] and os.path.isfile(ruta + extension):
+                ruta, codificacion = ruta + extension, nombre
+                break
+
+        resp = send_file(ruta, mimetype=mimetype, conditional=True, etag=True)
+        if codificacion:
+            resp.headers['Content-Encoding'] = codificacion
+        resp.headers['Vary'] = 'Accept-Encoding'
+        resp.headers['Cache-Control'] = CACHE_INMUTABLE
+        return resp
+
+    def registrar(self, app):
+        app.add_url_rule('/static/dist/<path:archivo>', 'recursos', self.servir)
+        app.add_template_global(self.url, 'recurso')
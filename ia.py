@@ -0,0 +1,169 @@
+# ia.py
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from metricas import metricas_proceso
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN POR DEFECTO ---
+MODELO_GEMINI = "gemini-2.5-flash"
+MAX_CONCURRENCIA_IA = 8   # Llamadas simultáneas al modelo
+MAX_EN_COLA_IA = 100      # Consultas esperando turno antes de responder "ocupado"
+
+
+class IAOcupada(Exception):
+    """La cola de consultas a la IA está llena."""
+
+
+# --- PROVEEDORES ---
+
+class ProveedorGemini:
+    """Cliente de Gemini creado una sola vez; las llamadas usan la API asíncrona (client.aio)."""
+
+    def __init__(self, api_key, modelo=MODELO_GEMINI):
+        from google import genai
+        self.modelo = modelo
+        self._cliente = genai.Client(api_key=api_key)
+
+    async def generar(self, texto):
+        response = await self._cliente.aio.models.generate_content(
+            model=self.modelo,
+            contents=texto,
+        )
+        return response.text
+
+    async def generar_stream(self, texto):
+        """Entrega el texto por fragmentos a medida que el modelo lo genera."""
+        stream = await self._cliente.aio.models.generate_content_stream(
+            model=self.modelo,
+            contents=texto,
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+class ProveedorStub:
+    """
+    Proveedor local sin red, para pruebas de carga offline.
+    Simula la latencia del modelo con asyncio.sleep (no bloquea el event loop).
+    """
+
+    def __init__(self, latencia=1.0):
+        self.latencia = latencia
+
+    async def generar(self, texto):
+        await asyncio.sleep(self.latencia)
+        return f"Respuesta simulada de la IA para: {texto}"
+
+    async def generar_stream(self, texto):
+        # La latencia total se reparte entre las palabras de la respuesta
+        palabras = f"Respuesta simulada de la IA para: {texto}".split(' ')
+        for palabra in palabras:
+            await asyncio.sleep(self.latencia / len(palabras))
+            yield palabra + ' '
+
+
+# --- SERVICIO COMPARTIDO ---
+
+class ServicioIA:
+    """
+    Punto único de acceso a la IA para todos los handlers.
+    Un semáforo limita cuántas consultas van al modelo a la vez; las demás esperan
+    en cola sin bloquear el resto del bot (/estudio, /ranking, etc.).
+    """
+
+    def __init__(self, proveedor, max_concurrencia=MAX_CONCURRENCIA_IA, max_en_cola=MAX_EN_COLA_IA):
+        self.proveedor = proveedor
+        self.max_en_cola = max_en_cola
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        # Métricas
+        self.en_cola = 0
+        self.en_curso = 0
+        self.max_en_cola_observado = 0
+        self.atendidas = 0
+        self.rechazadas = 0
+        self.errores = 0
+        self.segundos_totales = 0.0
+
+    @asynccontextmanager
+    async def _turno(self):
+        """Espera turno en el semáforo y registra las métricas de la consulta."""
+        if self.en_cola >= self.max_en_cola:
+            self.rechazadas += 1
+            raise IAOcupada()
+
+        self.en_cola += 1
+        self.max_en_cola_observado = max(self.max_en_cola_observado, self.en_cola)
+        esperando = True
+        try:
+            async with self._semaforo:
+                self.en_cola -= 1
+                esperando = False
+                self.en_curso += 1
+                inicio = time.perf_counter()
+                resultado = 'ok'
+                try:
+                    yield
+                except Exception:
+                    self.errores += 1
+                    resultado = 'error'
+                    raise
+                finally:
+                    segundos = time.perf_counter() - inicio
+                    self.en_curso -= 1
+                    self.atendidas += 1
+                    self.segundos_totales += segundos
+                    metricas_proceso.observar('uconnect_ia_segundos', segundos,
+                                              proveedor=type(self.proveedor).__name__, resultado=resultado)
+        finally:
+            # Cancelada mientras esperaba turno
+            if esperando:
+                self.en_cola -= 1
+
+    async def responder(self, texto):
+        """Devuelve el texto generado completo. Lanza IAOcupada si la cola está llena."""
+        async with self._turno():
+            return await self.proveedor.generar(texto)
+
+    async def responder_stream(self, texto):
+        """Entrega la respuesta por fragmentos. Lanza IAOcupada si la cola está llena."""
+        async with self._turno():
+            async for fragmento in self.proveedor.generar_stream(texto):
+                yield fragmento
+
+    def estadisticas(self):
+        return {
+            "en_cola": self.en_cola,
+            "en_curso": self.en_curso,
+            "max_en_cola_observado": self.max_en_cola_observado,
+            "atendidas": self.atendidas,
+            "rechazadas": self.rechazadas,
+            "errores": self.errores,
+            "segundos_promedio": round(self.segundos_totales / self.atendidas, 3) if self.atendidas else 0.0,
+        }
+
+
+def crear_servicio_ia(api_key):
+    """
+    Crea el servicio según UCONNECT_IA_PROVEEDOR: 'gemini' (por defecto) o 'stub'.
+    Con 'stub', UCONNECT_IA_STUB_LATENCIA fija la latencia simulada en segundos.
+    Devuelve None si Gemini no se puede usar (falta la clave o la librería).
+    """
+    tipo = os.environ.get('UCONNECT_IA_PROVEEDOR', 'gemini').lower()
+    if tipo == 'stub':
+        return ServicioIA(ProveedorStub(float(os.environ.get('UCONNECT_IA_STUB_LATENCIA', '1.0'))))
+
+    if not api_key:
+        logger.error("La clave de Gemini no está configurada en parametros.py")
+        return None
+    try:
+        return ServicioIA(ProveedorGemini(api_key))
+    except ImportError:
+        logger.critical("El paquete 'google-genai' no está instalado.")
+        return None
@@ -0,0 +1,318 @@
+# metricas.py
+
+import atexit
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# --- CONFIGURACIÓN ---
+# Límites superiores de los baldes de cada histograma (el último balde, +Inf, es implícito)
+BALDES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BALDES_BYTES = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+INTERVALO_VOLCADO = 5.0   # Segundos entre volcados a disco cuando varios procesos comparten carpeta
+
+# Texto de '# HELP' de las métricas conocidas
+DESCRIPCIONES = {
+    'uconnect_http_peticion_segundos': "Duración de cada petición HTTP, por método, ruta y código.",
+    'uconnect_http_peticion_bytes': "Tamaño del cuerpo recibido, por método y ruta.",
+    'uconnect_http_respuesta_bytes': "Tamaño del cuerpo enviado, por método y ruta.",
+    'uconnect_http_errores_total': "Respuestas 5xx, por método y ruta.",
+    'uconnect_csv_segundos': "Lecturas y escrituras de los CSV del almacén, por operación.",
+    'uconnect_csv_errores_total': "Lecturas y escrituras de los CSV que terminaron en excepción.",
+    'uconnect_ia_segundos': "Llamadas al modelo de IA, por proveedor y resultado.",
+    'uconnect_bot_handler_segundos': "Duración de cada handler del bot.",
+    'uconnect_bot_handler_errores_total': "Excepciones que salieron de un handler del bot.",
+}
+
+
+class Histograma:
+    """Cuentas por balde, suma y máximo de una serie (mismo modelo que un histograma de Prometheus)."""
+
+    __slots__ = ('limites', 'cuentas', 'suma', 'total', 'maximo')
+
+    def __init__(self, limites):
+        self.limites = tuple(limites)
+        self.cuentas = [0] * (len(self.limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+        self.maximo = max(self.maximo, valor)
+
+    def sumar(self, otro):
+        self.cuentas = [a + b for a, b in zip(self.cuentas, otro.cuentas)]
+        self.suma += otro.suma
+        self.total += otro.total
+        self.maximo = max(self.maximo, otro.maximo)
+
+    def percentil(self, p):
+        """Interpolación lineal dentro del balde, como histogram_quantile de Prometheus (sin pasar del máximo)."""
+        if not self.total:
+            return 0.0
+        objetivo = p * self.total
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            if cuenta and acumulado + cuenta >= objetivo:
+                if i == len(self.limites):
+                    return self.maximo
+                inferior = self.limites[i - 1] if i else 0.0
+                estimado = inferior + (self.limites[i] - inferior) * (objetivo - acumulado) / cuenta
+                return min(estimado, self.maximo)
+            acumulado += cuenta
+        return self.maximo
+
+    def a_lista(self):
+        return [list(self.limites), list(self.cuentas), self.suma, self.total, self.maximo]
+
+    @classmethod
+    def de_lista(cls, datos):
+        limites, cuentas, suma, total, maximo = datos
+        histograma = cls(limites)
+        histograma.cuentas, histograma.suma, histograma.total, histograma.maximo = list(cuentas), suma, total, maximo
+        return histograma
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((clave, str(valor)) for clave, valor in etiquetas.items()))
+
+
+def _texto_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ''
+    escapar = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{clave}="{escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metricas:
+    """
+    Histogramas y contadores de un proceso, con etiquetas (método, ruta, handler...).
+
+    Observar es sumar en un balde bajo un lock: no se guardan las muestras. Con
+    varios procesos (servidor.py) cada uno vuelca su estado a carpeta/<pid>.json
+    cada INTERVALO_VOLCADO segundos, y /metrics suma los de todos.
+    """
+
+    def __init__(self, carpeta=None):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._histogramas = {}   # (nombre, etiquetas) -> Histograma
+        self._contadores = {}    # (nombre, etiquetas) -> int
+        self._proximo_volcado = 0.0
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+            atexit.register(self.volcar)
+
+    def observar(self, nombre, valor, baldes=BALDES_SEGUNDOS, **etiquetas):
+        clave = (nombre, _etiquetas(etiquetas))
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma(baldes)
+            histograma.observar(valor)
+        self._volcar_si_toca()
+
+    def contar(self, nombre, cantidad=1, **etiquetas):
+        clave = (nombre, _etiquetas(etiquetas))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + cantidad
+        self._volcar_si_toca()
+
+    @contextmanager
+    def cronometro(self, nombre, **etiquetas):
+        """Mide el bloque en segundos; si sale con una excepción se suma a <nombre sin _segundos>_errores_total."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.contar(nombre.removesuffix('_segundos') + '_errores_total', **etiquetas)
+            raise
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+    def medir(self, nombre, **etiquetas):
+        """Decorador que mide cada llamada con cronometro (funciones normales o async)."""
+        def decorador(funcion):
+            if inspect.iscoroutinefunction(funcion):
+                @functools.wraps(funcion)
+                async def envoltura_async(*args, **kwargs):
+                    with self.cronometro(nombre, **etiquetas):
+                        return await funcion(*args, **kwargs)
+                return envoltura_async
+
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self.cronometro(nombre, **etiquetas):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    # --- VOLCADO ENTRE PROCESOS ---
+
+    def _estado(self):
+        with self._lock:
+            return {
+                'histogramas': [[n, list(e), h.a_lista()] for (n, e), h in self._histogramas.items()],
+                'contadores': [[n, list(e), c] for (n, e), c in self._contadores.items()],
+            }
+
+    def volcar(self):
+        """Escribe el estado de este proceso en carpeta/<pid>.json (reemplazo atómico)."""
+        if not self.carpeta:
+            return
+        ruta = os.path.join(self.carpeta, f"{os.getpid()}.json")
+        with open(f"{ruta}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self._estado(), f)
+        os.replace(f"{ruta}.tmp", ruta)
+
+    def _volcar_si_toca(self):
+        if not self.carpeta or time.monotonic() < self._proximo_volcado:
+            return
+        with self._lock:
+            # Otro hilo pudo adelantarse: vuelca solo el primero
+            if time.monotonic() < self._proximo_volcado:
+                return
+            self._proximo_volcado = time.monotonic() + INTERVALO_VOLCADO
+        try:
+            self.volcar()
+        except OSError as e:
+            print(f"Advertencia: no se pudieron volcar las métricas en {self.carpeta}: {e}")
+
+    def _combinadas(self):
+        """(histogramas, contadores) de este proceso más los volcados por los demás."""
+        estados = [self._estado()]
+        if self.carpeta:
+            propio = os.path.join(self.carpeta, f"{os.getpid()}.json")
+            for ruta in glob.glob(os.path.join(self.carpeta, '*.json')):
+                if ruta == propio:
+                    continue
+                try:
+                    with open(ruta, encoding='utf-8') as f:
+                        estados.append(json.load(f))
+                except (OSError, ValueError):
+                    continue   # Un proceso terminando o un archivo a medio escribir: se omite esta vez
+
+        histogramas, contadores = {}, {}
+        for estado in estados:
+            for nombre, etiquetas, datos in estado['histogramas']:
+                clave = (nombre, tuple(map(tuple, etiquetas)))
+                histograma = Histograma.de_lista(datos)
+                if clave in histogramas:
+                    histogramas[clave].sumar(histograma)
+                else:
+                    histogramas[clave] = histograma
+            for nombre, etiquetas, valor in estado['contadores']:
+                clave = (nombre, tuple(map(tuple, etiquetas)))
+                contadores[clave] = contadores.get(clave, 0) + valor
+        return histogramas, contadores
+
+    # --- SALIDAS ---
+
+    def texto_prometheus(self):
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        histogramas, contadores = self._combinadas()
+        lineas = []
+        vistos = set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                if nombre in DESCRIPCIONES:
+                    lineas.append(f"# HELP {nombre} {DESCRIPCIONES[nombre]}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, etiquetas), h in sorted(histogramas.items()):
+            cabecera(nombre, 'histogram')
+            acumulado = 0
+            for limite, cuenta in zip(list(h.limites) + ['+Inf'], h.cuentas):
+                acumulado += cuenta
+                le = limite if limite == '+Inf' else _numero(float(limite))
+                lineas.append(f"{nombre}_bucket{_texto_etiquetas(etiquetas, [('le', le)])} {acumulado}")
+            lineas.append(f"{nombre}_sum{_texto_etiquetas(etiquetas)} {_numero(float(h.suma))}")
+            lineas.append(f"{nombre}_count{_texto_etiquetas(etiquetas)} {h.total}")
+        for (nombre, etiquetas), valor in sorted(contadores.items()):
+            cabecera(nombre, 'counter')
+            lineas.append(f"{nombre}{_texto_etiquetas(etiquetas)} {valor}")
+        return '\n'.join(lineas) + '\n'
+
+    def resumen(self):
+        """{nombre: {etiquetas: {n, p50_ms, p95_ms, p99_ms, media_ms, max_ms}}} y los contadores, para logs."""
+        histogramas, contadores = self._combinadas()
+        salida = {}
+        for (nombre, etiquetas), h in sorted(histogramas.items()):
+            # Los tamaños se informan tal cual; los tiempos, en milisegundos
+            escala, unidad = (1000.0, 'ms') if nombre.endswith('_segundos') else (1, '')
+            sufijo = f"_{unidad}" if unidad else ''
+            salida.setdefault(nombre, {})[_texto_etiquetas(etiquetas) or '{}'] = {
+                'n': h.total,
+                **{f"p{int(p * 100)}{sufijo}": round(h.percentil(p) * escala, 2) for p in (0.5, 0.95, 0.99)},
+                f"media{sufijo}": round(h.suma / h.total * escala, 2) if h.total else 0.0,
+                f"max{sufijo}": round(h.maximo * escala, 2),
+            }
+        for (nombre, etiquetas), valor in sorted(contadores.items()):
+            salida.setdefault(nombre, {})[_texto_etiquetas(etiquetas) or '{}'] = valor
+        return salida
+
+    def texto_resumen(self):
+        """resumen() como tabla legible, una línea por serie."""
+        lineas = []
+        for nombre, series in self.resumen().items():
+            for etiquetas, valores in series.items():
+                detalle = ' '.join(f"{k}={v}" for k, v in valores.items()) if isinstance(valores, dict) else str(valores)
+                lineas.append(f"{nombre}{etiquetas if etiquetas != '{}' else ''} {detalle}")
+        return '\n'.join(lineas)
+
+
+def registrar_flask(app, metricas, ruta='/metrics'):
+    """
+    Mide cada petición de la app (tiempo, tamaños y errores 5xx por método y ruta) y
+    publica las métricas en 'ruta'. Conviene llamarla apenas se crea la app, para que
+    su before_request corra antes que los demás y el tiempo los incluya.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _iniciar_medicion():
+        g.inicio_metricas = time.perf_counter()
+
+    @app.after_request
+    def _registrar_medicion(resp):
+        inicio = g.pop('inicio_metricas', None)
+        if inicio is None:
+            return resp
+        # La regla ('/api/usuario/<int:telegram_id>') y no la URL: una serie por ruta, no por usuario
+        regla = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        metricas.observar('uconnect_http_peticion_segundos', time.perf_counter() - inicio,
+                          metodo=request.method, ruta=regla, codigo=resp.status_code)
+        if request.content_length:
+            metricas.observar('uconnect_http_peticion_bytes', request.content_length, BALDES_BYTES,
+                              metodo=request.method, ruta=regla)
+        if resp.content_length is not None:
+            metricas.observar('uconnect_http_respuesta_bytes', resp.content_length, BALDES_BYTES,
+                              metodo=request.method, ruta=regla)
+        if resp.status_code >= 500:
+            metricas.contar('uconnect_http_errores_total', metodo=request.method, ruta=regla)
+        return resp
+
+    def exponer():
+        return Response(metricas.texto_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule(ruta, 'metricas', exponer)
+
+
+# Métricas de este proceso. Con UCONNECT_METRICAS_DIR (lo fija servidor.py) se comparten entre workers
+metricas_proceso = Metricas(os.environ.get('UCONNECT_METRICAS_DIR'))
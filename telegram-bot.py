@@ -1,9 +1,20 @@
+import asyncio
+import datetime
 import logging
 import os 
+import sqlite3
+from zoneinfo import ZoneInfo
 from parametros import API_URL, TOKEN_TELEGRAM
 from backend.API_KEY import GEMINI_KEY
-import requests # Necesario para las llamadas a la API de tu backend
+import httpx # Cliente HTTP asíncrono para las llamadas a la API de tu backend
+from cliente_api import ClienteAPI
+from ia import IAOcupada, crear_servicio_ia
+from envio_mensajes import MensajeProgresivo
+from cache_ia import CacheRespuestasIA
+from cola_eventos import ColaEventos
+from metricas import metricas_proceso
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import (
     Application, 
     CommandHandler,
@@ -17,6 +28,27 @@ from telegram.ext import (
 # URL de ejemplo. DEBES cambiarla por la URL real de tu backend
  
 
+PERIODOS_RANKING = ("semanal", "mensual", "semestral")
+
+# Las actividades se confirman al quedar en la cola local; el XP llega al perfil cuando el trabajador las envía
+AVISO_PENDIENTE = "\n⏳ _Se sumará a tu perfil en unos segundos._"
+
+# Respuestas de la IA en streaming (se muestran mientras se generan)
+IA_STREAMING = True
+
+# Alertas de bienestar: cada cuántos segundos se consultan al backend para enviarlas por privado
+INTERVALO_ALERTAS = 60
+# Snapshots de rankings y recálculo de ligas: una vez al día, al cierre del día en Chile
+HORA_SNAPSHOTS = datetime.time(23, 55, tzinfo=ZoneInfo("America/Santiago"))
+# Cada cuántos segundos se escribe en el log el resumen de métricas (tiempos de handlers, IA)
+INTERVALO_METRICAS = 15 * 60
+
+RECURSOS_BIENESTAR = (
+    "\n\nNo estás solo/a, la UC tiene apoyo para ti:\n"
+    "• [Salud Estudiantil](https://saludestudiantil.uc.cl/) - Pide hora médica.\n"
+    "• [Apoyo Psicológico](https://saludestudiantil.uc.cl/salud-mental/) - Consejería y salud mental."
+)
+
 # Configuración de Logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
@@ -25,40 +57,103 @@ logger = logging.getLogger(__name__)
 
 # --- 1. FUNCIONES DE CONEXIÓN AL BACKEND (API) ---
 
-def _registrar_usuario_api(user_id, nombre): #aAaAAaAaa 
-    """Intenta registrar al usuario en la BD del backend."""
+# Cliente HTTP asíncrono compartido (pool keep-alive, timeouts, reintentos) y
+# servicio de IA compartido (un solo cliente Gemini con límite de concurrencia).
+# Se crean al iniciar la aplicación y se cierran al apagarla.
+api_cliente = None
+servicio_ia = None
+# Cache de respuestas de la IA: las preguntas repetidas (o casi iguales) no llaman a Gemini
+cache_ia = None
+# Cola durable de actividades: el bot responde al encolar y un trabajador las envía por lotes
+cola_eventos = None
+trabajador_cola = None
+# Tarea que envía a cada estudiante las alertas de bienestar que emite el backend
+vigilante_alertas = None
+
+async def _iniciar_servicios(application: Application) -> None:
+    global api_cliente, servicio_ia, cache_ia, cola_eventos, trabajador_cola, vigilante_alertas
+    api_cliente = ClienteAPI(API_URL)
+    servicio_ia = crear_servicio_ia(GEMINI_KEY)
+    cache_ia = CacheRespuestasIA()
+    cola_eventos = ColaEventos()
+    trabajador_cola = asyncio.create_task(cola_eventos.trabajar(api_cliente))
+    vigilante_alertas = asyncio.create_task(_vigilar_alertas(application))
+
+async def _cerrar_servicios(application: Application) -> None:
+    # Lo que la cola no alcanzó a enviar queda en disco y sale en el próximo inicio
+    for tarea in (trabajador_cola, vigilante_alertas):
+        if tarea is not None:
+            tarea.cancel()
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+    if cola_eventos is not None:
+        logger.info(f"Cola de eventos al cerrar: {cola_eventos.estadisticas()}")
+        cola_eventos.cerrar()
+    if api_cliente is not None:
+        await api_cliente.cerrar()
+    if cache_ia is not None:
+        cache_ia.persistir()
+        logger.info(f"Cache IA: {cache_ia.estadisticas()}")
+    _registrar_metricas()
+
+def _registrar_metricas():
+    """Escribe en el log el resumen de métricas del bot: p50/p95/p99 por handler, errores y llamadas a la IA."""
+    resumen = metricas_proceso.texto_resumen()
+    if resumen:
+        logger.info(f"Métricas del bot:\n{resumen}")
+    if servicio_ia is not None:
+        logger.info(f"Servicio IA: {servicio_ia.estadisticas()}")
+
+async def _volcar_metricas(context: ContextTypes.DEFAULT_TYPE) -> None:
+    _registrar_metricas()
+
+def _medido(handler):
+    """Envuelve un handler para registrar su duración y las excepciones que deje escapar."""
+    return metricas_proceso.medir('uconnect_bot_handler_segundos', handler=handler.__name__)(handler)
+
+async def _registrar_usuario_api(user_id, nombre): #aAaAAaAaa 
+    """
+    Intenta registrar al usuario en la BD del backend. Si el backend no responde, el
+    registro queda en la cola de eventos y se envía antes que sus actividades.
+    """
+    try:
+        return await api_cliente.registrar_usuario(user_id, nombre)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code < 500 and e.response.status_code != 429:
+            # 409: ya estaba registrado; 400: datos inválidos
+            logger.error(f"Error del backend al registrar usuario: {e}")
+            return None
+        error = e
+    except httpx.HTTPError as e:
+        error = e
+    logger.error(f"Error conectando API al registrar usuario ({error}); queda en la cola local")
     try:
-        response = requests.post(f"{API_URL}/registrar_usuario", json={
-            "telegram_id": user_id,
-            "nombre": nombre
-        })
-        response.raise_for_status() # Lanza un error para códigos 4xx/5xx
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error conectando API al registrar usuario: {e}")
-        return None
-
-def _registrar_actividad_api(user_id, tipo, xp):
-    """Envía puntos a la API para una actividad."""
+        await asyncio.to_thread(cola_eventos.encolar_usuario, user_id, nombre)
+    except sqlite3.Error as e:
+        logger.error(f"Error guardando el registro en la cola local: {e}")
+    return None
+
+async def _registrar_actividad_api(user_id, tipo, xp, valor=None):
+    """
+    Encola la actividad (con su medida: minutos de estudio, horas de sueño);
+    el trabajador de la cola la envía al backend por lotes.
+    La respuesta al usuario no depende de la latencia ni de la disponibilidad del backend.
+    El commit (synchronous=FULL) espera al disco, así que corre en un hilo y no frena el event loop.
+    """
     try:
-        response = requests.post(f"{API_URL}/registrar_actividad", json={
-            "telegram_id": user_id,
-            "tipo_actividad": tipo,
-            "xp_a_sumar": xp
-        })
-        response.raise_for_status()
-        return {"success": True, "data": response.json()}
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error conectando API al registrar actividad: {e}")
+        log_id = await asyncio.to_thread(cola_eventos.encolar, user_id, tipo, xp, valor)
+        return {"success": True, "pendiente": True, "log_id": log_id}
+    except sqlite3.Error as e:
+        logger.error(f"Error guardando la actividad en la cola local: {e}")
         return {"success": False}
 
-def _obtener_perfil_api(user_id):
+async def _obtener_perfil_api(user_id):
     """Obtiene datos reales del usuario (XP, ligas, insignias)."""
     try:
-        response = requests.get(f"{API_URL}/usuario/{user_id}")
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return await api_cliente.obtener_perfil(user_id)
+    except httpx.HTTPError as e:
         logger.error(f"Error conectando API al obtener perfil: {e}")
         
         # Datos de simulación en caso de fallo (para que el bot no se caiga)
@@ -68,22 +163,64 @@ def _obtener_perfil_api(user_id):
             "insignias": ["Sin Datos"]
         }
 
-def _obtener_ranking_api():
-    """Obtiene el Top 10."""
+async def _obtener_ranking_api(periodo="semanal"):
+    """Obtiene el Top 10 del periodo (semanal, mensual o semestral)."""
     try:
-        response = requests.get(f"{API_URL}/ranking_semanal")
-        response.raise_for_status()
-        return response.json().get('ranking', [])
-    except requests.exceptions.RequestException as e:
+        return await api_cliente.obtener_ranking(periodo)
+    except httpx.HTTPError as e:
         logger.error(f"Error conectando API al obtener ranking: {e}")
         return []
 
+async def _vigilar_alertas(application: Application) -> None:
+    """
+    Consulta /api/alertas cada INTERVALO_ALERTAS segundos y envía cada alerta nueva
+    por privado al estudiante. La primera consulta solo toma el último id: las
+    alertas emitidas antes de iniciar el bot no se reenvían.
+    """
+    ultima = None
+    while True:
+        try:
+            respuesta = await api_cliente.obtener_alertas(ultima or 0)
+        except httpx.HTTPError as e:
+            logger.warning(f"No se pudieron consultar las alertas: {e}")
+        else:
+            ultimo = respuesta.get('ultimo', ultima)
+            if ultima is not None and ultimo is not None and ultimo < ultima:
+                # El registro de alertas del backend se reemplazó (ids desde cero): se retoma desde su último id
+                logger.warning(f"El backend reinició los ids de alertas ({ultima} -> {ultimo}).")
+            elif ultima is not None:
+                for alerta in respuesta.get('alertas', []):
+                    await _enviar_alerta(application, alerta)
+            ultima = ultimo
+        await asyncio.sleep(INTERVALO_ALERTAS)
+
+async def _enviar_alerta(application: Application, alerta) -> None:
+    try:
+        await application.bot.send_message(
+            chat_id=alerta['telegram_id'],
+            text=f"⚠️ **Alerta de Bienestar**\n\n{alerta['mensaje']}{RECURSOS_BIENESTAR}",
+            parse_mode="Markdown",
+            disable_web_page_preview=True,
+        )
+    except TelegramError as e:
+        # Por ejemplo, el estudiante bloqueó al bot
+        logger.warning(f"No se pudo enviar la alerta {alerta['codigo']} a {alerta['telegram_id']}: {e}")
+
+async def _snapshot_diario(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Trabajo del JobQueue: el backend guarda los rankings del día y actualiza las ligas."""
+    try:
+        resumen = await api_cliente.generar_snapshots()
+        logger.info(f"Snapshots del {resumen['fecha']} en {resumen['segundos']}s; "
+                    f"{resumen['cambios_liga']} usuarios cambiaron de liga")
+    except httpx.HTTPError as e:
+        logger.error(f"Error conectando API al generar snapshots: {e}")
+
 # --- 2. HANDLERS DE COMANDOS (CommandHandler) ---
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Maneja el comando /start. Da la bienvenida e inicializa el usuario."""
     user = update.effective_user
-    _registrar_usuario_api(user.id, user.first_name)
+    await _registrar_usuario_api(user.id, user.first_name)
     await update.message.reply_html(
         f"¡Hola {user.first_name}! 👋\n"
         "Bienvenido a **UConnect**.\n"
@@ -94,7 +231,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def miperfil_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Muestra el XP, liga e insignias del usuario."""
     user_id = update.effective_user.id 
-    datos = _obtener_perfil_api(user_id) # Usa la función real de API
+    datos = await _obtener_perfil_api(user_id) # Usa la función real de API
 
     if not datos:
         await update.message.reply_text("⚠️ No te encontré en la base de datos. Usa /start primero.")
@@ -105,26 +242,53 @@ async def miperfil_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         f"✨ **XP Total:** {datos.get('xp_total', 0)}\n"
         f"🏆 **Liga Actual:** {datos.get('liga_actual', 'No disponible')}\n"
         f"🏅 **Insignias Obtenidas:** {', '.join(datos.get('insignias', ['Ninguna']))}\n\n"
+        f"{_resumen_estadisticas(datos.get('estadisticas'))}"
         "¡Sigue sumando XP para subir en el ranking!"
     )
     await update.message.reply_text(perfil_msg, parse_mode="Markdown")
 
+def _resumen_estadisticas(estadisticas):
+    """Líneas de /miperfil con los agregados que calcula el backend (vacío si no hay actividad)."""
+    if not estadisticas:
+        return ""
+    por_tipo = estadisticas.get('por_tipo', {})
+    estudio = por_tipo.get('ESTUDIO', {})
+    sueno = por_tipo.get('SUENO', {})
+    asistencia = por_tipo.get('ASISTENCIA', {})
+
+    lineas = [
+        "📈 **ÚLTIMOS 7 DÍAS**",
+        f"• XP ganado: {estadisticas.get('xp_semana', 0)}",
+        f"• Estudio: {estudio.get('valor_semana', 0):g} min en {estudio.get('registros_semana', 0)} bloques",
+    ]
+    if sueno.get('promedio_valor_semana') is not None:
+        lineas.append(f"• Sueño promedio: {sueno['promedio_valor_semana']:g} h")
+    lineas.append(f"• Asistencias: {asistencia.get('registros_semana', 0)}")
+    lineas.append(f"🔥 **Racha:** {estadisticas.get('racha_dias', 0)} días (récord: {estadisticas.get('racha_maxima', 0)})")
+    return "\n".join(lineas) + "\n\n"
+
 async def ranking_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Muestra el top 10 semanal."""
-    ranking_data = _obtener_ranking_api()
+    """Muestra el top 10 del periodo: /ranking [semanal|mensual|semestral]."""
+    periodo = context.args[0].lower() if context.args else "semanal"
+    if periodo not in PERIODOS_RANKING:
+        await update.message.reply_text("Periodo inválido. Usa /ranking semanal, /ranking mensual o /ranking semestral.")
+        return
+
+    ranking_data = await _obtener_ranking_api(periodo)
     
     if not ranking_data:
-        ranking_msg = "📊 **RANKING SEMANAL**\n\nNo se pudo obtener el ranking. Intenta más tarde."
+        ranking_msg = f"📊 **RANKING {periodo.upper()}**\n\nNo se pudo obtener el ranking. Intenta más tarde."
     else:
-        # Formatear el ranking_data (asumimos que es una lista de objetos con 'nombre' y 'xp')
+        # Formatear el ranking_data (lista de objetos con 'nombre' y 'xp_<periodo>')
         ranking_list = [
-            f"{i+1}. {p['nombre']} - {p.get('xp_semanal', 0)} XP" + (" 👑" if i == 0 else "")
+            f"{i+1}. {p['nombre']} - {p.get(f'xp_{periodo}', 0)} XP" + (" 👑" if i == 0 else "")
             for i, p in enumerate(ranking_data[:10])
         ]
+        ranking_texto = "\n".join(ranking_list)
         
         ranking_msg = (
-            "📊 **RANKING SEMANAL DE LA UNIVERSIDAD**\n\n"
-            f"{'\n'.join(ranking_list)}\n\n"
+            f"📊 **RANKING {periodo.upper()} DE LA UNIVERSIDAD**\n\n"
+            f"{ranking_texto}\n\n"
             "¡Sigue sumando XP para subir!"
         )
     await update.message.reply_text(ranking_msg, parse_mode="Markdown")
@@ -136,12 +300,14 @@ async def _registrar_estudio_db(user_id, minutos, update, is_command=False):
     # Suponemos un XP fijo o calculado aquí antes de enviar
     xp_ganado = minutos * 2 
     
-    resultado = _registrar_actividad_api(user_id, "estudio", xp_ganado)
+    resultado = await _registrar_actividad_api(user_id, "estudio", xp_ganado, valor=minutos)
     
     if resultado["success"]:
         mensaje = f"🎉 ¡Bloque de {minutos} minutos registrado! **+{xp_ganado} XP** ganado."
+        if resultado.get("pendiente"):
+            mensaje += AVISO_PENDIENTE
     else:
-        mensaje = "❌ Error al registrar el estudio en el backend. ¿Está la API funcionando?"
+        mensaje = "❌ Error al registrar el estudio. Intenta de nuevo en un momento."
     
     if is_command:
         # Si viene del /estudio <minutos>
@@ -217,12 +383,13 @@ async def sueno_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 xp_ganado = 10
                 mensaje_extra = "Gracias por registrarlo. OJO! Recuerda que un descanso óptimo está entre 7 y 9 horas."
 
-            resultado = _registrar_actividad_api(update.effective_user.id, "sueno", xp_ganado)
+            resultado = await _registrar_actividad_api(update.effective_user.id, "sueno", xp_ganado, valor=horas)
             
             if resultado["success"]: 
-                await update.message.reply_text(f"✅ Has registrado {horas} horas de sueño. {mensaje_extra} **+{xp_ganado} XP**.", parse_mode="Markdown")
+                aviso = AVISO_PENDIENTE if resultado.get("pendiente") else ""
+                await update.message.reply_text(f"✅ Has registrado {horas} horas de sueño. {mensaje_extra} **+{xp_ganado} XP**.{aviso}", parse_mode="Markdown")
             else:
-                 await update.message.reply_text(f"❌ Error al registrar en el backend. {mensaje_extra}")
+                 await update.message.reply_text(f"❌ Error al registrar la actividad. {mensaje_extra}")
 
         else:
              await update.message.reply_text("Por favor, ingresa una cantidad de horas razonable (entre 2 y 30).")
@@ -267,69 +434,45 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # --- 4. HANDLER DE MENSAJES DE TEXTO LIBRE (IA - Gemini) ---
 
 async def ia_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Maneja cualquier texto que no sea un comando y lo trata como consulta IA (Con soporte para mensajes largos y corte inteligente)."""
+    """Maneja cualquier texto que no sea un comando y lo trata como consulta IA (respuesta en streaming, con corte en párrafos)."""
     texto_usuario = update.message.text
     
-    if not GEMINI_KEY:
-        logger.error("La clave de Gemini no está configurada en parametros.py")
-        await update.message.reply_text("❌ Error IA: Falta la API Key en configuración.")
+    if servicio_ia is None:
+        # crear_servicio_ia ya registró el motivo (falta la API Key o google-genai)
+        await update.message.reply_text("❌ Error IA: Falta la API Key o la librería google-genai en configuración.")
         return
         
     try:
-        from google import genai
-        client = genai.Client(api_key=GEMINI_KEY)
+        mensaje = MensajeProgresivo(update.message)
+
+        # 1. Pregunta ya respondida (exacta o muy parecida): se contesta sin llamar a Gemini
+        respuesta = cache_ia.buscar(texto_usuario)
+        if respuesta is not None:
+            await mensaje.agregar(respuesta)
+            await mensaje.finalizar()
+            return
 
         # UX: Muestra "escribiendo..." en el chat mientras la IA piensa
         await update.message.reply_chat_action("typing") 
 
-        # Generar respuesta
-        response = client.models.generate_content(
-            model="gemini-2.5-flash", # Mantenemos tu versión
-            contents=texto_usuario,
-        )
-        
-        texto_completo = response.text
+        # 2. Generar respuesta (asíncrono: el resto del bot sigue atendiendo mientras tanto).
+        # MensajeProgresivo envía el primer trozo apenas llega, edita el mensaje a medida
+        # que crece y abre uno nuevo en un fin de párrafo al pasar el límite de Telegram.
+        fragmentos = []
+        if IA_STREAMING:
+            async for fragmento in servicio_ia.responder_stream(texto_usuario):
+                fragmentos.append(fragmento)
+                await mensaje.agregar(fragmento)
+        else:
+            fragmentos.append(await servicio_ia.responder(texto_usuario))
+            await mensaje.agregar(fragmentos[-1])
+        await mensaje.finalizar()
 
-        # --- LÓGICA DE CORTE INTELIGENTE (> 4096 caracteres) ---
-        MAX_LENGTH = 4000 # Dejamos margen de seguridad
-        
-        while len(texto_completo) > 0:
-            if len(texto_completo) <= MAX_LENGTH:
-                # Caso 1: El texto cabe completo en un mensaje
-                chunk = texto_completo
-                texto_completo = ""
-            else:
-                # Caso 2: El texto es muy largo, hay que buscar dónde cortar
-                
-                # A. Prioridad 1: Buscar el último salto de línea (fin de párrafo)
-                corte = texto_completo.rfind('\n', 0, MAX_LENGTH)
-                
-                # B. Prioridad 2: Si no hay párrafos, buscar el último espacio (fin de palabra)
-                if corte == -1:
-                    corte = texto_completo.rfind(' ', 0, MAX_LENGTH)
-                
-                # C. Prioridad 3: Si es una palabra gigante, cortar a la fuerza
-                if corte == -1:
-                    corte = MAX_LENGTH
-                
-                # Definimos el trozo a enviar
-                chunk = texto_completo[:corte]
-                
-                # Preparamos el resto del texto para la siguiente vuelta (quitando espacios al inicio)
-                texto_completo = texto_completo[corte:].lstrip()
-
-            # Enviamos el trozo actual
-            try:
-                # Intentamos enviar con Markdown (negritas, etc.)
-                await update.message.reply_text(chunk, parse_mode="Markdown")
-            except Exception:
-                # Si falla el formato (ej: cortó una negrita a la mitad), enviamos texto plano
-                await update.message.reply_text(chunk)
-        # -------------------------------------------------------
-
-    except ImportError:
-        logger.critical("El paquete 'google-genai' no está instalado.")
-        await update.message.reply_text("❌ Error IA: Falta la librería google-genai.")
+        # 3. Guardar solo respuestas completas
+        cache_ia.guardar(texto_usuario, "".join(fragmentos))
+
+    except IAOcupada:
+        await update.message.reply_text("⏳ La IA está atendiendo muchas consultas. Intenta de nuevo en un momento.")
     except Exception as e:
         logger.error(f"Error en el handler de IA: {e}")
         await update.message.reply_text("😵‍💫 La IA tuvo un problema procesando tu solicitud.")
@@ -365,26 +508,40 @@ def main() -> None:
     logger.info("Iniciando Bot UConnect...")
     
     # 1. Crea la aplicación y pásale el token
-    application = Application.builder().token(TOKEN_TELEGRAM).build()
-
-    # 2. Asigna los Handlers (Manejadores de Comandos y Mensajes)
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("miperfil", miperfil_command))
-    application.add_handler(CommandHandler("ranking", ranking_command))
-    application.add_handler(CommandHandler("estudio", estudio_command))
-    application.add_handler(CommandHandler("asistencia", asistencia_command))
-    application.add_handler(CommandHandler("sueno", sueno_command))
-    application.add_handler(CommandHandler("misiones", misiones_command))
-    application.add_handler(CommandHandler("ayuda", ayuda_command))
+    # post_init/post_shutdown abren y cierran el cliente del backend y el servicio de IA
+    application = (
+        Application.builder()
+        .token(TOKEN_TELEGRAM)
+        .post_init(_iniciar_servicios)
+        .post_shutdown(_cerrar_servicios)
+        .build()
+    )
+
+    # 2. Asigna los Handlers (Manejadores de Comandos y Mensajes), cada uno medido con _medido
+    application.add_handler(CommandHandler("start", _medido(start_command)))
+    application.add_handler(CommandHandler("miperfil", _medido(miperfil_command)))
+    application.add_handler(CommandHandler("ranking", _medido(ranking_command)))
+    application.add_handler(CommandHandler("estudio", _medido(estudio_command)))
+    application.add_handler(CommandHandler("asistencia", _medido(asistencia_command)))
+    application.add_handler(CommandHandler("sueno", _medido(sueno_command)))
+    application.add_handler(CommandHandler("misiones", _medido(misiones_command)))
+    application.add_handler(CommandHandler("ayuda", _medido(ayuda_command)))
     
     # Handler para los botones interactivos
-    application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(CallbackQueryHandler(_medido(button_handler)))
 
     # Handler para el IA: Responde a cualquier texto que NO sea un comando
     # Asegúrate de que este sea el ÚLTIMO MessageHandler añadido
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, ia_handler))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, _medido(ia_handler)))
+
+    # 3. Trabajos programados (requiere python-telegram-bot[job-queue])
+    if application.job_queue is not None:
+        application.job_queue.run_daily(_snapshot_diario, time=HORA_SNAPSHOTS, name="snapshots")
+        application.job_queue.run_repeating(_volcar_metricas, interval=INTERVALO_METRICAS, name="metricas")
+    else:
+        logger.warning("JobQueue no disponible: los snapshots diarios se deben generar con backend/snapshots.py")
 
-    # 3. Inicia el bot 
+    # 4. Inicia el bot 
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':